@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs the in-process micro-benchmarks of the Python services.
+
+Each service keeps its suite in src/<service>/benchmarks/micro.py, a
+module whose cases() function returns {name: zero-argument callable}
+built on fixed fixtures. Every suite runs in its own process, with the
+service directory as working directory and on the import path, so that
+the services' flat module names (db, validation, ...) do not collide.
+
+Usage:
+  python microbench.py run [SERVICE ...] [--filter REGEX] [--output FILE]
+  python microbench.py compare RESULTS --baseline FILE [--max-regression 0.1]
+"""
+
+import argparse
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import timeit
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       os.pardir, os.pardir, 'src')
+SUITE_PATH = os.path.join('benchmarks', 'micro.py')
+RESULTS_FORMAT_VERSION = 1
+
+
+def find_services():
+    """Return the names of the services that have a micro-benchmark suite."""
+    return sorted(name for name in os.listdir(SRC_DIR)
+                  if os.path.isfile(os.path.join(SRC_DIR, name, SUITE_PATH)))
+
+
+def measure(function, repeat, min_time):
+    """Time function.
+
+    The number of calls per sample is grown until a sample lasts at
+    least min_time seconds, then repeat samples are taken.
+
+    Return: per call timings in microseconds
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    samples = [elapsed] + timer.repeat(repeat - 1, number) if repeat > 1 else [elapsed]
+    per_call = sorted(1e6 * sample / number for sample in samples)
+    return {'calls': number,
+            'min_us': round(per_call[0], 3),
+            'median_us': round(statistics.median(per_call), 3),
+            'stdev_us': round(statistics.stdev(per_call), 3) if len(per_call) > 1 else 0}
+
+
+def run_suite(service, pattern, repeat, min_time):
+    """Run the suite of service in this process.
+
+    Return: {case name: timings}
+    """
+    service_dir = os.path.join(SRC_DIR, service)
+    os.chdir(service_dir)
+    sys.path[:0] = [os.path.dirname(os.path.join(service_dir, SUITE_PATH)), service_dir]
+    spec = importlib.util.spec_from_file_location(
+        '{}_micro'.format(service), os.path.join(service_dir, SUITE_PATH))
+    suite = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(suite)
+    results = {}
+    for name, function in suite.cases().items():
+        if pattern and not re.search(pattern, '{}.{}'.format(service, name)):
+            continue
+        function()  # warm caches and fail before timing
+        results[name] = measure(function, repeat, min_time)
+        logging.info('%s.%s: %.3fus', service, name, results[name]['median_us'])
+    return results
+
+
+def git_revision():
+    """Return the checked out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SRC_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """Run the suites in child processes and collect their results."""
+    services = args.services or find_services()
+    unknown = set(services) - set(find_services())
+    if unknown:
+        raise ValueError('no micro-benchmark suite for {}'.format(', '.join(sorted(unknown))))
+    benchmarks = {}
+    for service in services:
+        command = [sys.executable, os.path.abspath(__file__), 'suite', service,
+                   '--repeat', str(args.repeat), '--min-time', str(args.min_time)]
+        if args.filter:
+            command += ['--filter', args.filter]
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True,
+                                env=dict(os.environ, PYTHONHASHSEED='0')).stdout
+        for name, timings in json.loads(output).items():
+            benchmarks['{}.{}'.format(service, name)] = timings
+    return {'format_version': RESULTS_FORMAT_VERSION,
+            'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+            'revision': git_revision(),
+            'python_version': platform.python_version(),
+            'machine': platform.machine(),
+            'benchmarks': benchmarks}
+
+
+def compare(results, baseline, max_regression):
+    """Compare median timings against a baseline.
+
+    Return: (report lines, regressions)
+    """
+    lines, regressions = [], []
+    for name, timings in sorted(results['benchmarks'].items()):
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            lines.append('{:<50}{:>12.3f}{:>12}'.format(name, timings['median_us'], 'new'))
+            continue
+        change = timings['median_us'] / base['median_us'] - 1 if base['median_us'] else 0
+        lines.append('{:<50}{:>12.3f}{:>+11.1%}'.format(name, timings['median_us'], change))
+        if change > max_regression:
+            regressions.append('{}: {:.3f}us -> {:.3f}us ({:+.1%})'.format(
+                name, base['median_us'], timings['median_us'], change))
+    return lines, regressions
+
+
+def print_results(results, stream=sys.stdout):
+    """Print a table of results."""
+    stream.write('{:<50}{:>12}{:>12}{:>12}\n'.format('benchmark', 'median us', 'min us', 'stdev'))
+    for name, timings in sorted(results['benchmarks'].items()):
+        stream.write('{:<50}{:>12.3f}{:>12.3f}{:>12.3f}\n'.format(
+            name, timings['median_us'], timings['min_us'], timings['stdev_us']))
+
+
+def parse_args(argv):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True,
+                                       metavar='{run,compare}')
+
+    run_parser = subparsers.add_parser('run', help='run suites')
+    run_parser.add_argument('services', nargs='*',
+                            help='services to benchmark (default: all)')
+    run_parser.add_argument('--output', help='write the JSON results to this file')
+    run_parser.add_argument('--baseline', help='JSON results to compare against')
+
+    # runs one suite in the child process started by run
+    suite_parser = subparsers.add_parser('suite')
+    suite_parser.add_argument('service')
+
+    for sub in (run_parser, suite_parser):
+        sub.add_argument('--filter', help='only run benchmarks whose '
+                                          'service.name matches this regex')
+        sub.add_argument('--repeat', type=int, default=7,
+                         help='samples per benchmark (default: %(default)s)')
+        sub.add_argument('--min-time', type=float, default=0.2,
+                         help='minimum seconds per sample (default: %(default)s)')
+
+    compare_parser = subparsers.add_parser('compare', help='compare saved results')
+    compare_parser.add_argument('results', help='JSON results to check')
+    compare_parser.add_argument('--baseline', required=True,
+                                help='JSON results to compare against')
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--max-regression', type=float, default=0.1,
+                         help='tolerated relative slowdown of the median '
+                              '(default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """Run or compare micro-benchmarks."""
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args(argv)
+    if args.command == 'suite':
+        # the service loggers write to stderr, stdout carries the results
+        json.dump(run_suite(args.service, args.filter, args.repeat, args.min_time),
+                  sys.stdout)
+        return 0
+    if args.command == 'run':
+        results = run(args)
+        if args.output:
+            with open(args.output, 'w') as stream:
+                json.dump(results, stream, indent=2)
+        print_results(results)
+    else:
+        with open(args.results) as stream:
+            results = json.load(stream)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as stream:
+        baseline = json.load(stream)
+    if baseline.get('format_version') != RESULTS_FORMAT_VERSION:
+        raise ValueError('unsupported baseline format version {}'.format(
+            baseline.get('format_version')))
+    lines, regressions = compare(results, baseline, args.max_regression)
+    sys.stdout.write('\n' + '\n'.join(lines) + '\n')
+    for regression in regressions:
+        logging.error('FAIL %s', regression)
+    if not regressions:
+        logging.info('PASS')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
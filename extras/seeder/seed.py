@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Seeds accounts-db and ledger-db with synthetic users, contacts and
+transaction histories at benchmark scale.
+
+Every row is derived from (seed, user index), so a given seed always
+produces the same data no matter how the work is partitioned. Partitions
+are generated in parallel worker processes, each streaming its rows into
+PostgreSQL with COPY.
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+
+import bcrypt
+
+# Seeded account ids live in [2000000000, 9999999999], clear of the demo users.
+ACCOUNT_BASE = 2 * 10**9
+ACCOUNT_SPACE = 8 * 10**9
+# Odd and not a multiple of 5, so coprime with ACCOUNT_SPACE: i -> id is a bijection.
+ACCOUNT_STRIDE = 2654435761
+
+EXTERNAL_ROUTING = '808889588'
+EXTERNAL_EMPLOYERS = ['9099791699', '9011225599', '9033447799', '9055669999']
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer',
+               'Michael', 'Linda', 'David', 'Elizabeth', 'William', 'Barbara',
+               'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+               'Carlos', 'Maria', 'Wei', 'Mei', 'Arjun', 'Priya', 'Ahmed',
+               'Fatima', 'Kenji', 'Yuki', 'Olga', 'Ivan']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia',
+              'Miller', 'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez',
+              'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson',
+              'Lee', 'Chen', 'Wang', 'Patel', 'Khan', 'Tanaka', 'Ivanova']
+STREETS = ['Main St', 'Oak Ave', 'Pine St', 'Maple Dr', 'Cedar Ln', 'Elm St',
+           'Valley Rd', 'Lake Blvd', 'Hill St', 'Park Ave']
+STATES = ['CA', 'NY', 'TX', 'WA', 'FL', 'IL', 'MA', 'CO', 'GA', 'OR']
+TIMEZONES = ['-8', '-7', '-6', '-5', '-4']
+BCRYPT_ALPHABET = './ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+
+USER_COLUMNS = ('accountid', 'username', 'passhash', 'firstname', 'lastname',
+                'birthday', 'timezone', 'address', 'state', 'zip', 'ssn')
+CONTACT_COLUMNS = ('username', 'label', 'account_num', 'routing_num',
+                   'is_external')
+TRANSACTION_COLUMNS = ('from_acct', 'to_acct', 'from_route', 'to_route',
+                       'amount', 'timestamp')
+
+
+def account_id(config, i):
+    """Return the account id of user i."""
+    return str(ACCOUNT_BASE + ((i + config['seed']) * ACCOUNT_STRIDE) % ACCOUNT_SPACE)
+
+
+def user(config, i):
+    """Generate user i as a row of USER_COLUMNS."""
+    rng = Random('{}:user:{}'.format(config['seed'], i))
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    birthday = datetime.date(1940, 1, 1) + datetime.timedelta(days=rng.randrange(365 * 65))
+    return (account_id(config, i),
+            username(config, i),
+            config['passhash'],
+            first,
+            last,
+            birthday.isoformat(),
+            rng.choice(TIMEZONES),
+            '{} {}'.format(rng.randint(1, 9999), rng.choice(STREETS)),
+            rng.choice(STATES),
+            '{:05d}'.format(rng.randrange(100000)),
+            '{:03d}-{:02d}-{:04d}'.format(rng.randint(100, 899), rng.randint(10, 99),
+                                          rng.randint(1000, 9999)))
+
+
+def username(config, i):
+    """Return the username of user i; unique, at most 15 characters."""
+    rng = Random('{}:user:{}'.format(config['seed'], i))
+    return '{}{}'.format(rng.choice(FIRST_NAMES).lower()[:6], i)
+
+
+def popular_user(config, rng):
+    """Pick a user index with Zipf-like popularity, so a few payees are
+    contacts of many users, as with landlords and utilities."""
+    rank = int(rng.paretovariate(config['payee_skew'])) - 1
+    return (rank * ACCOUNT_STRIDE + config['seed']) % config['users']
+
+
+def contacts(config, i):
+    """Generate the contacts of user i as rows of CONTACT_COLUMNS."""
+    rng = Random('{}:contacts:{}'.format(config['seed'], i))
+    owner = username(config, i)
+    # contact list sizes are heavy tailed around the configured mean
+    sigma = 0.8
+    count = min(config['max_contacts'], int(rng.lognormvariate(
+        math.log(config['contacts']) - sigma**2 / 2, sigma)))
+    rows = []
+    seen = {account_id(config, i)}
+    for j in range(count):
+        if rng.random() < config['external_ratio']:
+            account, routing, external = rng.choice(EXTERNAL_EMPLOYERS), EXTERNAL_ROUTING, True
+        else:
+            other = popular_user(config, rng) if rng.random() < 0.5 \
+                else rng.randrange(config['users'])
+            account, routing, external = account_id(config, other), config['routing'], False
+        if account in seen:
+            continue
+        seen.add(account)
+        label = '{} {}'.format(rng.choice(FIRST_NAMES), j)
+        rows.append((owner, label, account, routing, 't' if external else 'f'))
+    return rows
+
+
+def transactions(config, i):
+    """Generate the transaction history of user i as rows of TRANSACTION_COLUMNS.
+
+    Each user is paid every two weeks and makes payments to their contacts
+    at a per-user rate, never spending more than they have been paid.
+    """
+    rng = Random('{}:transactions:{}'.format(config['seed'], i))
+    account = account_id(config, i)
+    payees = [c[2] for c in contacts(config, i) if c[4] == 'f']
+    if not payees:
+        payees = [account_id(config, popular_user(config, rng))]
+    # activity is heavy tailed: most users are quiet, a few are very busy
+    per_period = min(200, rng.lognormvariate(math.log(config['payments']), 1.0))
+    salary = rng.choice([150000, 250000, 400000, 750000])
+    employer = rng.choice(EXTERNAL_EMPLOYERS)
+    end = config['end']
+    start = end - datetime.timedelta(days=365 * config['years'])
+    period = datetime.timedelta(days=14)
+    rows = []
+    balance = 0
+    when = start + datetime.timedelta(seconds=rng.randrange(14 * 86400))
+    while when < end:
+        rows.append((employer, account, EXTERNAL_ROUTING, config['routing'],
+                     salary, when.isoformat(sep=' ')))
+        balance += salary
+        payments = sorted(rng.random() for _ in range(
+            _poisson(rng, per_period)))
+        # the last period is cut short at the end date
+        span = min(period, end - when)
+        for offset in payments:
+            amount = min(balance, int(rng.lognormvariate(math.log(4000), 1.0)) + 100)
+            if amount <= 0:
+                break
+            balance -= amount
+            rows.append((account, rng.choice(payees), config['routing'],
+                         config['routing'], amount,
+                         (when + span * offset).isoformat(sep=' ')))
+        when += period
+    return rows
+
+
+def _poisson(rng, mean):
+    """Draw from a Poisson distribution (Knuth's method; mean is small)."""
+    limit, k, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        k += 1
+        product *= rng.random()
+    return k
+
+
+GENERATORS = {
+    'users': (USER_COLUMNS, lambda config, i: [user(config, i)]),
+    'contacts': (CONTACT_COLUMNS, contacts),
+    'transactions': (TRANSACTION_COLUMNS, transactions),
+}
+
+
+class RowStream(io.TextIOBase):
+    """A read-only text stream of CSV rows, rendered on demand so that
+    a partition is never held in memory."""
+
+    def __init__(self, rows):
+        super().__init__()
+        self._rows = rows
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out)
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or self._out.tell() < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self.count += 1
+        data = self._out.getvalue()
+        self._out.seek(0)
+        self._out.truncate()
+        if 0 <= size < len(data):
+            self._out.write(data[size:])
+            data = data[:size]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def load_partition(config, table, start, stop):
+    """Generate rows for users [start, stop) of table and load or write them.
+
+    Return: the number of rows loaded
+    """
+    columns, generate = GENERATORS[table]
+    rows = (row for i in range(start, stop) for row in generate(config, i))
+    stream = RowStream(rows)
+    if config['output_dir']:
+        path = os.path.join(config['output_dir'],
+                            '{}-{:09d}.csv'.format(table, start))
+        with open(path, 'w', newline='') as out:
+            while True:
+                chunk = stream.read(1 << 16)
+                if not chunk:
+                    break
+                out.write(chunk)
+        return stream.count
+
+    import psycopg2  # pylint: disable=import-outside-toplevel
+    uri = config['ledger_db_uri'] if table == 'transactions' else config['accounts_db_uri']
+    with psycopg2.connect(uri) as conn, conn.cursor() as cursor:
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            table, ', '.join(columns)), stream, size=1 << 16)
+    conn.close()
+    return stream.count
+
+
+def run(config, workers):
+    """Seed every table, users and transactions first, then contacts,
+    which reference users."""
+    step = config['partition_size']
+    partitions = [(start, min(start + step, config['users']))
+                  for start in range(0, config['users'], step)]
+    with ProcessPoolExecutor(workers) as executor:
+        for phase in (('users', 'transactions'), ('contacts',)):
+            begin = time.monotonic()
+            futures = {table: [executor.submit(load_partition, config, table, start, stop)
+                               for start, stop in partitions]
+                       for table in phase}
+            for table, table_futures in futures.items():
+                count = sum(future.result() for future in table_futures)
+                logging.info('%s: %d rows in %.1fs', table, count,
+                             time.monotonic() - begin)
+
+
+def write_credentials(config, path):
+    """Write username,password,accountid for every seeded user."""
+    with open(path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(('username', 'password', 'accountid'))
+        for i in range(config['users']):
+            writer.writerow((username(config, i), config['password'], account_id(config, i)))
+
+
+def parse_args(argv):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--users', type=int, default=1000,
+                        help='number of users to create (default: %(default)s)')
+    parser.add_argument('--contacts', type=float, default=5,
+                        help='mean contacts per user (default: %(default)s)')
+    parser.add_argument('--max-contacts', type=int, default=200,
+                        help='maximum contacts per user (default: %(default)s)')
+    parser.add_argument('--external-ratio', type=float, default=0.1,
+                        help='share of contacts that are external accounts '
+                             '(default: %(default)s)')
+    parser.add_argument('--payee-skew', type=float, default=1.2,
+                        help='Pareto shape of payee popularity; lower is more '
+                             'skewed (default: %(default)s)')
+    parser.add_argument('--payments', type=float, default=3,
+                        help='median payments per user per pay period '
+                             '(default: %(default)s)')
+    parser.add_argument('--years', type=float, default=2,
+                        help='years of transaction history (default: %(default)s)')
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat,
+                        default=datetime.date.today(),
+                        help='last day of transaction history, YYYY-MM-DD (default: today)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: %(default)s)')
+    parser.add_argument('--password', default='password',
+                        help='login password of every seeded user (default: %(default)s)')
+    parser.add_argument('--routing', default=os.environ.get('LOCAL_ROUTING_NUM', '883745000'),
+                        help='local routing number (default: $LOCAL_ROUTING_NUM or %(default)s)')
+    parser.add_argument('--accounts-db-uri', default=os.environ.get('ACCOUNTS_DB_URI'),
+                        help='accounts-db URI (default: $ACCOUNTS_DB_URI)')
+    parser.add_argument('--ledger-db-uri', default=os.environ.get('LEDGER_DB_URI'),
+                        help='ledger-db URI (default: $LEDGER_DB_URI)')
+    parser.add_argument('--output-dir',
+                        help='write CSV files here instead of loading the databases')
+    parser.add_argument('--credentials',
+                        help='also write username,password,accountid of every user '
+                             'to this CSV file, e.g. for the load generator')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='parallel worker processes (default: %(default)s)')
+    parser.add_argument('--partition-size', type=int, default=10000,
+                        help='users per partition (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if not args.output_dir and not (args.accounts_db_uri and args.ledger_db_uri):
+        parser.error('--accounts-db-uri and --ledger-db-uri, or --output-dir, are required')
+    return args
+
+
+def analyze(config):
+    """Refresh planner statistics after the bulk load."""
+    import psycopg2  # pylint: disable=import-outside-toplevel
+    for uri, tables in ((config['accounts_db_uri'], ('users', 'contacts')),
+                        (config['ledger_db_uri'], ('transactions',))):
+        conn = psycopg2.connect(uri)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for table in tables:
+                cursor.execute('ANALYZE {}'.format(table))
+        conn.close()
+
+
+def main(argv):
+    """Seed the databases."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parse_args(argv)
+    # one hash shared by every user keeps seeding fast and deterministic
+    rng = Random(args.seed)
+    # the last salt character only carries two bits
+    salt = '$2b$12$' + ''.join(rng.choice(BCRYPT_ALPHABET) for _ in range(21)) \
+        + rng.choice('.Oeu')
+    passhash = bcrypt.hashpw(args.password.encode('utf-8'), salt.encode('ascii'))
+    config = {
+        'users': args.users,
+        'contacts': args.contacts,
+        'max_contacts': args.max_contacts,
+        'external_ratio': args.external_ratio,
+        'payee_skew': args.payee_skew,
+        'payments': args.payments,
+        'years': args.years,
+        'seed': args.seed,
+        'password': args.password,
+        'passhash': '\\x' + passhash.hex(),
+        'routing': args.routing,
+        'accounts_db_uri': args.accounts_db_uri,
+        'ledger_db_uri': args.ledger_db_uri,
+        'output_dir': args.output_dir,
+        'partition_size': args.partition_size,
+        'end': datetime.datetime.combine(args.end_date, datetime.time()),
+    }
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    run(config, args.workers)
+    if not args.output_dir:
+        analyze(config)
+    if args.credentials:
+        write_credentials(config, args.credentials)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
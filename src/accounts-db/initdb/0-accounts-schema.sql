@@ -43,3 +43,9 @@ CREATE TABLE IF NOT EXISTS contacts (
 );
 
 CREATE INDEX IF NOT EXISTS idx_contacts_username ON contacts (username);
+
+CREATE TABLE IF NOT EXISTS contacts_versions (
+  username VARCHAR(64) PRIMARY KEY,
+  version BIGINT NOT NULL,
+  FOREIGN KEY (username) REFERENCES users(username)
+);
@@ -16,6 +16,7 @@
 # [START gke_initdb_1_load_testdata]
 # Immediately exit if any error occurs during script execution.
 set -o errexit
+set -o pipefail
 
 # Skip adding data if not enabled
 if [ "$USE_DEMO_DATA" != "True"  ]; then
@@ -32,30 +33,28 @@ readonly ENV_VARS=(
 )
 
 
+# The add_* functions print SQL statements, which main() pipes into a single
+# psql session rather than starting one psql process per row.
+# Values are trusted, hardcoded demo data.
+
 add_user() {
   # Usage:  add_user "ACCOUNTID" "USERNAME" "FIRST_NAME"
-  echo "adding user: $2"
-  psql -X -v ON_ERROR_STOP=1 -v account="$1" -v username="$2" -v firstname="$3" -v passhash="$DEFAULT_PASSHASH" --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
-    INSERT INTO users VALUES (:'account', :'username', :'passhash', :'firstname', 'User', '2000-01-01', '-5', 'Bowling Green, New York City', 'NY', '10004', '111-22-3333') ON CONFLICT DO NOTHING;
-EOSQL
+  echo "adding user: $2" >&2
+  echo "INSERT INTO users VALUES ('$1', '$2', '$DEFAULT_PASSHASH', '$3', 'User', '2000-01-01', '-5', 'Bowling Green, New York City', 'NY', '10004', '111-22-3333') ON CONFLICT DO NOTHING;"
 }
 
 
 add_external_account() {
   # Usage:  add_external_account "OWNER_USERNAME" "LABEL" "ACCOUNT" "ROUTING"
-  echo "user $1 adding contact: $2"
-  psql -X -v ON_ERROR_STOP=1 -v username="$1" -v label="$2" -v account="$3" -v routing="$4" --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
-    INSERT INTO contacts VALUES (:'username', :'label', :'account', :'routing', 'true') ON CONFLICT DO NOTHING;
-EOSQL
+  echo "user $1 adding external account: $2" >&2
+  echo "INSERT INTO contacts VALUES ('$1', '$2', '$3', '$4', 'true') ON CONFLICT DO NOTHING;"
 }
 
 
 add_contact() {
   # Usage:  add_contact "OWNER_USERNAME" "CONTACT_LABEL" "CONTACT_ACCOUNT"
-  echo "user $1 adding external account: $2"
-  psql -X -v ON_ERROR_STOP=1 -v username="$1" -v label="$2" -v account="$3" -v routing="$LOCAL_ROUTING_NUM" --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
-    INSERT INTO contacts VALUES (:'username', :'label', :'account', :'routing', 'false') ON CONFLICT DO NOTHING;
-EOSQL
+  echo "user $1 adding contact: $2" >&2
+  echo "INSERT INTO contacts VALUES ('$1', '$2', '$3', '$LOCAL_ROUTING_NUM', 'false') ON CONFLICT DO NOTHING;"
 }
 
 
@@ -102,7 +101,7 @@ main() {
   # Via Python3:  bycrypt.hashpw('password'.encode('utf-8'), bcrypt.gensalt())
   DEFAULT_PASSHASH='\x2432622431322454337064727039555765343932424f7241776654382e754a6866524b344e702f36444b5962316f4d4757626178666c574b48713536'
 
-  create_accounts
+  create_accounts | psql -X -v ON_ERROR_STOP=1 --single-transaction --quiet --username "$POSTGRES_USER" --dbname "$POSTGRES_DB"
 }
 
 
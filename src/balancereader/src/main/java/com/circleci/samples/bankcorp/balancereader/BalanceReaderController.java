@@ -26,6 +26,7 @@ import org.apache.logging.log4j.LogManager;
 import org.apache.logging.log4j.Logger;
 import org.springframework.beans.factory.annotation.Autowired;
 import org.springframework.beans.factory.annotation.Value;
+import org.springframework.http.HttpHeaders;
 import org.springframework.http.HttpStatus;
 import org.springframework.http.ResponseEntity;
 import org.springframework.web.bind.annotation.GetMapping;
@@ -43,6 +44,8 @@ public final class BalanceReaderController {
     private static final Logger LOGGER =
         LogManager.getLogger(BalanceReaderController.class);
 
+    public static final String LEDGER_POSITION_HEADER = "X-Ledger-Position";
+
     @Autowired
     private TransactionRepository dbRepo;
 
@@ -135,6 +138,8 @@ public final class BalanceReaderController {
      * Return the balance for the specified account.
      *
      * The currently authenticated user must be allowed to access the account.
+     * The X-Ledger-Position header carries the id of the latest transaction
+     * the balance includes.
      *
      * @param bearerToken  HTTP request 'Authorization' header
      * @param accountId    the account to get the balance for
@@ -157,9 +162,14 @@ public final class BalanceReaderController {
                 return new ResponseEntity<String>("not authorized",
                     HttpStatus.UNAUTHORIZED);
             }
+            // Read before the balance, which includes every transaction up
+            // to it, so that clients can tell which of theirs it shows
+            long position = ledgerReader.getProcessedTransactionId();
             // Load from cache
             Long balance = cache.get(accountId);
-            return new ResponseEntity<Long>(balance, HttpStatus.OK);
+            HttpHeaders headers = new HttpHeaders();
+            headers.set(LEDGER_POSITION_HEADER, Long.toString(position));
+            return new ResponseEntity<Long>(balance, headers, HttpStatus.OK);
         } catch (JWTVerificationException e) {
             LOGGER.error("Failed to retrieve account balance: not authorized");
             return new ResponseEntity<String>("not authorized",
@@ -56,7 +56,7 @@ public final class LedgerReader {
 
     private Thread backgroundThread;
     private LedgerReaderCallback callback;
-    private long latestTransactionId;
+    private volatile long latestTransactionId;
 
     /**
      * LedgerReader setup
@@ -138,6 +138,16 @@ public final class LedgerReader {
         return latestId;
     }
 
+    /**
+     * Returns the id of the latest transaction processed. Transactions
+     * up to it have been passed to the callback.
+     *
+     * @return the transaction id as a long or -1 if no transactions exist
+     */
+    public long getProcessedTransactionId() {
+        return latestTransactionId;
+    }
+
     /**
      * Indicates health of LedgerReader
      * @return false if background thread dies
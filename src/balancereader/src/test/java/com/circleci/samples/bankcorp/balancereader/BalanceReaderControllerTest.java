@@ -174,6 +174,26 @@ class BalanceReaderControllerTest {
         assertNotNull(actualResult);
         assertEquals(BALANCE, actualResult.getBody());
     }
+
+    @Test
+    @DisplayName("Given the user is authenticated for the account, return the ledger position of the balance.")
+    void getBalanceHasLedgerPosition() throws Exception {
+        // Given
+        when(verifier.verify(TOKEN)).thenReturn(jwt);
+        when(jwt.getClaim(JWT_ACCOUNT_KEY)).thenReturn(claim);
+        when(claim.asString()).thenReturn(AUTHED_ACCOUNT_NUM);
+        when(cache.get(AUTHED_ACCOUNT_NUM)).thenReturn(BALANCE);
+        when(ledgerReader.getProcessedTransactionId()).thenReturn(42L);
+
+        // When
+        final ResponseEntity actualResult = balanceReaderController.getBalance(BEARER_TOKEN, AUTHED_ACCOUNT_NUM);
+
+        // Then
+        assertNotNull(actualResult);
+        assertEquals("42", actualResult.getHeaders().getFirst(
+                BalanceReaderController.LEDGER_POSITION_HEADER));
+    }
+
     @Test
     @DisplayName("Given the user is authenticated but cannot access the account, return 401")
     void getBalanceFailsWhenAccountDoesNotMatchAuthenticatedUser() {
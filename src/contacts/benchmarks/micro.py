@@ -0,0 +1,114 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmarks of the per-request work of contacts, run by
+extras/microbench/microbench.py
+"""
+
+import os
+import random
+import tempfile
+import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import jsonify
+
+from contacts import create_app
+
+LOCAL_ROUTING_NUM = '883745000'
+ACCOUNT_ID = '1011226111'
+CONTACT_LIST_SIZES = (100, 1000, 10000)
+# contacts of the user in GET /contacts/<username>
+REQUEST_CONTACTS_SIZE = 20
+NEW_CONTACT = {
+    'label': 'New Contact',
+    'account_num': '9999999999',
+    'routing_num': LOCAL_ROUTING_NUM,
+    'is_external': False,
+}
+
+
+def closure(function, name):
+    """Return the variable name that function closes over, such as a
+    helper defined inside create_app."""
+    cells = dict(zip(function.__code__.co_freevars, function.__closure__ or ()))
+    return cells[name].cell_contents
+
+
+def make_contacts(size, rng):
+    """Generate size contacts, none of which conflicts with NEW_CONTACT."""
+    return [{'label': 'Contact {}'.format(i),
+             'account_num': '{:010d}'.format(rng.randrange(10**9, 9 * 10**9)),
+             'routing_num': LOCAL_ROUTING_NUM,
+             'is_external': False}
+            for i in range(size)]
+
+
+def cases():
+    """Build the fixtures and return the benchmarks."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with tempfile.NamedTemporaryFile('wb', suffix='.pub') as public_key:
+        public_key.write(key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+        public_key.flush()
+        # run with ENABLE_TRACING=true to measure the tracing overhead
+        os.environ.setdefault('ENABLE_TRACING', 'false')
+        os.environ.setdefault('TRACE_EXPORTER', 'none')
+        os.environ.setdefault('POD_NAMESPACE', 'microbench')
+        os.environ.update({'LOCAL_ROUTING_NUM': LOCAL_ROUTING_NUM,
+                           'PUB_KEY_PATH': public_key.name,
+                           'ACCOUNTS_DB_URI': 'sqlite://'})
+        app = create_app()
+
+    add_contact = app.view_functions['add_contact']
+    validate_new_contact = closure(add_contact, '_validate_new_contact')
+    check_contact_allowed = closure(add_contact, '_check_contact_allowed')
+
+    benchmarks = {'validate_new_contact': lambda: validate_new_contact(NEW_CONTACT)}
+    rng = random.Random(0)
+    # jsonify needs an app context; run with JSON_LIBRARY=json to compare
+    # with the standard library
+    app.app_context().push()
+    for size in CONTACT_LIST_SIZES:
+        contacts = make_contacts(size, rng)
+        # a contact that is allowed is compared with every existing one
+        benchmarks['check_contact_allowed_{}'.format(size)] = (
+            lambda contacts=contacts: check_contact_allowed(
+                'testuser', ACCOUNT_ID, NEW_CONTACT, contacts))
+        # the response of GET /contacts/<username>
+        benchmarks['jsonify_contacts_{}'.format(size)] = (
+            lambda contacts=contacts: jsonify(contacts))
+
+    # whole requests, through the Flask and SQLAlchemy instrumentation
+    # when tracing is enabled
+    contacts_db = closure(app.view_functions['get_contacts'], 'contacts_db')
+    contacts_db.contacts_table.create(contacts_db.engine)
+    contacts_db.versions_table.create(contacts_db.engine)
+    for contact in make_contacts(REQUEST_CONTACTS_SIZE, rng):
+        contacts_db.add_contact(dict(contact, username='testuser'))
+    now = int(time.time())
+    token = jwt.encode({'user': 'testuser', 'acct': ACCOUNT_ID, 'name': 'Test User',
+                        'iat': now, 'exp': now + 10**6}, key, algorithm='RS256')
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + token}
+    benchmarks['ready_request'] = lambda: client.get('/ready')
+    benchmarks['get_contacts_request'] = lambda: client.get(
+        '/contacts/testuser', headers=headers)
+    etag = client.get('/contacts/testuser', headers=headers).headers['ETag']
+    benchmarks['get_contacts_not_modified_request'] = lambda: client.get(
+        '/contacts/testuser', headers=dict(headers, **{'If-None-Match': etag}))
+    return benchmarks
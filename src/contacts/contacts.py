@@ -18,32 +18,27 @@ Manages internal user contacts and external accounts.
 """
 
 import atexit
+import hmac
+import itertools
 import logging
 import os
 import re
 import sys
 
 import jwt
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import bleach
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
-from db import ContactsDb
-
 from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.baggage.propagation import W3CBaggagePropagator
-from opentelemetry.propagators.composite import CompositePropagator
-from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
-from opentelemetry.propagators.b3 import B3MultiFormat
-
-
-from opentelemetry.propagate import set_global_textmap
-
-from opentelemetry.sdk.resources import SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 
+from db import ContactsDb
+import fastjson
+import metrics
+import sampling_profiler
+from querylog import QueryLog
+import tracing
+
 
 def create_app():
     """Flask application factory to create instances
@@ -67,11 +62,32 @@ def create_app():
         """Readiness probe."""
         return "ok", 200
 
+    @app.route("/admin/queries", methods=["GET"])
+    def query_stats():
+        """Per-statement database stats of this worker, the most time
+        consuming statement first.
+
+        Disabled unless ADMIN_TOKEN is set. Requires the header
+        'Authorization: Bearer <ADMIN_TOKEN>'.
+        """
+        if not app.config["ADMIN_TOKEN"]:
+            return "not found", 404
+        auth_header = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth_header.split(" ")[-1].encode("utf-8"),
+                                   app.config["ADMIN_TOKEN"].encode("utf-8")):
+            app.logger.error("Error getting query stats: invalid admin token")
+            return "authentication denied", 401
+        return jsonify(query_log.stats()), 200
+
     @app.route("/contacts/<username>", methods=["GET"])
     def get_contacts(username):
         """Retrieve the contacts list for the authenticated user.
         This list is used for populating Payment and Deposit fields.
 
+        The response has an ETag of the version of the contacts, unless
+        the versions table is unavailable. A request with a matching
+        If-None-Match gets a 304 without the contacts being read.
+
         Return: a list of contacts
         """
         auth_header = request.headers.get("Authorization")
@@ -86,9 +102,23 @@ def create_app():
             if username != auth_payload["user"]:
                 raise PermissionError
 
-            contacts_list = contacts_db.get_contacts(username)
-            app.logger.debug("Successfully retrieved contacts.")
-            return jsonify(contacts_list), 200
+            # read before the contacts, so that a concurrent change leaves
+            # the response with an outdated version rather than newer data
+            version = contacts_db.get_version(username)
+            if version is None:
+                # no versions table: no ETag, so every request reads the contacts
+                return jsonify(contacts_db.get_contacts(username))
+            etag = str(version)
+            if request.if_none_match.contains(etag):
+                app.logger.debug("Contacts not modified.")
+                response = Response(status=304)
+            else:
+                contacts_list = contacts_db.get_contacts(username)
+                app.logger.debug("Successfully retrieved contacts.")
+                response = jsonify(contacts_list)
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            return response
         except (PermissionError, jwt.exceptions.InvalidTokenError) as err:
             app.logger.error("Error retrieving contacts list: %s", str(err))
             return "authentication denied", 401
@@ -154,9 +184,130 @@ def create_app():
             app.logger.error("Error adding contact: %s", str(err))
             return "failed to add contact", 500
 
+    @app.route("/contacts/<username>/import", methods=["POST"])
+    def import_contacts(username):
+        """Add many contacts to the authenticated user's contacts list.
+
+        The request body is newline-delimited JSON, one contact per line,
+        with the same fields as a single add. Contacts are validated and
+        inserted in batches, and one JSON result line is streamed back per
+        input line, so memory use does not grow with the size of the import.
+        """
+        try:
+            auth_payload = _verify_user(username)
+        except (PermissionError, jwt.exceptions.InvalidTokenError) as err:
+            app.logger.error("Error importing contacts: %s", str(err))
+            return "authentication denied", 401
+        stream = request.stream
+
+        def results():
+            batch = []
+            lines = (line for line in stream if line.strip())
+            for row, line in enumerate(lines):
+                batch.append((row, line))
+                if len(batch) == app.config["IMPORT_BATCH_SIZE"]:
+                    yield from _import_batch(username, auth_payload["acct"], batch)
+                    batch = []
+            yield from _import_batch(username, auth_payload["acct"], batch)
+
+        return Response(results(), mimetype="application/x-ndjson")
+
+    def _import_batch(username, accountid, batch):
+        """Validate and insert one batch of imported contacts.
+
+        Return: an iterator of JSON result lines, in input order
+        """
+        errors = {}
+        candidates = []
+        for row, line in batch:
+            try:
+                record = json_provider.loads(line)
+                if not isinstance(record, dict):
+                    raise TypeError
+                req = {
+                    k: (bleach.clean(v) if isinstance(v, str) else v)
+                    for k, v in record.items()
+                }
+                _validate_new_contact(req)
+                candidates.append((row, req))
+            except (ValueError, TypeError):
+                errors[row] = "invalid contact"
+            except UserWarning as warn:
+                errors[row] = str(warn)
+
+        accepted = []
+        try:
+            existing = contacts_db.get_conflicting_contacts(
+                username, [req for _, req in candidates])
+            for row, req in candidates:
+                try:
+                    _check_contact_allowed(username, accountid, req,
+                                           existing + [c for _, c in accepted])
+                except ValueError as err:
+                    errors[row] = str(err)
+                    continue
+                accepted.append((row, {
+                    "username": username,
+                    "label": req["label"],
+                    "account_num": req["account_num"],
+                    "routing_num": req["routing_num"],
+                    "is_external": req["is_external"],
+                }))
+            contacts_db.add_contacts([contact for _, contact in accepted])
+        except SQLAlchemyError as err:
+            app.logger.error("Error importing contacts: %s", str(err))
+            for row, _ in candidates:
+                errors.setdefault(row, "failed to add contact")
+        app.logger.debug("Imported batch of %d contacts.", len(batch))
+
+        for row, _ in batch:
+            result = {"row": row, "status": "failed" if row in errors else "created"}
+            if row in errors:
+                result["message"] = errors[row]
+            yield json_provider.dumps(result) + "\n"
+
+    @app.route("/contacts/<username>/export", methods=["GET"])
+    def export_contacts(username):
+        """Stream the authenticated user's contacts list.
+
+        Return: newline-delimited JSON, one contact per line, read from
+                the database through a server-side cursor
+        """
+        try:
+            _verify_user(username)
+            contacts = contacts_db.iter_contacts(username)
+            # start the query so that database errors still produce a 500
+            first = list(itertools.islice(contacts, 1))
+        except (PermissionError, jwt.exceptions.InvalidTokenError) as err:
+            app.logger.error("Error exporting contacts: %s", str(err))
+            return "authentication denied", 401
+        except SQLAlchemyError as err:
+            app.logger.error("Error exporting contacts: %s", str(err))
+            return "failed to export contacts", 500
+        return Response(
+            (json_provider.dumps(contact) + "\n"
+             for contact in itertools.chain(first, contacts)),
+            mimetype="application/x-ndjson",
+        )
+
+    def _verify_user(username):
+        """Verify that the request is authenticated as username.
+
+        Return: the decoded token payload
+        Raises: PermissionError or InvalidTokenError if it is not
+        """
+        auth_header = request.headers.get("Authorization")
+        token = auth_header.split(" ")[-1] if auth_header else ""
+        auth_payload = jwt.decode(
+            token, key=app.config["PUBLIC_KEY"], algorithms="RS256"
+        )
+        if username != auth_payload["user"]:
+            raise PermissionError
+        return auth_payload
+
     def _validate_new_contact(req):
         """Check that this new contact request has valid fields"""
-        app.logger.debug("validating add contact request: %s", str(req))
+        app.logger.debug("validating add contact request: %s", req)
         # Check if required fields are filled
         fields = ("label", "account_num", "routing_num", "is_external")
         if any(f not in req for f in fields):
@@ -176,16 +327,22 @@ def create_app():
         if req["label"] is None or not re.match(r"^[0-9a-zA-Z][0-9a-zA-Z ]{0,29}$", req["label"]):
             raise UserWarning("invalid account label")
 
-    def _check_contact_allowed(username, accountid, req):
-        """Check that this contact is allowed to be created"""
+    def _check_contact_allowed(username, accountid, req, contacts=None):
+        """Check that this contact is allowed to be created
+
+        Params: contacts - the existing contacts to check against,
+                           defaults to all of the user's contacts
+        """
         app.logger.debug(
-            "checking that this contact is allowed to be created: %s", str(req))
+            "checking that this contact is allowed to be created: %s", req)
         # Don't allow self reference
         if (req["account_num"] == accountid and req["routing_num"] == app.config["LOCAL_ROUTING"]):
             raise ValueError("may not add yourself to contacts")
 
         # Don't allow identical contacts
-        for contact in contacts_db.get_contacts(username):
+        if contacts is None:
+            contacts = contacts_db.get_contacts(username)
+        for contact in contacts:
             if (contact["account_num"] == req["account_num"]
                     and contact["routing_num"] == req["routing_num"]):
                 raise ValueError("account already exists as a contact")
@@ -206,24 +363,8 @@ def create_app():
     # Set up tracing and export spans to Cloud Trace.
     if os.environ['ENABLE_TRACING'] == "true":
         app.logger.info("✅ Tracing enabled.")
-        trace.set_tracer_provider(
-            TracerProvider(
-                resource=Resource.create(
-                    {SERVICE_NAME:
-                     f"{os.environ['POD_NAMESPACE']}-contacts"}
-                )
-            )
-        )
+        tracing.init_tracer_provider(f"{os.environ['POD_NAMESPACE']}-contacts")
         tracer = trace.get_tracer(__name__)
-        trace.get_tracer_provider().add_span_processor(
-            BatchSpanProcessor(OTLPSpanExporter())
-        )
-        set_global_textmap(CompositePropagator(
-            [B3MultiFormat(), TraceContextTextMapPropagator(), W3CBaggagePropagator()]))
-
-
-        set_global_textmap(CompositePropagator(
-            [B3MultiFormat(), TraceContextTextMapPropagator(), W3CBaggagePropagator()]))
         FlaskInstrumentor().instrument_app(app)
     else:
         app.logger.info("🚫 Tracing disabled.")
@@ -232,13 +373,41 @@ def create_app():
     app.config["VERSION"] = os.environ.get("VERSION")
     app.config["LOCAL_ROUTING"] = os.environ.get("LOCAL_ROUTING_NUM")
     app.config["PUBLIC_KEY"] = open(os.environ.get("PUB_KEY_PATH"), "r").read()
+    app.config["IMPORT_BATCH_SIZE"] = int(
+        os.environ.get("CONTACTS_IMPORT_BATCH_SIZE", "500"))
+    # admin endpoints are disabled unless an admin token is configured
+    app.config["ADMIN_TOKEN"] = os.environ.get("ADMIN_TOKEN", "")
+
+    # Serialize and parse JSON with orjson when it is installed
+    json_provider = fastjson.load_provider(os.environ.get("JSON_LIBRARY", "auto"))
+    fastjson.init_app(app, json_provider)
+
+    # Time every statement, log slow ones and keep stats for /admin/queries
+    query_log = QueryLog(
+        slow_seconds=float(os.environ.get("SLOW_QUERY_MS", "100")) / 1000,
+        explain_rate=float(os.environ.get("SLOW_QUERY_EXPLAIN_RATE", "0")),
+        logger=app.logger)
 
     # Configure database connection
     try:
-        contacts_db = ContactsDb(os.environ.get("ACCOUNTS_DB_URI"), app.logger)
+        contacts_db = ContactsDb(os.environ.get("ACCOUNTS_DB_URI"), app.logger, query_log)
     except OperationalError:
         app.logger.critical("database connection failed")
         sys.exit(1)
+
+    # Export Prometheus metrics at /metrics
+    if os.environ.get("ENABLE_METRICS") == "true":
+        metrics.init_app(app)
+        metrics.instrument_engine(contacts_db.engine, "contacts")
+
+    # Profile a share of the requests, and requests with a signed X-Profile header
+    profile_rate = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+    if profile_rate > 0 or os.environ.get("PROFILE_SECRET"):
+        sampling_profiler.init_app(
+            app, sample_rate=profile_rate,
+            secret=os.environ.get("PROFILE_SECRET", ""),
+            interval=float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000,
+            directory=os.environ.get("PROFILE_DIR"))
     return app
 
 
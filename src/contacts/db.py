@@ -17,34 +17,65 @@ db manages interactions with the underlying database
 """
 
 import logging
-from sqlalchemy import create_engine, MetaData, Table, Column, String, Boolean
+import time
+
+from sqlalchemy import (create_engine, or_, text, BigInteger, MetaData, Table, Column, String,
+                        Boolean)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 
 
+# seconds between attempts to create a missing versions table
+VERSIONS_RETRY_SECONDS = 60
+
+# the versions table as accounts-db creates it in 0-accounts-schema.sql
+VERSIONS_DDL = """CREATE TABLE IF NOT EXISTS contacts_versions (
+  username VARCHAR(64) PRIMARY KEY,
+  version BIGINT NOT NULL,
+  FOREIGN KEY (username) REFERENCES users(username)
+)"""
+
+
 class ContactsDb:
     """
     ContactsDb provides a set of helper functions over SQLAlchemy
     to handle db operations for contact service.
     """
 
-    def __init__(self, uri, logger=logging):
+    def __init__(self, uri, logger=logging, query_log=None):
         self.engine = create_engine(uri)
         self.logger = logger
+        metadata = MetaData(self.engine)
         self.contacts_table = Table(
             "contacts",
-            MetaData(self.engine),
+            metadata,
             Column("username", String, nullable=False),
             Column("label", String, nullable=False),
             Column("account_num", String, nullable=False),
             Column("routing_num", String, nullable=False),
             Column("is_external", Boolean, nullable=False),
         )
+        # bumped whenever a user's contacts change, created by VERSIONS_DDL
+        self.versions_table = Table(
+            "contacts_versions",
+            metadata,
+            Column("username", String, primary_key=True),
+            Column("version", BigInteger, nullable=False),
+        )
+        # the table is created on first use, so that a database predating
+        # it keeps serving contacts; None or the time of a failed attempt
+        self._versions_missing_since = None
+        self._versions_ready = False
 
         # Set up tracing autoinstrumentation for sqlalchemy
         SQLAlchemyInstrumentor().instrument(
             engine=self.engine,
             service="contacts",
         )
+        # Time statements and log the slow ones
+        if query_log is not None:
+            query_log.instrument(self.engine, "contacts")
 
     def add_contact(self, contact):
         """Add a contact under the specified username.
@@ -54,9 +85,128 @@ class ContactsDb:
         Raises: SQLAlchemyError if there was an issue with the database
         """
         statement = self.contacts_table.insert().values(contact)
-        self.logger.debug("QUERY: %s", str(statement))
-        with self.engine.connect() as conn:
+        self.logger.debug("QUERY: %s", statement)
+        versioned = self._versions_available()
+        with self.engine.begin() as conn:
             conn.execute(statement)
+            if versioned:
+                self._bump_version(conn, contact["username"])
+
+    def add_contacts(self, contacts):
+        """Add many contacts with a single multi-row insert.
+
+        Params: contacts - a list of key/value dicts of attributes
+                           describing new contacts, as for add_contact
+        Raises: SQLAlchemyError if there was an issue with the database,
+                in which case no contact is added
+        """
+        if not contacts:
+            return
+        statement = self.contacts_table.insert().values(contacts)
+        self.logger.debug("QUERY: %s", statement)
+        versioned = self._versions_available()
+        with self.engine.begin() as conn:
+            conn.execute(statement)
+            for username in sorted({contact["username"] for contact in contacts}):
+                if versioned:
+                    self._bump_version(conn, username)
+
+    def get_version(self, username):
+        """Get the version of the contacts of username, which changes
+        whenever they change.
+
+        Params: username - the username of the user
+        Return: the version, 0 for contacts never changed through this service,
+                or None if the versions table could not be created
+        Raises: SQLAlchemyError if there was an issue with the database
+        """
+        if not self._versions_available():
+            return None
+        table = self.versions_table
+        statement = table.select().with_only_columns([table.c.version]).where(
+            table.c.username == username)
+        self.logger.debug("QUERY: %s", statement)
+        with self.engine.connect() as conn:
+            version = conn.execute(statement).scalar()
+        return version or 0
+
+    def _versions_available(self):
+        """Create the versions table if it is missing, on first use and
+        at most once a minute after a failed attempt.
+
+        Return: whether the versions table exists
+        """
+        if self._versions_ready:
+            return True
+        if (self._versions_missing_since is not None
+                and time.monotonic() - self._versions_missing_since < VERSIONS_RETRY_SECONDS):
+            return False
+        try:
+            self.create_versions_table()
+        except SQLAlchemyError as err:
+            self.logger.warning(
+                "Contacts versions unavailable, contacts are not revalidated: %s", str(err))
+            self._versions_missing_since = time.monotonic()
+            return False
+        self._versions_ready = True
+        return True
+
+    def create_versions_table(self):
+        """Create the versions table if it does not exist."""
+        with self.engine.begin() as conn:
+            conn.execute(text(VERSIONS_DDL))
+
+    def _bump_version(self, conn, username):
+        """Increment the version of the contacts of username in the
+        transaction of conn."""
+        table = self.versions_table
+        insert = _UPSERT_DIALECTS[self.engine.dialect.name].insert
+        statement = insert(table).values(username=username, version=1).on_conflict_do_update(
+            index_elements=[table.c.username], set_={"version": table.c.version + 1})
+        self.logger.debug("QUERY: %s", statement)
+        conn.execute(statement)
+
+    def get_conflicting_contacts(self, username, contacts):
+        """Get the contacts of username sharing a label or account number
+        with any of the given contacts.
+
+        Params: username - the username of the user
+                contacts - a list of contacts as key/value dicts
+        Return: a list of contacts in the same form as get_contacts
+        Raises: SQLAlchemyError if there was an issue with the database
+        """
+        if not contacts:
+            return []
+        table = self.contacts_table
+        statement = table.select().where(
+            table.c.username == username,
+            or_(table.c.label.in_({c["label"] for c in contacts}),
+                table.c.account_num.in_({c["account_num"] for c in contacts})),
+        )
+        self.logger.debug("QUERY: %s", statement)
+        with self.engine.connect() as conn:
+            return [_to_contact(row) for row in conn.execute(statement)]
+
+    def iter_contacts(self, username, batch_size=1000):
+        """Lazily get the contacts for the specified username.
+
+        Rows are read through a server-side cursor batch_size at a time,
+        so memory use does not grow with the number of contacts.
+
+        Params: username - the username of the user
+        Return: an iterator of contacts in the same form as get_contacts
+        Raises: SQLAlchemyError if there was an issue with the database
+        """
+        statement = self.contacts_table.select().where(
+            self.contacts_table.c.username == username
+        )
+        self.logger.debug("QUERY: %s", statement)
+        with self.engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, max_row_buffer=batch_size
+            ).execute(statement)
+            for row in result:
+                yield _to_contact(row)
 
     def get_contacts(self, username):
         """Get a list of contacts for the specified username.
@@ -70,16 +220,24 @@ class ContactsDb:
         statement = self.contacts_table.select().where(
             self.contacts_table.c.username == username
         )
-        self.logger.debug("QUERY: %s", str(statement))
+        self.logger.debug("QUERY: %s", statement)
         with self.engine.connect() as conn:
             result = conn.execute(statement)
         for row in result:
-            contact = {
-                "label": row["label"],
-                "account_num": row["account_num"],
-                "routing_num": row["routing_num"],
-                "is_external": row["is_external"],
-            }
-            contacts.append(contact)
+            contacts.append(_to_contact(row))
         self.logger.debug("RESULT: Fetched %d contacts.", len(contacts))
         return contacts
+
+
+# dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+
+def _to_contact(row):
+    """Convert a contacts table row into a contact dict."""
+    return {
+        "label": row["label"],
+        "account_num": row["account_num"],
+        "routing_num": row["routing_num"],
+        "is_external": row["is_external"],
+    }
@@ -0,0 +1,116 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+fastjson serializes and parses JSON with orjson when it is installed, and
+with the standard library json module otherwise
+
+The provider serves jsonify and request.get_json through the app's JSON
+encoder and decoder, and the service's own JSON, such as backend
+responses, through its dumps and loads.
+"""
+
+import json
+
+from flask.json import JSONDecoder, JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LIBRARIES = ('auto', 'orjson', 'json')
+
+
+class JSONProvider:
+    """Serializes with the standard library json module."""
+
+    name = 'json'
+
+    def dumps(self, obj, default=None, sort_keys=False):
+        """Return obj as a JSON string, calling default for objects that
+        are not serializable."""
+        return json.dumps(obj, default=default, sort_keys=sort_keys)
+
+    def loads(self, data):
+        """Return the object of a JSON string or UTF-8 bytes.
+
+        Raises: ValueError if data is not valid JSON
+        """
+        return json.loads(data)
+
+
+class OrjsonProvider(JSONProvider):
+    """Serializes with orjson.
+
+    Dates and dataclasses are passed to default as with the standard
+    library, so that Flask's encoder formats them the same way. Objects
+    orjson cannot serialize, such as integers beyond 64 bits or keys that
+    are not strings, fall back to the standard library. Non-ASCII
+    characters are written as UTF-8 instead of \\u escapes.
+    """
+
+    name = 'orjson'
+
+    def dumps(self, obj, default=None, sort_keys=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode('utf-8')
+        except TypeError:
+            return super().dumps(obj, default, sort_keys)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+def load_provider(library='auto'):
+    """Return the provider of library, one of LIBRARIES. auto is orjson
+    when it is installed and json otherwise.
+
+    Raises: ValueError if library is unknown or not installed
+    """
+    if library not in LIBRARIES:
+        raise ValueError('JSON_LIBRARY must be one of {}'.format(', '.join(LIBRARIES)))
+    if library == 'auto':
+        library = 'json' if orjson is None else 'orjson'
+    if library == 'orjson':
+        if orjson is None:
+            raise ValueError('JSON_LIBRARY is orjson but orjson is not installed')
+        return OrjsonProvider()
+    return JSONProvider()
+
+
+def init_app(app, provider):
+    """Serialize the responses of jsonify and parse request bodies with
+    provider."""
+
+    class ProviderJSONEncoder(JSONEncoder):
+        """Flask's encoder, serializing with provider."""
+
+        def encode(self, o):
+            if self.indent is not None:
+                # pretty printing in debug mode
+                return super().encode(o)
+            return provider.dumps(o, default=self.default, sort_keys=self.sort_keys)
+
+    class ProviderJSONDecoder(JSONDecoder):
+        """Flask's decoder, parsing with provider."""
+
+        def decode(self, s, *args, **kwargs):
+            return provider.loads(s)
+
+    app.json_encoder = ProviderJSONEncoder
+    app.json_decoder = ProviderJSONDecoder
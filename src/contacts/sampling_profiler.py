@@ -0,0 +1,192 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+sampling_profiler samples the stacks of the threads handling profiled requests and
+aggregates them per route in the collapsed stack format of flamegraph.pl,
+which speedscope also reads
+
+A request is profiled if it is drawn at the sample rate, or if it carries
+an X-Profile header signed with the profiling secret:
+
+  X-Profile: <expiry unix time>:<hex HMAC-SHA256 of the expiry>
+"""
+
+import atexit
+import collections
+import hashlib
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from flask import Response, abort, g, request
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def collapse(frame):
+    """Return the stack of frame as ;-separated function (file:line) frames,
+    outermost first."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append('{} ({}:{})'.format(
+            code.co_name,
+            os.path.join(*code.co_filename.split(os.sep)[-2:]),
+            code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(frames))
+
+
+def sign(secret, expires):
+    """Return an X-Profile header value valid until unix time expires."""
+    digest = hmac.new(secret.encode('utf-8'), str(int(expires)).encode('utf-8'),
+                      hashlib.sha256).hexdigest()
+    return '{}:{}'.format(int(expires), digest)
+
+
+def verify(secret, value, now=None):
+    """Return whether value is an unexpired X-Profile header signed with secret."""
+    expires, _, _ = value.partition(':')
+    if not secret or not expires.isdigit():
+        return False
+    if int(expires) < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(value.encode('utf-8'),
+                               sign(secret, int(expires)).encode('utf-8'))
+
+
+class SamplingProfiler:
+    """Samples the stacks of registered threads every interval seconds.
+
+    The sampling thread is started with the first profiled request and
+    sleeps while no request is profiled. If directory is set, the samples
+    of this process are written to it every dump_seconds and at exit.
+    """
+
+    def __init__(self, interval=0.005, directory=None, dump_seconds=60, logger=logging):
+        self.interval = interval
+        self.directory = directory
+        self.dump_seconds = dump_seconds
+        self.logger = logger
+        self._active = {}  # thread id -> route
+        self._samples = collections.defaultdict(collections.Counter)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def start(self, route):
+        """Profile the calling thread under route until stop()."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # not started yet, or started in the parent of a forked worker
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='profiler', daemon=True).start()
+                if self.directory:
+                    atexit.register(self.dump)
+            self._active[threading.get_ident()] = route
+        self._wake.set()
+
+    def stop(self):
+        """Stop profiling the calling thread."""
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def collapsed(self, route=None):
+        """Return the samples in the collapsed stack format, the route as
+        the outermost frame, for one route or all of them."""
+        with self._lock:
+            lines = ['{};{} {}'.format(name, stack, count)
+                     for name, stacks in self._samples.items()
+                     if route is None or name == route
+                     for stack, count in stacks.items()]
+        return ''.join(line + '\n' for line in sorted(lines))
+
+    def dump(self):
+        """Write the samples of this process to directory."""
+        path = os.path.join(self.directory, 'profile.{}.collapsed'.format(os.getpid()))
+        try:
+            with open(path + '.tmp', 'w') as file:
+                file.write(self.collapsed())
+            os.replace(path + '.tmp', path)
+        except OSError as err:
+            self.logger.warning('Could not write profile: %s', str(err))
+
+    def _run(self):
+        last_dump = time.monotonic()
+        while True:
+            if not self._active:
+                self._wake.wait(self.dump_seconds)
+                self._wake.clear()
+            else:
+                time.sleep(self.interval)
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            with self._lock:
+                for ident, route in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._samples[route][collapse(frame)] += 1
+            del frames
+            if self.directory and time.monotonic() - last_dump >= self.dump_seconds:
+                last_dump = time.monotonic()
+                self.dump()
+
+
+def init_app(app, sample_rate=0, secret='', interval=0.005, directory=None):
+    """Profile a sample_rate share of the requests of app, and the requests
+    signed with secret.
+
+    The samples of the worker serving the request are served at
+    /debug/profile to holders of secret.
+
+    Return: the profiler
+    """
+    profiler = SamplingProfiler(interval, directory, logger=app.logger)
+
+    @app.before_request
+    def _start_profile():
+        header = request.headers.get(PROFILE_HEADER)
+        if random.random() < sample_rate or (header and verify(secret, header)):
+            rule = request.url_rule.rule if request.url_rule else 'unmatched'
+            profiler.start('{} {}'.format(request.method, rule))
+            g.profiled = True
+
+    @app.teardown_request
+    def _stop_profile(_exc):
+        if g.pop('profiled', False):
+            profiler.stop()
+
+    @app.route('/debug/profile', methods=['GET'])
+    def debug_profile():  # pylint: disable=unused-variable
+        """Collapsed stacks of the requests profiled by this worker.
+
+        Disabled unless a profiling secret is set. Requires the header
+        'Authorization: Bearer <secret>'. The route query parameter, such
+        as 'GET /home', restricts the stacks to one route.
+        """
+        if not secret:
+            abort(404)
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header.split(' ')[-1].encode('utf-8'),
+                                   secret.encode('utf-8')):
+            return 'authentication denied', 401
+        return Response(profiler.collapsed(request.args.get('route')),
+                        mimetype='text/plain',
+                        headers={'X-Profile-Pid': str(os.getpid())})
+
+    return profiler
@@ -330,3 +330,118 @@ class TestContacts(unittest.TestCase):
         self.assertEqual(
             response.data, b"failed to retrieve contacts list"
         )
+
+    def test_get_contacts_200_etag_of_version(self):
+        """test that contacts are tagged with the version of the user's contacts"""
+        self.mocked_db.return_value.get_version.return_value = 3
+        response = self.test_app.get(
+            "/contacts/{}".format(EXAMPLE_USER), headers=EXAMPLE_HEADERS
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["ETag"], '"3"')
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        self.mocked_db.return_value.get_version.assert_called_once_with(EXAMPLE_USER)
+
+    def test_get_contacts_304_matching_version(self):
+        """test that unchanged contacts are not read again"""
+        self.mocked_db.return_value.get_version.return_value = 3
+        headers = dict(EXAMPLE_HEADERS, **{"If-None-Match": '"3"'})
+        response = self.test_app.get("/contacts/{}".format(EXAMPLE_USER), headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], '"3"')
+        self.mocked_db.return_value.get_contacts.assert_not_called()
+
+    def test_get_contacts_200_changed_version(self):
+        """test that changed contacts are sent again"""
+        self.mocked_db.return_value.get_version.return_value = 4
+        self.mocked_db.return_value.get_contacts.return_value = ["foo"]
+        headers = dict(EXAMPLE_HEADERS, **{"If-None-Match": '"3"'})
+        response = self.test_app.get("/contacts/{}".format(EXAMPLE_USER), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, ["foo"])
+        self.assertEqual(response.headers["ETag"], '"4"')
+
+    def test_get_contacts_200_without_etag_when_versions_unavailable(self):
+        """test that contacts are served without an ETag when versions are unavailable"""
+        self.mocked_db.return_value.get_version.return_value = None
+        self.mocked_db.return_value.get_contacts.return_value = ["foo"]
+        headers = dict(EXAMPLE_HEADERS, **{"If-None-Match": '"None"'})
+        response = self.test_app.get("/contacts/{}".format(EXAMPLE_USER), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, ["foo"])
+        self.assertNotIn("ETag", response.headers)
+
+    def test_get_contacts_401_before_version(self):
+        """test that revalidation is still authenticated"""
+        self.mocked_db.return_value.get_version.return_value = 3
+        headers = {"Authorization": "foo", "If-None-Match": '"3"'}
+        response = self.test_app.get("/contacts/{}".format(EXAMPLE_USER), headers=headers)
+        self.assertEqual(response.status_code, 401)
+        self.mocked_db.return_value.get_version.assert_not_called()
+
+    def test_import_contacts_200_reports_result_per_line(self):
+        """test importing newline-delimited contacts"""
+        # an existing contact clashes with the third line
+        self.mocked_db.return_value.get_conflicting_contacts.return_value = [
+            create_new_contact(label="existing", account_num="1111111111")
+        ]
+        lines = [
+            create_new_contact(label="first"),
+            create_new_contact(label="second", account_num="123"),
+            create_new_contact(label="third", account_num="1111111111"),
+            create_new_contact(label="first", account_num="2222222222"),
+        ]
+        body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n"
+        response = self.test_app.post(
+            "/contacts/{}/import".format(EXAMPLE_USER),
+            headers=EXAMPLE_HEADERS,
+            data=body,
+        )
+        self.assertEqual(response.status_code, 200)
+        results = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual(
+            ["created", "failed", "failed", "failed", "failed"],
+            [result["status"] for result in results],
+        )
+        self.assertEqual("invalid account number", results[1]["message"])
+        self.assertEqual("account already exists as a contact", results[2]["message"])
+        self.assertEqual("contact already exists with that label", results[3]["message"])
+        self.assertEqual("invalid contact", results[4]["message"])
+        # only the valid contact is inserted
+        added = self.mocked_db.return_value.add_contacts.call_args[0][0]
+        self.assertEqual(["first"], [contact["label"] for contact in added])
+
+    def test_import_contacts_401_invalid_auth(self):
+        """test importing contacts with invalid auth"""
+        invalid_token_header = EXAMPLE_HEADERS.copy()
+        invalid_token_header["Authorization"] = "foo"
+        response = self.test_app.post(
+            "/contacts/{}/import".format(EXAMPLE_USER),
+            headers=invalid_token_header,
+            data="",
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_export_contacts_200_streams_contacts(self):
+        """test exporting contacts as newline-delimited JSON"""
+        self.mocked_db.return_value.iter_contacts.return_value = iter(
+            [EXAMPLE_CONTACT, EXAMPLE_CONTACT]
+        )
+        response = self.test_app.get(
+            "/contacts/{}/export".format(EXAMPLE_USER), headers=EXAMPLE_HEADERS
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [EXAMPLE_CONTACT, EXAMPLE_CONTACT],
+            [json.loads(line) for line in response.data.splitlines()],
+        )
+
+    def test_export_contacts_500_db_failure(self):
+        """test exporting contacts but throws SQL error"""
+        self.mocked_db.return_value.iter_contacts.side_effect = SQLAlchemyError()
+        response = self.test_app.get(
+            "/contacts/{}/export".format(EXAMPLE_USER), headers=EXAMPLE_HEADERS
+        )
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data, b"failed to export contacts")
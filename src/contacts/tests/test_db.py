@@ -15,11 +15,15 @@
 """
 Tests for db module
 """
+import os
 import random
 
 import unittest
+from unittest.mock import patch
 
-from contacts.db import ContactsDb
+from sqlalchemy.exc import SQLAlchemyError
+
+from contacts.db import ContactsDb, VERSIONS_DDL
 from contacts.tests.constants import EXAMPLE_CONTACT_DB_OBJ
 
 
@@ -32,8 +36,9 @@ class TestDb(unittest.TestCase):
         """Init db and create table before each test"""
         # init SQLAlchemy with sqllite in mem
         self.db = ContactsDb("sqlite:///:memory:")
-        # create contacts table in mem
+        # create contacts and versions tables in mem
         self.db.contacts_table.create(self.db.engine)
+        self.db.create_versions_table()
         # create example contact object
         self.contact = EXAMPLE_CONTACT_DB_OBJ.copy()
 
@@ -80,3 +85,78 @@ class TestDb(unittest.TestCase):
         """test getting contacts for a non existent user"""
         # assert None when user does not exist
         self.assertEqual(0, len(self.db.get_contacts("baz")))
+
+    def test_add_contacts_adds_all_contacts(self):
+        """test adding several contacts at once"""
+        contacts = []
+        for i in range(3):
+            contact = self.contact.copy()
+            contact["label"] = "label-{}".format(i)
+            contacts.append(contact)
+        self.db.add_contacts(contacts)
+        for contact in contacts:
+            contact.pop("username")
+        self.assertEqual(contacts, self.db.get_contacts(self.contact["username"]))
+
+    def test_iter_contacts_yields_existing_contacts(self):
+        """test streaming the contacts of a user"""
+        self.db.add_contact(self.contact)
+        contacts = list(self.db.iter_contacts(self.contact["username"]))
+        self.contact.pop("username")
+        self.assertEqual([self.contact], contacts)
+
+    def test_get_conflicting_contacts_matches_label_or_account(self):
+        """test finding existing contacts that clash with new ones"""
+        self.db.add_contact(self.contact)
+        same_label = dict(self.contact, account_num="0000000000")
+        same_account = dict(self.contact, label="other")
+        unrelated = dict(self.contact, label="other", account_num="0000000000")
+        username = self.contact["username"]
+        self.assertEqual(1, len(self.db.get_conflicting_contacts(username, [same_label])))
+        self.assertEqual(1, len(self.db.get_conflicting_contacts(username, [same_account])))
+        self.assertEqual([], self.db.get_conflicting_contacts(username, [unrelated]))
+
+    def test_version_of_unchanged_contacts_is_zero(self):
+        """test the version of a user whose contacts never changed"""
+        self.assertEqual(0, self.db.get_version("baz"))
+
+    def test_adding_contacts_bumps_version(self):
+        """test that every change of a user's contacts bumps their version"""
+        username = self.contact["username"]
+        self.db.add_contact(self.contact)
+        self.assertEqual(1, self.db.get_version(username))
+        self.db.add_contacts([dict(self.contact, label="other"),
+                              dict(self.contact, label="another"),
+                              dict(self.contact, username="baz")])
+        self.assertEqual(2, self.db.get_version(username))
+        self.assertEqual(1, self.db.get_version("baz"))
+        self.db.add_contacts([])
+        self.assertEqual(2, self.db.get_version(username))
+
+    def test_missing_versions_table_created_on_first_use(self):
+        """test that a database without the versions table keeps working"""
+        db = ContactsDb("sqlite:///:memory:")
+        db.contacts_table.create(db.engine)
+        self.assertEqual(0, db.get_version("baz"))
+        db.add_contact(self.contact)
+        self.assertEqual(1, db.get_version(self.contact["username"]))
+
+    def test_versions_unavailable_when_table_cannot_be_created(self):
+        """test that contacts are still added without a versions table"""
+        db = ContactsDb("sqlite:///:memory:")
+        db.contacts_table.create(db.engine)
+        with patch.object(db, "create_versions_table",
+                          side_effect=SQLAlchemyError()) as create:
+            self.assertIsNone(db.get_version("baz"))
+            db.add_contact(self.contact)
+            self.assertIsNone(db.get_version(self.contact["username"]))
+            # not tried again within VERSIONS_RETRY_SECONDS
+            create.assert_called_once()
+        self.assertEqual(1, len(db.get_contacts(self.contact["username"])))
+
+    def test_versions_ddl_matches_accounts_db_schema(self):
+        """test that the versions table is created as accounts-db creates it"""
+        schema_path = os.path.join(os.path.dirname(__file__), "..", "..", "accounts-db",
+                                   "initdb", "0-accounts-schema.sql")
+        with open(schema_path, encoding="utf-8") as schema_file:
+            self.assertIn(VERSIONS_DDL + ";", schema_file.read())
@@ -0,0 +1,38 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests of how contacts sets up the fastjson module. The module itself is
+tested with the userservice copy, kept identical by src/shared/sync.py.
+"""
+
+import unittest
+from unittest.mock import patch, mock_open
+
+from contacts.contacts import create_app
+
+
+class TestCreateApp(unittest.TestCase):
+    """
+    Test cases for the JSON library of the app
+    """
+
+    def test_create_app_with_unknown_library_raises(self):
+        """test that JSON_LIBRARY is validated when the app is created"""
+        environ = {"VERSION": "1", "ENABLE_TRACING": "false", "JSON_LIBRARY": "ujson"}
+        with patch("contacts.contacts.open", mock_open(read_data="foo")), \
+                patch("os.environ", environ), \
+                patch("contacts.contacts.ContactsDb"):
+            with self.assertRaises(ValueError):
+                create_app()
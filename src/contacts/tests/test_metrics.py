@@ -0,0 +1,88 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for metrics module
+"""
+
+import unittest
+from unittest.mock import patch, mock_open
+
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+# the app imports metrics as a top level module, use the same instance
+from contacts.contacts import create_app, metrics
+
+
+def create_test_app(enable_metrics):
+    """Create the app with mocked files and database"""
+    environ = {"VERSION": "1", "ENABLE_TRACING": "false"}
+    if enable_metrics:
+        environ["ENABLE_METRICS"] = "true"
+    with patch("contacts.contacts.open", mock_open(read_data="foo")), \
+            patch("os.environ", environ), \
+            patch("contacts.contacts.ContactsDb") as mock_db:
+        mock_db.return_value.engine = create_engine("sqlite://")
+        return create_app().test_client()
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test cases for metrics module
+    """
+
+    def test_metrics_endpoint_disabled_by_default_404(self):
+        """test that /metrics is only served when ENABLE_METRICS is true"""
+        response = create_test_app(False).get("/metrics")
+        self.assertEqual(response.status_code, 404)
+
+    def test_request_recorded_by_route_template(self):
+        """test that a request is counted under its route and status"""
+        test_app = create_test_app(True)
+        labels = {"method": "GET", "route": "/ready", "status": "200"}
+        before = REGISTRY.get_sample_value(
+            "http_request_duration_seconds_count", labels) or 0
+        test_app.get("/ready")
+        self.assertEqual(REGISTRY.get_sample_value(
+            "http_request_duration_seconds_count", labels), before + 1)
+        self.assertEqual(REGISTRY.get_sample_value("http_requests_in_flight"), 0)
+
+        response = test_app.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'route="/ready"', response.data)
+
+    def test_db_statements_and_pool_recorded(self):
+        """test that statements are timed and connections returned to the pool"""
+        engine = create_engine("sqlite://")
+        metrics.instrument_engine(engine, "test")
+        with engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+            self.assertEqual(REGISTRY.get_sample_value(
+                "db_pool_connections", {"db": "test", "state": "checked_out"}), 1)
+        self.assertEqual(REGISTRY.get_sample_value(
+            "db_query_duration_seconds_count", {"db": "test", "operation": "SELECT"}), 1)
+        self.assertEqual(REGISTRY.get_sample_value(
+            "db_pool_connections", {"db": "test", "state": "checked_out"}), 0)
+
+    def test_db_error_counted(self):
+        """test that failing statements are counted"""
+        engine = create_engine("sqlite://")
+        metrics.instrument_engine(engine, "errors")
+        with engine.connect() as conn:
+            with self.assertRaises(OperationalError):
+                conn.exec_driver_sql("SELECT * FROM missing")
+        self.assertEqual(REGISTRY.get_sample_value(
+            "db_query_errors_total", {"db": "errors", "operation": "SELECT"}), 1)
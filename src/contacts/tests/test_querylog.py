@@ -0,0 +1,62 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests of how contacts sets up the querylog module. The module itself is
+tested with the userservice copy, kept identical by src/shared/sync.py.
+"""
+
+import unittest
+from unittest.mock import patch, mock_open
+
+from sqlalchemy import create_engine
+
+from contacts.contacts import create_app
+
+
+class TestQueryStatsEndpoint(unittest.TestCase):
+    """
+    Test cases for /admin/queries
+    """
+
+    def create_test_app(self, admin_token):
+        """Create the app with mocked files and database"""
+        environ = {"VERSION": "1", "ENABLE_TRACING": "false", "ADMIN_TOKEN": admin_token}
+        with patch("contacts.contacts.open", mock_open(read_data="foo")), \
+                patch("os.environ", environ), \
+                patch("contacts.contacts.ContactsDb") as mock_db:
+            test_app = create_app().test_client()
+        query_log = mock_db.call_args[0][2]
+        query_log.instrument(create_engine("sqlite://"), "contacts")
+        return test_app, query_log
+
+    def test_disabled_without_admin_token_404(self):
+        """test that /admin/queries is only served with an admin token"""
+        test_app, _ = self.create_test_app("")
+        self.assertEqual(test_app.get("/admin/queries").status_code, 404)
+
+    def test_invalid_admin_token_401(self):
+        """test that /admin/queries rejects a wrong token"""
+        test_app, _ = self.create_test_app("admin")
+        response = test_app.get("/admin/queries", headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_stats_served(self):
+        """test that /admin/queries serves the stats of the query log"""
+        test_app, query_log = self.create_test_app("admin")
+        with patch.object(query_log, "stats", return_value=[{"calls": 1}]):
+            response = test_app.get("/admin/queries",
+                                    headers={"Authorization": "Bearer admin"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [{"calls": 1}])
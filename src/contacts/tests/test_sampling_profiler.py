@@ -0,0 +1,87 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests of how contacts sets up the sampling_profiler module. The module
+itself is tested with the userservice copy, kept identical by
+src/shared/sync.py.
+"""
+
+import os
+import time
+import unittest
+from unittest.mock import patch, mock_open
+
+from contacts.contacts import create_app, sampling_profiler
+
+SECRET = "profiling-secret"
+
+
+def create_test_app(environ):
+    """Create the app with mocked files and database"""
+    environ = dict(environ, VERSION="1", ENABLE_TRACING="false")
+    with patch("contacts.contacts.open", mock_open(read_data="foo")), \
+            patch("os.environ", environ), \
+            patch("contacts.contacts.ContactsDb"):
+        return create_app().test_client()
+
+
+class TestProfilingApp(unittest.TestCase):
+    """
+    Test cases for the profiling hooks of the app
+    """
+
+    def test_debug_profile_disabled_by_default_404(self):
+        """test that /debug/profile is only served with a secret"""
+        response = create_test_app({}).get("/debug/profile")
+        self.assertEqual(response.status_code, 404)
+
+    def test_debug_profile_requires_secret_401(self):
+        """test that /debug/profile rejects a wrong token"""
+        response = create_test_app({"PROFILE_SECRET": SECRET}).get(
+            "/debug/profile", headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_signed_request_profiled(self):
+        """test that only the request with a signed header is profiled"""
+        test_app = create_test_app({"PROFILE_SECRET": SECRET})
+        with patch.object(sampling_profiler.SamplingProfiler, "start") as start, \
+                patch.object(sampling_profiler.SamplingProfiler, "stop") as stop:
+            test_app.get("/ready")
+            test_app.get("/ready", headers={
+                "X-Profile": sampling_profiler.sign(SECRET, time.time() + 60)})
+            test_app.get("/ready", headers={
+                "X-Profile": sampling_profiler.sign("other", time.time() + 60)})
+        start.assert_called_once_with("GET /ready")
+        stop.assert_called_once_with()
+
+    def test_sample_rate_profiles_all_requests(self):
+        """test that every request is profiled at a sample rate of 1"""
+        test_app = create_test_app({"PROFILE_SAMPLE_RATE": "1"})
+        with patch.object(sampling_profiler.SamplingProfiler, "start") as start:
+            test_app.get("/ready")
+            test_app.get("/version")
+        self.assertEqual(start.call_count, 2)
+
+    def test_debug_profile_serves_collapsed_stacks(self):
+        """test that /debug/profile serves the samples of this worker"""
+        test_app = create_test_app({"PROFILE_SECRET": SECRET})
+        with patch.object(sampling_profiler.SamplingProfiler, "collapsed",
+                          return_value="GET /ready;main (a.py:1) 3\n") as collapsed:
+            response = test_app.get("/debug/profile?route=GET /ready",
+                                    headers={"Authorization": "Bearer " + SECRET})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(as_text=True), "GET /ready;main (a.py:1) 3\n")
+        self.assertEqual(response.headers["X-Profile-Pid"], str(os.getpid()))
+        collapsed.assert_called_once_with("GET /ready")
@@ -0,0 +1,164 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+assets serves static files under content-hashed URLs that can be cached
+for a year, and serves their precompressed copies to clients that accept
+them
+
+The compressed copies are built next to the files when the image is built:
+
+Usage: python assets.py [DIRECTORY ...]
+"""
+
+import hashlib
+import mimetypes
+import os
+import sys
+
+from flask import request, send_from_directory, url_for
+
+from response_compression import COMPRESSIBLE_MIMETYPES, ENCODINGS, choose_encoding, compress
+
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+DIGEST_LENGTH = 10
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def walk(directory):
+    """Return the paths of the files in directory, relative to it and
+    /-separated, without the compressed copies."""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(tuple(SUFFIXES.values())):
+                path = os.path.relpath(os.path.join(root, name), directory)
+                paths.append(path.replace(os.sep, '/'))
+    return sorted(paths)
+
+
+def manifest(directory):
+    """Return {path: digest of its content} for the files in directory."""
+    digests = {}
+    for path in walk(directory):
+        with open(os.path.join(directory, path), 'rb') as file:
+            digests[path] = hashlib.sha256(file.read()).hexdigest()[:DIGEST_LENGTH]
+    return digests
+
+
+def hashed_name(path, digest):
+    """Return path with digest before its extension, e.g. styles/cymbal.<digest>.css"""
+    root, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(root, digest, ext)
+
+
+def split_hashed_name(path):
+    """Return the (path, digest) of a hashed name, the digest None if there is none."""
+    root, ext = os.path.splitext(path)
+    base, dot, digest = root.rpartition('.')
+    if not dot or len(digest) != DIGEST_LENGTH:
+        return path, None
+    return base + ext, digest
+
+
+def precompressed(directory, paths):
+    """Return {path: encodings} of the compressed copies of paths that are
+    at least as recent as the file."""
+    variants = {}
+    for path in paths:
+        full_path = os.path.join(directory, path)
+        encodings = tuple(
+            encoding for encoding in ENCODINGS
+            if os.path.isfile(full_path + SUFFIXES[encoding])
+            and os.path.getmtime(full_path + SUFFIXES[encoding]) >= os.path.getmtime(full_path))
+        if encodings:
+            variants[path] = encodings
+    return variants
+
+
+def build(directory, level=9):
+    """Write a compressed copy of every compressible file in directory,
+    in each encoding in which it is smaller.
+
+    Return: the number of copies written
+    """
+    written = 0
+    for path in walk(directory):
+        if mimetypes.guess_type(path)[0] not in COMPRESSIBLE_MIMETYPES:
+            continue
+        full_path = os.path.join(directory, path)
+        with open(full_path, 'rb') as file:
+            data = file.read()
+        for encoding in ENCODINGS:
+            compressed = compress(data, encoding, level)
+            if len(compressed) < len(data):
+                with open(full_path + SUFFIXES[encoding], 'wb') as file:
+                    file.write(compressed)
+                written += 1
+    return written
+
+
+def init_app(app):
+    """Serve the static files of app under the hashed URLs that the
+    static_url(path) template function returns.
+
+    Return: the digests of the static files
+    """
+    directory = app.static_folder
+    digests = manifest(directory)
+    variants = precompressed(directory, digests)
+
+    def static_url(path):
+        """Return the URL of a static file, hashed if it exists."""
+        digest = digests.get(path)
+        return url_for('static', filename=hashed_name(path, digest) if digest else path)
+
+    def static(filename):
+        """Static file endpoint, replacing Flask's."""
+        path, digest = split_hashed_name(filename)
+        immutable = digest is not None and digests.get(path) == digest
+        if not immutable:
+            path = filename
+        encoding = choose_encoding(request.accept_encodings, variants.get(path, ()))
+        if encoding is None:
+            response = send_from_directory(directory, path, etag=True)
+        else:
+            response = send_from_directory(directory, path + SUFFIXES[encoding], etag=True,
+                                           mimetype=mimetypes.guess_type(path)[0],
+                                           download_name=os.path.basename(path))
+            response.headers['Content-Encoding'] = encoding
+        if path in variants:
+            response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+    app.jinja_env.globals.update(static_url=static_url)
+    return digests
+
+
+def main(argv):
+    """Build the compressed copies of the files in the directories of argv."""
+    for directory in argv or ['static']:
+        written = build(directory)
+        sys.stdout.write('Wrote {} compressed files in {}\n'.format(written, directory))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
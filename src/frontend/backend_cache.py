@@ -0,0 +1,160 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+backend_cache keeps local copies of backend data to save backend calls
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ConditionalCache:
+    """
+    ConditionalCache keeps the last parsed response of each URL with its
+    ETag, in process and for at most max_entries URLs, so that the URL
+    can be revalidated with If-None-Match instead of fetched again.
+
+    Cached values are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Return the (etag, value) cached for url, or None."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+        return entry
+
+    def put(self, url, etag, value):
+        """Cache value under url if it has an etag, evicting the least
+        recently used URL over capacity."""
+        with self._lock:
+            self._entries.pop(url, None)
+            if etag is None or self.max_entries <= 0:
+                return
+            self._entries[url] = (etag, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class BalanceCache:
+    """
+    BalanceCache keeps the balance of each account, for at most
+    max_entries accounts, and serves it for ttl seconds after it is
+    fetched.
+
+    The account's own transactions are recorded by uuid as they are
+    committed, with the id the ledger gave them, and added to its balance
+    until balancereader shows them: until it reports a ledger position at
+    or past their id. Other transactions moving the balance meanwhile,
+    such as a payment from another account, do not affect them.
+    Transactions are no longer added settle seconds after they were
+    recorded, whatever the ledger shows.
+    """
+
+    def __init__(self, ttl=5, max_entries=10000, settle=60, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.settle = settle
+        self._clock = clock
+        # account: [fetched balance or None, fetched at, ledger position or None,
+        #           {uuid: (amount, transaction id, recorded at)}]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, account_id):
+        """Return the balance of account_id with the transactions the
+        ledger does not show yet, or None if it was not fetched within
+        ttl seconds."""
+        with self._lock:
+            entry = self._entries.get(account_id)
+            now = self._clock()
+            if entry is None or entry[0] is None or entry[1] + self.ttl <= now:
+                return None
+            self._expire_pending(entry, now)
+            self._entries.move_to_end(account_id)
+            return entry[0] + _pending_sum(entry)
+
+    def put(self, account_id, balance, position=None):
+        """Cache a fetched balance, dropping the account's recorded
+        transactions that it shows.
+
+        Params: position - the id of the latest ledger transaction the
+                           balance shows, or None if balancereader did not
+                           say, in which case it is taken to show them all
+
+        Return: the balance with the transactions the ledger does not
+                show yet
+        """
+        if self.max_entries <= 0:
+            return balance
+        with self._lock:
+            now = self._clock()
+            entry = self._entry(account_id)
+            self._expire_pending(entry, now)
+            pending = entry[3]
+            for uuid, (_, transaction_id, _) in list(pending.items()):
+                if position is None or transaction_id <= position:
+                    del pending[uuid]
+            entry[0] = balance
+            entry[1] = now
+            entry[2] = position
+            return balance + _pending_sum(entry)
+
+    def apply(self, account_id, uuid, amount, transaction_id=None):
+        """Record a committed transaction of account_id, once per uuid.
+
+        Params: amount - the change of the balance in cents, negative for debits
+                transaction_id - the id the ledger gave the transaction, or
+                                 None if it is unknown, in which case the
+                                 cached balance is dropped instead
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            entry = self._entry(account_id)
+            if transaction_id is None:
+                # cannot tell when the ledger shows it: fetch the balance again
+                entry[0] = None
+            elif entry[2] is None or transaction_id > entry[2]:
+                entry[3].setdefault(uuid, (amount, transaction_id, self._clock()))
+
+    def _entry(self, account_id):
+        """Return the entry of account_id, creating it and evicting the
+        least recently used account over capacity."""
+        entry = self._entries.get(account_id)
+        if entry is None:
+            entry = self._entries[account_id] = [None, None, None, OrderedDict()]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(account_id)
+        return entry
+
+    def _expire_pending(self, entry, now):
+        """Stop adding the transactions recorded over settle seconds ago."""
+        pending = entry[3]
+        while pending and next(iter(pending.values()))[2] + self.settle <= now:
+            pending.popitem(last=False)
+
+
+def _pending_sum(entry):
+    """Return the sum of the amounts of the recorded transactions of entry."""
+    return sum(amount for amount, _, _ in entry[3].values())
@@ -0,0 +1,331 @@
+#!/usr/bin/python
+#
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Benchmarks the frontend in isolation, against stand-in backends
+
+Starts the stand-ins and a gunicorn frontend pointed at them, drives
+/home and /payment with concurrent clients, and reports the latency of
+each and the overhead of the frontend itself: its latency minus the
+time the stand-ins spent serving it.
+
+Usage: python harness.py [--duration SECONDS] [--concurrency N]
+                         [--latency ROUTE=SPEC] ... [--report FILE]
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import jwt
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import standins
+
+FRONTEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERCENTILES = (('p50', 50), ('p90', 90), ('p99', 99), ('p99.9', 99.9))
+TOKEN_LIFETIME = 3600
+
+
+def run_standins(latencies, error_rates, sizes, seed, addresses):
+    """Child process entry point serving the stand-ins."""
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    standins.serve(standins.parse_behaviors(latencies, error_rates, sizes),
+                   seed, on_ready=addresses.put)
+
+
+def free_port():
+    """Return a TCP port that is free on the loopback interface."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, process, timeout):
+    """Poll url until it answers 200.
+
+    Raises: RuntimeError if process exits or timeout seconds pass first
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('frontend exited with status {}'.format(process.returncode))
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('frontend not ready after {}s'.format(timeout))
+
+
+class TokenMinter:
+    """
+    TokenMinter signs JWTs the way userservice does, with a fresh
+    RSA key whose public half the frontend is given.
+    """
+
+    def __init__(self, directory):
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.public_key_path = os.path.join(directory, 'jwtRS256.key.pub')
+        with open(self.public_key_path, 'wb') as file:
+            file.write(self._key.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo))
+
+    def mint(self, username, account_id):
+        """Return a request id and a token that carries it."""
+        request_id = uuid.uuid4().hex
+        now = int(time.time())
+        token = jwt.encode({'user': username,
+                            'acct': account_id,
+                            'name': username,
+                            'iat': now,
+                            'exp': now + TOKEN_LIFETIME,
+                            'jti': request_id},
+                           self._key, algorithm='RS256')
+        return request_id, token
+
+
+class Client(threading.Thread):
+    """
+    Client sends requests back to back until the deadline, each with a
+    freshly minted token so that the stand-in time can be attributed.
+    Requests completed before the warmup ends are not recorded.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, index, url, minter, payment_share, warmup_end, deadline):
+        super().__init__(daemon=True)
+        self.url = url
+        self.minter = minter
+        self.payment_share = payment_share
+        self.warmup_end = warmup_end
+        self.deadline = deadline
+        self.rng = random.Random(index)
+        self.username = 'bench{}'.format(index)
+        self.account_id = '{:010d}'.format(1000000000 + index)
+        self.samples = []
+
+    def run(self):
+        session = requests.Session()
+        while time.monotonic() < self.deadline:
+            request_id, token = self.minter.mint(self.username, self.account_id)
+            session.cookies.set('token', token)
+            if self.rng.random() < self.payment_share:
+                endpoint, send = 'POST /payment', self.pay
+            else:
+                endpoint, send = 'GET /home', self.home
+            start = time.monotonic()
+            try:
+                ok = send(session)
+            except requests.exceptions.RequestException:
+                ok = False
+            end = time.monotonic()
+            if start >= self.warmup_end and end <= self.deadline:
+                self.samples.append((endpoint, request_id, end - start, ok))
+
+    def home(self, session):
+        """Render the home page."""
+        response = session.get(self.url + '/home', allow_redirects=False, timeout=30)
+        return response.status_code == 200
+
+    def pay(self, session):
+        """Submit a payment to a random account."""
+        response = session.post(self.url + '/payment', allow_redirects=False, timeout=30,
+                                data={'account_num': '{:010d}'.format(
+                                          self.rng.randrange(10**9, 10**10)),
+                                      'amount': '{:.2f}'.format(self.rng.uniform(1, 100)),
+                                      'uuid': str(uuid.uuid4())})
+        return response.status_code == 303 and \
+            'failed' not in response.headers.get('Location', '')
+
+
+def percentile(ordered, percent):
+    """Return the nearest-rank percentile of a sorted list, or 0 if empty."""
+    if not ordered:
+        return 0
+    rank = max(int(-(-len(ordered) * percent // 100)), 1)
+    return ordered[rank - 1]
+
+
+def distribution(values):
+    """Summarize values in seconds as milliseconds."""
+    ordered = sorted(values)
+    summary = {'mean': round(1000 * sum(ordered) / len(ordered), 3) if ordered else 0}
+    for label, percent in PERCENTILES:
+        summary[label] = round(1000 * percentile(ordered, percent), 3)
+    summary['max'] = round(1000 * ordered[-1], 3) if ordered else 0
+    return summary
+
+
+def summarize(samples, delays, window):
+    """Summarize the samples of every endpoint and in total.
+
+    Params: samples - (endpoint, request id, latency, ok) tuples
+            delays - stand-in service time by request id
+            window - measured seconds
+    """
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+    groups['total'] = samples
+    report = {}
+    for endpoint, group in sorted(groups.items()):
+        errors = sum(1 for sample in group if not sample[3])
+        report[endpoint] = {
+            'requests': len(group),
+            'errors': errors,
+            'error_rate': errors / len(group) if group else 0,
+            'throughput': len(group) / window,
+            'latency_ms': distribution([sample[2] for sample in group]),
+            'backend_ms': distribution([delays.get(sample[1], 0) for sample in group]),
+            'overhead_ms': distribution([max(sample[2] - delays.get(sample[1], 0), 0)
+                                         for sample in group])}
+    return report
+
+
+def print_summary(report, stream=sys.stdout):
+    """Print latency and overhead tables of a report."""
+    columns = ['mean'] + [label for label, _ in PERCENTILES] + ['max']
+    for metric in ('latency_ms', 'backend_ms', 'overhead_ms'):
+        stream.write('\n{:<16}{:>9}{:>9}'.format(metric, 'requests', 'errors')
+                     + ''.join('{:>9}'.format(c) for c in columns) + '\n')
+        for endpoint, entry in report['endpoints'].items():
+            stream.write('{:<16}{:>9}{:>9}'.format(endpoint, entry['requests'], entry['errors'])
+                         + ''.join('{:>9.1f}'.format(entry[metric][c]) for c in columns)
+                         + '\n')
+
+
+def benchmark(args):
+    """Run the benchmark and return its report."""
+    addresses = multiprocessing.Queue()
+    backend = multiprocessing.Process(
+        target=run_standins, daemon=True,
+        args=(args.latency, args.error_rate, args.size, args.seed, addresses))
+    backend.start()
+    frontend = None
+    try:
+        standin_address = addresses.get(timeout=30)
+        with tempfile.TemporaryDirectory() as directory:
+            minter = TokenMinter(directory)
+            port = free_port()
+            env = dict(os.environ,
+                       ENABLE_TRACING='false',
+                       PUB_KEY_PATH=minter.public_key_path,
+                       LOCAL_ROUTING_NUM=standins.LOCAL_ROUTING_NUM,
+                       TRANSACTIONS_API_ADDR=standin_address,
+                       BALANCES_API_ADDR=standin_address,
+                       HISTORY_API_ADDR=standin_address,
+                       CONTACTS_API_ADDR=standin_address,
+                       USERSERVICE_API_ADDR=standin_address)
+            frontend = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-b', '127.0.0.1:{}'.format(port),
+                 '--workers', str(args.workers), '--threads', str(args.threads),
+                 '--log-level', args.log_level, 'frontend:create_app()'],
+                cwd=FRONTEND_DIR, env=env)
+            url = 'http://127.0.0.1:{}'.format(port)
+            wait_ready(url + '/ready', frontend, args.startup_timeout)
+
+            logging.info('Driving %s with %d clients for %ss (warmup %ss).',
+                         url, args.concurrency, args.duration, args.warmup)
+            now = time.monotonic()
+            clients = [Client(index, url, minter, args.payment_share,
+                              now + args.warmup, now + args.duration)
+                       for index in range(args.concurrency)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            delays = requests.get('http://{}/delays'.format(standin_address), timeout=30).json()
+            backend_stats = requests.get('http://{}/stats'.format(standin_address),
+                                         timeout=30).json()
+    finally:
+        if frontend is not None:
+            frontend.terminate()
+            frontend.wait()
+        backend.terminate()
+
+    samples = [sample for client in clients for sample in client.samples]
+    summary = summarize(samples, delays, args.duration - args.warmup)
+    return {'config': {'duration': args.duration,
+                       'warmup': args.warmup,
+                       'concurrency': args.concurrency,
+                       'payment_share': args.payment_share,
+                       'workers': args.workers,
+                       'threads': args.threads},
+            'backends': backend_stats,
+            'endpoints': summary}
+
+
+def parse_args(argv):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--duration', type=float, default=30,
+                        help='test duration in seconds (default: %(default)s)')
+    parser.add_argument('--warmup', type=float, default=5,
+                        help='seconds at the start excluded from the report '
+                             '(default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='concurrent clients (default: %(default)s)')
+    parser.add_argument('--payment-share', type=float, default=0.2,
+                        help='fraction of requests that are payments (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='gunicorn worker processes (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='gunicorn threads per worker (default: %(default)s)')
+    parser.add_argument('--log-level', default='warning',
+                        help='frontend log level (default: %(default)s)')
+    parser.add_argument('--startup-timeout', type=float, default=60,
+                        help='seconds to wait for the frontend to start (default: %(default)s)')
+    parser.add_argument('--report', help='write the JSON report to this file')
+    standins.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.warmup >= args.duration:
+        parser.error('--warmup must be shorter than --duration')
+    try:
+        standins.parse_behaviors(args.latency, args.error_rate, args.size)
+    except ValueError as err:
+        parser.error(str(err))
+    return args
+
+
+def main(argv):
+    """Benchmark the frontend."""
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args(argv)
+    report = benchmark(args)
+    if args.report:
+        with open(args.report, 'w') as stream:
+            json.dump(report, stream, indent=2)
+    print_summary(report)
+    return 0 if report['endpoints'].get('total', {}).get('requests') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
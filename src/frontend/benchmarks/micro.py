@@ -0,0 +1,131 @@
+#!/usr/bin/python
+#
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Micro-benchmarks of the per-request work of the frontend, run by
+extras/microbench/microbench.py
+"""
+
+import copy
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import render_template
+
+from frontend import create_app
+from standins import LOCAL_ROUTING_NUM, make_contacts, make_history
+
+ACCOUNT_ID = '1011226111'
+HISTORY_SIZE = 100
+CONTACTS_SIZE = 20
+# history and contacts responses parsed by home()
+PAYLOAD_SIZES = (100, 1000)
+HISTORY_START = datetime.datetime(2022, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+def closure(function, name):
+    """Return the variable name that function closes over, such as a
+    helper defined inside create_app."""
+    cells = dict(zip(function.__code__.co_freevars, function.__closure__ or ()))
+    return cells[name].cell_contents
+
+
+def cases():
+    """Build the fixtures and return the benchmarks."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with tempfile.TemporaryDirectory() as directory:
+        public_key_path = os.path.join(directory, 'jwtRS256.key.pub')
+        with open(public_key_path, 'wb') as file:
+            file.write(key.public_key().public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+        # run with ENABLE_TRACING=true to measure the tracing overhead
+        os.environ.setdefault('ENABLE_TRACING', 'false')
+        os.environ.setdefault('TRACE_EXPORTER', 'none')
+        os.environ.setdefault('POD_NAMESPACE', 'microbench')
+        os.environ.update({'PUB_KEY_PATH': public_key_path,
+                           'LOCAL_ROUTING_NUM': LOCAL_ROUTING_NUM})
+        app = create_app()
+
+    now = int(time.time())
+    token = jwt.encode({'user': 'testuser', 'acct': ACCOUNT_ID, 'name': 'Test User',
+                        'iat': now, 'exp': now + 10**6}, key, algorithm='RS256')
+    rng = random.Random(0)
+    history = make_history(ACCOUNT_ID, HISTORY_SIZE, rng, HISTORY_START)
+    contacts = make_contacts(CONTACTS_SIZE, rng)
+    # a quarter of the transactions are with contacts
+    for transaction in history[::4]:
+        counterpart = rng.choice(contacts)['account_num']
+        if transaction['toAccountNum'] == ACCOUNT_ID:
+            transaction['fromAccountNum'] = counterpart
+        else:
+            transaction['toAccountNum'] = counterpart
+
+    home = app.view_functions['home']
+    verify_token = closure(home, 'verify_token')
+    decode_token = closure(home, 'decode_token')
+    populate_contact_labels = closure(home, '_populate_contact_labels')
+    format_currency = app.jinja_env.globals['format_currency']
+    format_timestamp_day = app.jinja_env.globals['format_timestamp_day']
+    format_timestamp_month = app.jinja_env.globals['format_timestamp_month']
+    # run with JSON_LIBRARY=json to compare with the standard library
+    json_provider = closure(closure(home, '_home_etag'), 'json_provider')
+    timestamp = history[0]['timestamp']
+
+    labelled_history = copy.deepcopy(history)
+    populate_contact_labels(ACCOUNT_ID, labelled_history, contacts)
+    # whole requests, through the Flask and Jinja2 instrumentation when
+    # tracing is enabled
+    client = app.test_client()
+
+    context = app.test_request_context('/home')
+    context.push()
+
+    def render_index():
+        render_template('index.html',
+                        cluster_name='cluster', pod_name='pod', pod_zone='zone',
+                        pod_region='region', pod_group='group', pod_namespace='default',
+                        circleci_logo='false', history=labelled_history,
+                        balance=123456789, name='Test User', account_id=ACCOUNT_ID,
+                        contacts=contacts, message=None, pending_transaction=None,
+                        bank_name='CCI Bank Corp')
+
+    benchmarks = {
+        'verify_token': lambda: verify_token(token),
+        'decode_token': lambda: decode_token(token),
+        'populate_contact_labels': lambda: populate_contact_labels(
+            ACCOUNT_ID, history, contacts),
+        'format_currency': lambda: format_currency(-123456789),
+        'format_timestamp_day': lambda: format_timestamp_day(timestamp),
+        'format_timestamp_month': lambda: format_timestamp_month(timestamp),
+        'render_index': render_index,
+        'ready_request': lambda: client.get('/ready'),
+        'login_page_request': lambda: client.get('/login'),
+    }
+    for size in PAYLOAD_SIZES:
+        history_body = json.dumps(
+            make_history(ACCOUNT_ID, size, rng, HISTORY_START)).encode('utf-8')
+        contacts_body = json.dumps(make_contacts(size, rng)).encode('utf-8')
+        benchmarks['parse_history_{}'.format(size)] = (
+            lambda body=history_body: json_provider.loads(body))
+        benchmarks['parse_contacts_{}'.format(size)] = (
+            lambda body=contacts_body: json_provider.loads(body))
+    return benchmarks
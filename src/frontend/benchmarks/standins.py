@@ -0,0 +1,325 @@
+#!/usr/bin/python
+#
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+standins serves the HTTP contracts of the balancereader, transactionhistory,
+ledgerwriter and contacts services with programmable latency, errors and
+response sizes, so that the frontend can be benchmarked without its
+backends.
+
+Usage: python standins.py [--port PORT] [--latency ROUTE=SPEC] ...
+"""
+
+import argparse
+import collections
+import datetime
+import math
+import random
+import threading
+import time
+
+import jwt
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+ROUTES = ('balances', 'history', 'ledger', 'contacts')
+LOCAL_ROUTING_NUM = '883745000'
+
+
+class Latency:
+    """
+    Latency draws service times, in seconds, from a distribution given
+    as a spec string:
+    - 'fixed:MS'
+    - 'uniform:MIN_MS:MAX_MS'
+    - 'lognormal:MEDIAN_MS:P99_MS'
+    """
+
+    def __init__(self, spec):
+        kind, *params = spec.split(':')
+        try:
+            params = [float(p) / 1000 for p in params]
+        except ValueError as err:
+            raise ValueError('invalid latency spec {}'.format(spec)) from err
+        if kind == 'fixed' and len(params) == 1:
+            self._draw = lambda rng: params[0]
+        elif kind == 'uniform' and len(params) == 2:
+            self._draw = lambda rng: rng.uniform(*params)
+        elif kind == 'lognormal' and len(params) == 2 and 0 < params[0] <= params[1]:
+            # 2.326 is the z-score of the 99th percentile
+            mu, sigma = math.log(params[0]), math.log(params[1] / params[0]) / 2.326
+            self._draw = lambda rng: rng.lognormvariate(mu, sigma)
+        else:
+            raise ValueError('invalid latency spec {}'.format(spec))
+        self.spec = spec
+
+    def draw(self, rng):
+        """Return a service time in seconds."""
+        return max(self._draw(rng), 0)
+
+
+class Behavior:
+    """
+    Behavior of one stand-in route: its latency, error rate and response
+    size, and statistics of the requests served so far.
+    """
+
+    def __init__(self, latency='fixed:0', error_rate=0.0, size=0):
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self.size = size
+        self.requests = 0
+        self.errors = 0
+        self.delay = 0.0
+        self._lock = threading.Lock()
+
+    def serve(self, rng):
+        """Sleep for a drawn service time.
+
+        Return: the service time, and True if the request should fail
+        """
+        delay = self.latency.draw(rng)
+        failed = rng.random() < self.error_rate
+        time.sleep(delay)
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+            self.delay += delay
+        return delay, failed
+
+    def stats(self):
+        """Return the statistics of the requests served so far."""
+        with self._lock:
+            return {'latency': self.latency.spec,
+                    'error_rate': self.error_rate,
+                    'size': self.size,
+                    'requests': self.requests,
+                    'errors': self.errors,
+                    'mean_delay_ms': 1000 * self.delay / self.requests if self.requests else 0}
+
+
+class DelayLog:
+    """
+    DelayLog sums the service time spent on behalf of each request id,
+    the "jti" claim of the bearer token. A harness minting one token per
+    frontend request can then subtract the backend time from the latency
+    it measures.
+    """
+
+    def __init__(self):
+        self._delays = {}
+        self._lock = threading.Lock()
+
+    def record(self, request_id, delay):
+        """Add delay seconds to the service time of request_id."""
+        with self._lock:
+            self._delays[request_id] = self._delays.get(request_id, 0) + delay
+
+    def drain(self):
+        """Return and forget the service time of every request id."""
+        with self._lock:
+            delays, self._delays = self._delays, {}
+        return delays
+
+
+def make_history(account_id, size, rng, now=None):
+    """Generate size transactions of account_id, newest first, the
+    first at now (default: the current time)."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    history = []
+    for i in range(size):
+        other = '{:010d}'.format(rng.randrange(10**9, 10**10))
+        incoming = rng.random() < 0.3
+        timestamp = now - datetime.timedelta(hours=6 * i)
+        history.append({
+            # ledger ids grow with time
+            'transactionId': size - i,
+            'fromAccountNum': other if incoming else account_id,
+            'fromRoutingNum': LOCAL_ROUTING_NUM,
+            'toAccountNum': account_id if incoming else other,
+            'toRoutingNum': LOCAL_ROUTING_NUM,
+            'amount': rng.randrange(100, 100000),
+            # the format Jackson writes for java.util.Date
+            'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S.')
+                         + '{:03d}+00:00'.format(timestamp.microsecond // 1000)})
+    return history
+
+
+def make_contacts(size, rng):
+    """Generate size contacts."""
+    return [{'label': 'Contact {}'.format(i),
+             'account_num': '{:010d}'.format(rng.randrange(10**9, 10**10)),
+             'routing_num': LOCAL_ROUTING_NUM,
+             'is_external': False}
+            for i in range(size)]
+
+
+def create_app(behaviors=None, seed=None, delay_log=None):
+    """Create the stand-in app.
+
+    Params: behaviors - a dict of Behavior by route name, see ROUTES
+            seed - seed of the latency, error and response generators
+            delay_log - optional DelayLog of the service time per request id
+    """
+    app = Flask(__name__)
+    behaviors = dict({route: Behavior() for route in ROUTES}, **(behaviors or {}))
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    # contacts versions by username, bumped by each added contact
+    contacts_versions = collections.Counter()
+
+    def _serve(route):
+        """Apply the behavior of route, returning an error response or None."""
+        authorization = request.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            return 'not authorized', 401
+        with rng_lock:
+            request_rng = random.Random(rng.random())
+        delay, failed = behaviors[route].serve(request_rng)
+        if delay_log is not None:
+            try:
+                claims = jwt.decode(authorization[len('Bearer '):],
+                                    options={'verify_signature': False})
+                delay_log.record(claims['jti'], delay)
+            except (jwt.exceptions.InvalidTokenError, KeyError):
+                pass
+        if failed:
+            return 'injected error', 500
+        return None
+
+    @app.route('/ready')
+    def ready():
+        return 'ok', 200
+
+    @app.route('/stats')
+    def stats():
+        """Statistics of every route, for benchmark harnesses."""
+        return jsonify({route: behavior.stats() for route, behavior in behaviors.items()})
+
+    @app.route('/delays')
+    def delays():
+        """Service time in seconds per request id since the last call."""
+        return jsonify(delay_log.drain() if delay_log is not None else {})
+
+    @app.route('/balances/<account_id>')
+    def balances(account_id):  # pylint: disable=unused-argument
+        return _serve('balances') or jsonify(behaviors['balances'].size or 1000000)
+
+    @app.route('/transactions/<account_id>')
+    def history(account_id):
+        error = _serve('history')
+        if error:
+            return error
+        return jsonify(make_history(account_id, behaviors['history'].size,
+                                    random.Random(account_id)))
+
+    @app.route('/transactions', methods=['POST'])
+    def ledger():
+        error = _serve('ledger')
+        if error:
+            return error
+        transaction = request.get_json(silent=True) or {}
+        if any(field not in transaction for field in
+               ('fromAccountNum', 'toAccountNum', 'amount', 'uuid')):
+            return 'invalid transaction', 400
+        return 'ok', 201
+
+    @app.route('/contacts/<username>', methods=['GET'])
+    def get_contacts(username):
+        error = _serve('contacts')
+        if error:
+            return error
+        etag = str(contacts_versions[username])
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(make_contacts(behaviors['contacts'].size,
+                                             random.Random(username)))
+        response.set_etag(etag)
+        return response
+
+    @app.route('/contacts/<username>', methods=['POST'])
+    def add_contact(username):
+        error = _serve('contacts')
+        if error:
+            return error
+        contacts_versions[username] += 1
+        return {}, 201
+
+    return app
+
+
+def parse_behaviors(latencies, error_rates, sizes):
+    """Build route behaviors from ROUTE=VALUE command line settings.
+
+    Raises: ValueError if a setting is invalid
+    """
+    settings = {route: {} for route in ROUTES}
+    for values, key, convert in ((latencies, 'latency', str),
+                                 (error_rates, 'error_rate', float),
+                                 (sizes, 'size', int)):
+        for value in values or []:
+            route, _, setting = value.partition('=')
+            if route not in ROUTES:
+                raise ValueError('unknown route {}, expected one of {}'.format(
+                    route, ', '.join(ROUTES)))
+            settings[route][key] = convert(setting)
+    return {route: Behavior(**kwargs) for route, kwargs in settings.items()}
+
+
+def add_arguments(parser):
+    """Add the stand-in behavior options to an argparse parser."""
+    parser.add_argument('--latency', action='append', metavar='ROUTE=SPEC',
+                        help='latency of a route: fixed:MS, uniform:MIN:MAX or '
+                             'lognormal:MEDIAN:P99 (routes: {})'.format(', '.join(ROUTES)))
+    parser.add_argument('--error-rate', action='append', metavar='ROUTE=RATE',
+                        help='fraction of requests to a route that fail with a 500')
+    parser.add_argument('--size', action='append', metavar='ROUTE=N',
+                        help='number of transactions (history) or contacts '
+                             '(contacts) returned, or the balance (balances)')
+    parser.add_argument('--seed', type=int, help='random seed')
+
+
+def serve(behaviors, seed=None, host='127.0.0.1', port=0, on_ready=None):
+    """Serve the stand-ins, recording service time per request id,
+    until the process is terminated.
+
+    Params: on_ready - optional callback given the address being served
+    """
+    server = make_server(host, port, create_app(behaviors, seed, DelayLog()),
+                         threaded=True)
+    if on_ready is not None:
+        on_ready('{}:{}'.format(host, server.server_port))
+    server.serve_forever()
+
+
+def main():
+    """Serve the stand-ins until interrupted."""
+    parser = argparse.ArgumentParser(description='Serve backend stand-ins.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        behaviors = parse_behaviors(args.latency, args.error_rate, args.size)
+    except ValueError as err:
+        parser.error(str(err))
+    serve(behaviors, args.seed, args.host, args.port,
+          lambda address: print('Serving stand-ins on http://{}'.format(address)))
+
+
+if __name__ == '__main__':
+    main()
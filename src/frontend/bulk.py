@@ -0,0 +1,98 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+bulk parses and validates batches of payments
+"""
+
+import csv
+import io
+import json
+import re
+from decimal import Decimal, DecimalException
+
+FIELDS = ('account_num', 'amount', 'uuid')
+
+
+def parse_rows(body, fmt):
+    """Parse a batch of payments.
+
+    Params: body - the batch as text
+            fmt - 'csv' for a CSV document with a header row, or
+                  'json' for a JSON list of objects
+    Return: a list of rows as key/value dicts
+    Raises: UserWarning if the batch cannot be parsed
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(body))
+        if reader.fieldnames is None or any(f not in reader.fieldnames for f in FIELDS):
+            raise UserWarning(
+                'CSV header must contain {}'.format(', '.join(FIELDS)))
+        return list(reader)
+    try:
+        rows = json.loads(body)
+    except ValueError as err:
+        raise UserWarning('invalid JSON: {}'.format(str(err))) from err
+    if not isinstance(rows, list) or any(not isinstance(r, dict) for r in rows):
+        raise UserWarning('JSON batch must be a list of objects')
+    return rows
+
+
+def validate_rows(rows, account_id, routing_num):
+    """Validate every row of a batch before anything is submitted.
+
+    Params: rows - a list of rows as key/value dicts
+            account_id - the account the payments are sent from
+            routing_num - the local routing number
+    Return: a list of (transaction, error) tuples in row order, where
+            exactly one of transaction or error is None
+    """
+    results = []
+    seen = set()
+    for row in rows:
+        try:
+            transaction = _validate_row(row, account_id, routing_num)
+            if transaction['uuid'] in seen:
+                raise UserWarning('duplicate uuid in batch')
+            seen.add(transaction['uuid'])
+            results.append((transaction, None))
+        except UserWarning as warn:
+            results.append((None, str(warn)))
+    return results
+
+
+def _validate_row(row, account_id, routing_num):
+    """Convert a row into a ledgerwriter transaction.
+
+    Raises: UserWarning if the row is invalid
+    """
+    if any(row.get(f) in (None, '') for f in FIELDS):
+        raise UserWarning('missing required field(s)')
+    recipient = str(row['account_num']).strip()
+    if not re.match(r'\A[0-9]{10}\Z', recipient):
+        raise UserWarning('invalid account number')
+    if recipient == account_id:
+        raise UserWarning('may not send payment to yourself')
+    try:
+        amount = int(Decimal(str(row['amount']).strip()) * 100)
+    except (ValueError, OverflowError, DecimalException) as err:
+        raise UserWarning('{} is not a valid number'.format(row['amount'])) from err
+    if amount <= 0:
+        raise UserWarning('amount must be positive')
+    return {"fromAccountNum": account_id,
+            "fromRoutingNum": routing_num,
+            "toAccountNum": recipient,
+            "toRoutingNum": routing_num,
+            "amount": amount,
+            "uuid": str(row['uuid']).strip()}
@@ -31,36 +31,45 @@
 """Web service for frontend
 """
 
+import contextvars
 import datetime
+import hashlib
 import json
 import logging
 import os
 import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from decimal import Decimal, DecimalException
 import boto3
 
 import requests
 from requests.exceptions import HTTPError, RequestException
 import jwt
-from flask import Flask, abort, jsonify, make_response, redirect, \
+from flask import Flask, Response, abort, jsonify, make_response, redirect, \
     render_template, request, url_for
-
 from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.baggage.propagation import W3CBaggagePropagator
-from opentelemetry.propagators.composite import CompositePropagator
-from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
-from opentelemetry.propagators.b3 import B3MultiFormat
-
-from opentelemetry.propagate import set_global_textmap
-
-from opentelemetry.sdk.resources import SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 from opentelemetry.instrumentation.requests import RequestsInstrumentor
 from opentelemetry.instrumentation.jinja2 import Jinja2Instrumentor
 
+import assets
+from backend_cache import BalanceCache, ConditionalCache
+from bulk import parse_rows, validate_rows
+from idempotency import IdempotencyCache, load_store
+from live_updates import LiveUpdates, format_event
+import fastjson
+import metrics
+import response_compression
+import sampling_profiler
+import server_timing
+import tracing
+from transaction_queue import TransactionQueue
+
+# the backend data of the home page
+HOME_FIELDS = ('balance', 'history', 'contacts')
+# ledgerwriter's rejection of a uuid it already committed
+DUPLICATE_TRANSACTION = 'duplicate transaction uuid'
 
 # pylint: disable-msg=too-many-locals
 def create_app():
@@ -108,6 +117,9 @@ def create_app():
     def home():
         """
         Renders home page. Redirects to /login if token is not valid
+
+        The page is not rendered again for a client that has it, when the
+        backend data and the rest of the page are unchanged.
         """
         token = request.cookies.get(app.config['TOKEN_NAME'])
         if not verify_token(token):
@@ -119,62 +131,300 @@ def create_app():
                                     _scheme=app.config['SCHEME']))
         token_data = decode_token(token)
         display_name = token_data['name']
-        username = token_data['user']
         account_id = token_data['acct']
 
+        fetched = _fetch_home_data(token, token_data, HOME_FIELDS)
+        balance, transaction_list = fetched['balance'][0], fetched['history'][0]
+        contacts = fetched['contacts'][0] or []
+        # versions of the backend data the page is rendered from
+        versions = {field: version for field, (_, version) in fetched.items()
+                    if version is not None}
+
+        etag = _home_etag(versions, display_name, account_id,
+                          request.args.get('msg', None), request.args.get('pending', None))
+        if request.if_none_match.contains_weak(etag):
+            resp = make_response('', 304)
+        else:
+            with server_timing.timed('labels'):
+                _populate_contact_labels(account_id, transaction_list, contacts)
+
+            with server_timing.timed('render'):
+                resp = make_response(render_template(
+                    'index.html',
+                    cluster_name=cluster_name,
+                    pod_name=pod_name,
+                    pod_zone=pod_zone,
+                    pod_region=pod_region,
+                    pod_group=pod_group,
+                    pod_namespace=namespace,
+                    circleci_logo=os.getenv('CIRCLECI_LOGO', 'false'),
+                    history=transaction_list,
+                    balance=balance,
+                    name=display_name,
+                    account_id=account_id,
+                    contacts=contacts,
+                    message=request.args.get('msg', None),
+                    pending_transaction=request.args.get('pending', None),
+                    live_updates=app.config['LIVE_UPDATES_MAX_CONNECTIONS'] > 0,
+                    live_updates_poll_seconds=app.config['LIVE_UPDATES_HISTORY_INTERVAL'],
+                    live_updates_retry_seconds=app.config['LIVE_UPDATES_MAX_SECONDS'],
+                    bank_name=os.getenv('BANK_NAME', 'CCI Bank Corp')))
+        # the page is private and revalidated on every load
+        resp.set_etag(etag, weak=True)
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+        return resp
+
+    def _backend_version(response):
+        """Return the version of the data in a backend response: its ETag,
+        or a digest of its body if it has none."""
+        return (response.headers.get('ETag')
+                or hashlib.blake2b(response.content, digest_size=16).hexdigest())
+
+    @app.route('/api/home', methods=['GET'])
+    def api_home():
+        """
+        Returns the data of the home page as JSON: the balance, a page of
+        the transaction history with contact labels, and the contacts.
+
+        Query parameters:
+        - fields: comma-separated fields to return, of balance, history
+          and contacts (default: all)
+        - limit: the number of transactions per page
+        - before: the transactionId of the last transaction of the previous
+          page; the page starts with the next older transaction
+
+        Fails if:
+        - token is not valid
+        - a query parameter is not valid
+        """
+        token = request.cookies.get(app.config['TOKEN_NAME'])
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            token = auth_header.split(' ')[-1]
+        if not verify_token(token):
+            return abort(401)
+        token_data = decode_token(token)
+        try:
+            fields = _parse_fields(request.args.get('fields'))
+            limit = int(request.args.get('limit', app.config['HISTORY_PAGE_SIZE']))
+            if not 0 < limit <= app.config['HISTORY_MAX_PAGE_SIZE']:
+                raise ValueError('limit must be between 1 and {}'.format(
+                    app.config['HISTORY_MAX_PAGE_SIZE']))
+            before = request.args.get('before')
+            before = int(before) if before is not None else None
+        except ValueError as err:
+            return str(err), 400
+
+        # the contacts label the history, even if they are not returned
+        fetch = set(fields) | ({'contacts'} if 'history' in fields else set())
+        fetched = _fetch_home_data(token, token_data, [f for f in HOME_FIELDS if f in fetch])
+        versions = {field: version for field, (_, version) in fetched.items()
+                    if version is not None}
+        etag = _home_etag(versions, 'api', fields, limit, before)
+        if request.if_none_match.contains_weak(etag):
+            resp = make_response('', 304)
+        else:
+            result = {field: fetched[field][0] for field in fields}
+            if 'history' in fields and result['history'] is not None:
+                older = [transaction for transaction in result['history']
+                         if before is None or transaction['transactionId'] < before]
+                page = older[:limit]
+                with server_timing.timed('labels'):
+                    _populate_contact_labels(token_data['acct'], page,
+                                             fetched['contacts'][0] or [])
+                result['history'] = {
+                    'transactions': page,
+                    'next': page[-1]['transactionId'] if len(older) > limit else None}
+            failed = [field for field in fields if result[field] is None]
+            if failed:
+                # the other fields are still returned
+                result['errors'] = failed
+            resp = jsonify(result)
+        resp.set_etag(etag, weak=True)
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+        return resp
+
+    @app.route('/api/home/events', methods=['GET'])
+    def home_events():
+        """
+        Streams server-sent events to a dashboard: 'balance' events with
+        the balance when it changes, and 'transactions' events with the
+        new transactions of the history, labelled like /api/home.
+
+        Query parameters:
+        - after: the transactionId of the newest transaction the dashboard
+          shows; the newer ones are sent on the next poll of the history.
+          Without it, the transactions after that poll are sent
+
+        The stream ends when the token expires or after
+        LIVE_UPDATES_MAX_SECONDS, and the client reconnects.
+
+        Fails if:
+        - token is not valid
+        - the worker has LIVE_UPDATES_MAX_CONNECTIONS streams open
+        """
+        token = request.cookies.get(app.config['TOKEN_NAME'])
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            token = auth_header.split(' ')[-1]
+        if not verify_token(token):
+            return abort(401)
+        token_data = decode_token(token)
+        try:
+            subscription = live_updates.subscribe(
+                token_data['acct'], token, request.args.get('after', type=int))
+        except UserWarning as warn:
+            app.logger.warning('Refusing live updates: %s', str(warn))
+            return str(warn), 503, {'Retry-After': str(app.config['LIVE_UPDATES_MAX_SECONDS'])}
+        end = time.time() + app.config['LIVE_UPDATES_MAX_SECONDS']
+        if 'exp' in token_data:
+            end = min(end, token_data['exp'])
+
+        def stream():
+            try:
+                while not subscription.closed and time.time() < end:
+                    event = subscription.next_event(
+                        min(app.config['LIVE_UPDATES_HEARTBEAT'], max(end - time.time(), 0)))
+                    if event is None:
+                        # a comment, so that a closed connection is noticed
+                        yield ': keepalive\n\n'
+                    else:
+                        yield format_event(event[0], json_provider.dumps(event[1]))
+            finally:
+                live_updates.unsubscribe(subscription)
+
+        return Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def _parse_fields(value):
+        """
+        Return the fields of a comma-separated fields query parameter, in
+        HOME_FIELDS order, or all of them if value is empty.
+
+        Raise: ValueError  if a field is unknown.
+        """
+        if not value:
+            return list(HOME_FIELDS)
+        fields = set(value.split(','))
+        unknown = fields.difference(HOME_FIELDS)
+        if unknown:
+            raise ValueError('unknown fields: {}; fields are {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(HOME_FIELDS)))
+        return [field for field in HOME_FIELDS if field in fields]
+
+    def _fetch_home_data(token, token_data, fields):
+        """
+        Fetches the home page data of fields, of HOME_FIELDS, for the user
+        of token from the backends concurrently.
+
+        Return: {field: (data, version)}, both None if the data could not
+                be fetched
+        """
         hed = {'Authorization': 'Bearer ' + token}
-        # get balance
-        balance = None
+        fetches = {'balance': lambda: _get_balance(token_data['acct'], hed),
+                   'history': lambda: _get_history(token_data['acct'], hed),
+                   'contacts': lambda: _get_contacts(token_data['user'], hed)}
+        # each fetch runs in a copy of the request's context, so that it
+        # is timed and traced as part of the request
+        futures = {field: backend_executor.submit(contextvars.copy_context().run,
+                                                  fetches[field])
+                   for field in fields}
+        return {field: future.result() for field, future in futures.items()}
+
+    def _get_balance(account_id, hed):
+        """
+        Gets the balance of account_id, from the cache while it is fresh.
+
+        Return: (balance, version), the balance being its own version
+        """
+        balance = balance_cache.get(account_id)
+        if balance is None:
+            balance = _fetch_balance(account_id, hed)
+        return balance, balance
+
+    def _fetch_balance(account_id, hed):
+        """
+        Fetches the balance of account_id from balancereader and caches it.
+
+        Return: the balance with the account's own transactions that the
+                ledger does not show yet, or None if it could not be fetched
+        """
         try:
             url = '{}/{}'.format(app.config["BALANCES_URI"], account_id)
             app.logger.debug('Getting account balance.')
-            response = requests.get(
-                url=url, headers=hed, timeout=app.config['BACKEND_TIMEOUT'])
-            if response:
-                balance = response.json()
+            with server_timing.timed('balance'):
+                response = requests.get(
+                    url=url, headers=hed, timeout=app.config['BACKEND_TIMEOUT'])
+                if response:
+                    balance = json_provider.loads(response.content)
+                    position = response.headers.get('X-Ledger-Position')
+                    return balance_cache.put(
+                        account_id, balance, int(position) if position is not None else None)
         except (requests.exceptions.RequestException, ValueError) as err:
             app.logger.error('Error getting account balance: %s', str(err))
-        # get history
-        transaction_list = None
+        return None
+
+    def _get_history(account_id, hed):
+        """
+        Gets the transaction history of account_id, newest first.
+
+        Return: (transactions, version)
+        """
         try:
             url = '{}/{}'.format(app.config["HISTORY_URI"], account_id)
             app.logger.debug('Getting transaction history.')
-            response = requests.get(
-                url=url, headers=hed, timeout=app.config['BACKEND_TIMEOUT'])
-            if response:
-                transaction_list = response.json()
+            with server_timing.timed('history'):
+                response = requests.get(
+                    url=url, headers=hed, timeout=app.config['BACKEND_TIMEOUT'])
+                if response:
+                    return json_provider.loads(response.content), _backend_version(response)
         except (requests.exceptions.RequestException, ValueError) as err:
             app.logger.error('Error getting transaction history: %s', str(err))
-        # get contacts
-        contacts = []
+        return None, None
+
+    def _get_contacts(username, hed):
+        """
+        Gets the contacts of username, revalidating the local copy.
+
+        Return: (contacts, version)
+        """
         try:
             url = '{}/{}'.format(app.config["CONTACTS_URI"], username)
             app.logger.debug('Getting contacts.')
-            response = requests.get(
-                url=url, headers=hed, timeout=app.config['BACKEND_TIMEOUT'])
-            if response:
-                contacts = response.json()
+            cached = contacts_cache.get(url)
+            with server_timing.timed('contacts'):
+                response = requests.get(
+                    url=url,
+                    headers=dict(hed, **{'If-None-Match': cached[0]}) if cached else hed,
+                    timeout=app.config['BACKEND_TIMEOUT'])
+                if response.status_code == 304 and cached:
+                    version, contacts = cached
+                    return contacts, version
+                if response:
+                    contacts = json_provider.loads(response.content)
+                    contacts_cache.put(url, response.headers.get('ETag'), contacts)
+                    return contacts, _backend_version(response)
         except (requests.exceptions.RequestException, ValueError) as err:
             app.logger.error('Error getting contacts: %s', str(err))
+        return None, None
 
-        _populate_contact_labels(account_id, transaction_list, contacts)
+    def _home_etag(versions, *args):
+        """
+        Return the ETag of the home page rendered from backend data of
+        versions and the other home page arguments args.
 
-        return render_template('index.html',
-                               cluster_name=cluster_name,
-                               pod_name=pod_name,
-                               pod_zone=pod_zone,
-                               pod_region=pod_region,
-                               pod_group=pod_group,
-                               pod_namespace=namespace,
-                               circleci_logo=os.getenv(
-                                   'CIRCLECI_LOGO', 'false'),
-                               history=transaction_list,
-                               balance=balance,
-                               name=display_name,
-                               account_id=account_id,
-                               contacts=contacts,
-                               message=request.args.get('msg', None),
-                               bank_name=os.getenv('BANK_NAME', 'CCI Bank Corp'))
+        The ETag also depends on the pod the page names, the templates
+        and the static files.
+        """
+        page = [versions, args, cluster_name, pod_name, pod_zone, pod_region,
+                pod_group, namespace, os.getenv('CIRCLECI_LOGO', 'false'),
+                os.getenv('BANK_NAME', 'CCI Bank Corp'), page_files,
+                app.config['LIVE_UPDATES_MAX_CONNECTIONS'] > 0,
+                app.config['LIVE_UPDATES_HISTORY_INTERVAL'], app.config['LIVE_UPDATES_MAX_SECONDS']]
+        return hashlib.blake2b(json_provider.dumps(page, sort_keys=True).encode('utf-8'),
+                               digest_size=16).hexdigest()
 
     def _populate_contact_labels(account_id, transactions, contacts):
         """
@@ -244,7 +494,14 @@ def create_app():
                                 "toRoutingNum": app.config['LOCAL_ROUTING'],
                                 "amount": payment_amount,
                                 "uuid": request.form['uuid']}
-            _submit_transaction(transaction_data)
+            if _submit_transaction(account_id, transaction_data):
+                app.logger.info('Payment queued successfully.')
+                return redirect(code=303,
+                                location=url_for('home',
+                                                 msg='Payment pending',
+                                                 pending=transaction_data['uuid'],
+                                                 _external=True,
+                                                 _scheme=app.config['SCHEME']))
             app.logger.info('Payment initiated successfully.')
             return redirect(code=303,
                             location=url_for('home',
@@ -312,7 +569,14 @@ def create_app():
                                 "toRoutingNum": app.config['LOCAL_ROUTING'],
                                 "amount": int(Decimal(request.form['amount']) * 100),
                                 "uuid": request.form['uuid']}
-            _submit_transaction(transaction_data)
+            if _submit_transaction(account_id, transaction_data):
+                app.logger.info('Deposit queued successfully.')
+                return redirect(code=303,
+                                location=url_for('home',
+                                                 msg='Deposit pending',
+                                                 pending=transaction_data['uuid'],
+                                                 _external=True,
+                                                 _scheme=app.config['SCHEME']))
             app.logger.info('Deposit submitted successfully.')
             return redirect(code=303,
                             location=url_for('home',
@@ -335,19 +599,199 @@ def create_app():
                                 _external=True,
                                 _scheme=app.config['SCHEME']))
 
-    def _submit_transaction(transaction_data):
-        app.logger.debug('Submitting transaction.')
+    @app.route('/payments/bulk', methods=['POST'])
+    def bulk_payment():
+        """
+        Submits a batch of payments to ledgerwriter service
+
+        Accepts a CSV document with an account_num,amount,uuid header or a
+        JSON list of objects with the same fields, either as the request body
+        or as an uploaded 'file'. Every row is validated before any payment is
+        submitted. Valid rows are then submitted concurrently and one JSON
+        result line per row is streamed back as each completes.
+
+        Fails if:
+        - token is not valid
+        - the batch is over MAX_CONTENT_LENGTH bytes
+        - the batch cannot be parsed or is too large
+        """
         token = request.cookies.get(app.config['TOKEN_NAME'])
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            token = auth_header.split(' ')[-1]
+        if not verify_token(token):
+            app.logger.error(
+                'Error submitting bulk payment: user is not authenticated.')
+            return abort(401)
+        account_id = decode_token(token)['acct']
+        # uploads are limited to MAX_CONTENT_LENGTH by the form parser, raw
+        # bodies by reading at most that much
+        upload = request.files.get('file')
+        if upload is not None:
+            body = upload.read().decode('utf-8', 'replace')
+            is_csv = upload.filename.lower().endswith('.csv')
+        else:
+            body = request.stream.read(app.config['MAX_CONTENT_LENGTH'] + 1)
+            if len(body) > app.config['MAX_CONTENT_LENGTH']:
+                return abort(413)
+            body = body.decode('utf-8', 'replace')
+            is_csv = request.mimetype == 'text/csv'
+        try:
+            rows = parse_rows(body, 'csv' if is_csv else 'json')
+            if len(rows) > app.config['BULK_MAX_ROWS']:
+                raise UserWarning('batch exceeds {} rows'.format(
+                    app.config['BULK_MAX_ROWS']))
+        except UserWarning as warn:
+            app.logger.error('Error submitting bulk payment: %s', str(warn))
+            return str(warn), 400
+        validated = validate_rows(rows, account_id, app.config['LOCAL_ROUTING'])
+        app.logger.info('Submitting bulk payment of %d rows.', len(validated))
+
+        def post(transaction_data):
+            transaction_id = _post_transaction(transaction_data, token, bulk_session)
+            balance_cache.apply(account_id, transaction_data['uuid'],
+                                _balance_change(account_id, transaction_data), transaction_id)
+
+        def submit(transaction_data):
+            idempotency_cache.submit(
+                account_id,
+                transaction_data['uuid'],
+                lambda: post(transaction_data),
+                app.config['BACKEND_TIMEOUT'])
+
+        def results():
+            futures = {}
+            with ThreadPoolExecutor(app.config['BULK_CONCURRENCY']) as executor:
+                for row, (transaction_data, error) in enumerate(validated):
+                    if error is None:
+                        futures[executor.submit(submit, transaction_data)] = row
+                for row, (transaction_data, error) in enumerate(validated):
+                    if error is not None:
+                        yield _bulk_result(row, rows[row].get('uuid'), error)
+                for future in as_completed(futures):
+                    row = futures[future]
+                    try:
+                        future.result()
+                        error = None
+                    except UserWarning as warn:
+                        error = str(warn)
+                    except RequestException as err:
+                        app.logger.error('Error submitting bulk payment: %s',
+                                         str(err))
+                        error = 'ledger unavailable'
+                    yield _bulk_result(row, validated[row][0]['uuid'], error)
+
+        return Response(results(), mimetype='application/x-ndjson')
+
+    def _bulk_result(row, uuid, error):
+        """Format the result of one bulk payment row as a JSON line."""
+        result = {'row': row,
+                  'uuid': uuid,
+                  'status': 'failed' if error else 'succeeded'}
+        if error:
+            result['message'] = error
+        return json_provider.dumps(result) + '\n'
+
+    def _submit_transaction(account_id, transaction_data):
+        """
+        Submits a transaction to the ledgerwriter service once per uuid.
+
+        Duplicate submissions by the same account within the idempotency
+        window are answered with the outcome of the first submission.
+        In asynchronous mode the transaction is queued instead, and its
+        outcome is reported by /transaction-status/<uuid>.
+
+        Return: True if the transaction was queued, False if it was committed.
+        Raise: UserWarning  if the transaction was rejected.
+        """
+        token = request.cookies.get(app.config['TOKEN_NAME'])
+        attempts = 0
+
+        def post():
+            nonlocal attempts
+            attempts += 1
+            try:
+                transaction_id = _post_transaction(transaction_data, token)
+            except UserWarning as warn:
+                # a retry is rejected as a duplicate when an earlier attempt
+                # committed before its response was lost
+                if attempts == 1 or DUPLICATE_TRANSACTION not in str(warn):
+                    raise
+                transaction_id = None
+            # the account sees its own transaction before balancereader does
+            balance_cache.apply(account_id, transaction_data['uuid'],
+                                _balance_change(account_id, transaction_data), transaction_id)
+
+        def submit():
+            # run by the queue's workers in asynchronous mode
+            with server_timing.timed('ledger'):
+                idempotency_cache.submit(account_id,
+                                         transaction_data['uuid'],
+                                         post,
+                                         app.config['BACKEND_TIMEOUT'])
+
+        if not app.config['ASYNC_TRANSACTIONS']:
+            submit()
+            return False
+        transaction_queue.enqueue(
+            'status:{}:{}'.format(account_id, transaction_data['uuid']), submit)
+        return True
+
+    def _balance_change(account_id, transaction_data):
+        """
+        Return the change in cents of the balance of account_id by a
+        committed transaction: its amount, negative when it is a debit.
+        """
+        change = 0
+        if transaction_data['toAccountNum'] == account_id:
+            change += transaction_data['amount']
+        if transaction_data['fromAccountNum'] == account_id:
+            change -= transaction_data['amount']
+        return change
+
+    def _post_transaction(transaction_data, token, session=None):
+        """
+        Posts a transaction to the ledgerwriter service, optionally
+        through a pooled requests session.
+
+        Return: the id the ledger gave the transaction, or None if it did not say
+        Raise: UserWarning  if the response status is 4xx.
+               HTTPError  if the response status is 5xx.
+        """
+        app.logger.debug('Submitting transaction.')
         hed = {'Authorization': 'Bearer ' + token,
                'content-type': 'application/json'}
-        resp = requests.post(url=app.config["TRANSACTIONS_URI"],
-                             data=jsonify(transaction_data).data,
-                             headers=hed,
-                             timeout=app.config['BACKEND_TIMEOUT'])
+        resp = (session or requests).post(url=app.config["TRANSACTIONS_URI"],
+                                          data=json_provider.dumps(transaction_data),
+                                          headers=hed,
+                                          timeout=app.config['BACKEND_TIMEOUT'])
         try:
             resp.raise_for_status()  # Raise on HTTP Status code 4XX or 5XX
         except requests.exceptions.HTTPError as http_request_err:
+            if resp.status_code >= 500:
+                raise
             raise UserWarning(resp.text) from http_request_err
+        transaction_id = resp.headers.get('X-Transaction-Id')
+        return int(transaction_id) if transaction_id is not None else None
+
+    @app.route('/transaction-status/<uuid>', methods=['GET'])
+    def transaction_status(uuid):
+        """
+        Returns the status of a transaction submitted in asynchronous mode.
+
+        Fails if:
+        - token is not valid
+        - no transaction with that uuid was queued by this account
+        """
+        token = request.cookies.get(app.config['TOKEN_NAME'])
+        if not verify_token(token):
+            return abort(401)
+        account_id = decode_token(token)['acct']
+        status = transaction_queue.status(
+            'status:{}:{}'.format(account_id, uuid))
+        if status is None:
+            return abort(404)
+        return jsonify(status), 200
 
     def _add_contact(label, acct_num, routing_num, is_external_acct=False):
         """
@@ -367,10 +811,11 @@ def create_app():
         }
         token_data = decode_token(token)
         url = '{}/{}'.format(app.config["CONTACTS_URI"], token_data['user'])
-        resp = requests.post(url=url,
-                             data=jsonify(contact_data).data,
-                             headers=hed,
-                             timeout=app.config['BACKEND_TIMEOUT'])
+        with server_timing.timed('contact'):
+            resp = requests.post(url=url,
+                                 data=json_provider.dumps(contact_data),
+                                 headers=hed,
+                                 timeout=app.config['BACKEND_TIMEOUT'])
         try:
             resp.raise_for_status()  # Raise on HTTP Status code 4XX or 5XX
         except requests.exceptions.HTTPError as http_request_err:
@@ -418,14 +863,15 @@ def create_app():
     def _login_helper(username, password):
         try:
             app.logger.debug('Logging in.')
-            req = requests.get(url=app.config["LOGIN_URI"],
-                               params={'username': username,
-                                       'password': password},
-                               timeout=5)
+            with server_timing.timed('login'):
+                req = requests.get(url=app.config["LOGIN_URI"],
+                                   params={'username': username,
+                                           'password': password},
+                                   timeout=5)
             req.raise_for_status()  # Raise on HTTP Status code 4XX or 5XX
 
             # login success
-            token = req.json()['token'].encode('utf-8')
+            token = json_provider.loads(req.content)['token'].encode('utf-8')
             claims = decode_token(token)
             max_age = claims['exp'] - claims['iat']
             resp = make_response(redirect(url_for('home',
@@ -475,9 +921,10 @@ def create_app():
         try:
             # create user
             app.logger.debug('Creating new user.')
-            resp = requests.post(url=app.config["USERSERVICE_URI"],
-                                 data=request.form,
-                                 timeout=app.config['BACKEND_TIMEOUT'])
+            with server_timing.timed('signup'):
+                resp = requests.post(url=app.config["USERSERVICE_URI"],
+                                     data=request.form,
+                                     timeout=app.config['BACKEND_TIMEOUT'])
             if resp.status_code == 201:
                 # user created. Attempt login
                 app.logger.info('New user created.')
@@ -515,10 +962,11 @@ def create_app():
         if token is None:
             return False
         try:
-            jwt.decode(algorithms='RS256',
-                       jwt=token,
-                       key=app.config['PUBLIC_KEY'],
-                       options={"verify_signature": True})
+            with server_timing.timed('verify'):
+                jwt.decode(algorithms='RS256',
+                           jwt=token,
+                           key=app.config['PUBLIC_KEY'],
+                           options={"verify_signature": True})
             app.logger.debug('Token verified.')
             return True
         except jwt.exceptions.InvalidTokenError as err:
@@ -569,6 +1017,85 @@ def create_app():
     app.config['TOKEN_NAME'] = 'token'
     app.config['TIMESTAMP_FORMAT'] = '%Y-%m-%dT%H:%M:%S.%f%z'
     app.config['SCHEME'] = os.environ.get('SCHEME', 'http')
+    # duplicate transaction submissions are short-circuited within this window
+    app.config['IDEMPOTENCY_TTL'] = int(
+        os.environ.get('IDEMPOTENCY_TTL_SECONDS', '300'))
+    app.config['IDEMPOTENCY_MAX_ENTRIES'] = int(
+        os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+    idempotency_cache = IdempotencyCache(
+        load_store(os.environ.get('IDEMPOTENCY_STORE'),
+                   max_entries=app.config['IDEMPOTENCY_MAX_ENTRIES'],
+                   ttl=app.config['IDEMPOTENCY_TTL']),
+        app.logger)
+    # submit transactions from a background worker pool instead of the request
+    app.config['ASYNC_TRANSACTIONS'] = os.environ.get(
+        'ASYNC_TRANSACTIONS', 'false') == 'true'
+    transaction_queue = TransactionQueue(
+        load_store(os.environ.get('IDEMPOTENCY_STORE'),
+                   max_entries=app.config['IDEMPOTENCY_MAX_ENTRIES'],
+                   ttl=app.config['IDEMPOTENCY_TTL']),
+        workers=int(os.environ.get('TRANSACTION_WORKERS', '4')),
+        max_size=int(os.environ.get('TRANSACTION_QUEUE_SIZE', '100')),
+        retries=int(os.environ.get('TRANSACTION_RETRIES', '3')),
+        backoff=float(os.environ.get('TRANSACTION_RETRY_BACKOFF', '0.5')),
+        # only errors raised before the ledger got the transaction
+        retry_on=(requests.exceptions.ConnectionError,),
+        logger=app.logger)
+    # bulk payments are submitted concurrently over a pooled session
+    app.config['BULK_MAX_ROWS'] = int(os.environ.get('BULK_MAX_ROWS', '1000'))
+    # the largest request body of any route, bulk payments included
+    app.config['MAX_CONTENT_LENGTH'] = int(
+        os.environ.get('MAX_CONTENT_LENGTH', str(1024 * 1024)))
+    app.config['BULK_CONCURRENCY'] = int(
+        os.environ.get('BULK_CONCURRENCY', '8'))
+    bulk_session = requests.Session()
+    bulk_session.mount('http://', requests.adapters.HTTPAdapter(
+        pool_maxsize=app.config['BULK_CONCURRENCY']))
+    # the last contacts of each user, revalidated with their ETag
+    contacts_cache = ConditionalCache(int(os.environ.get('CONTACTS_CACHE_SIZE', '1000')))
+    # the balance, history and contacts of a page are fetched concurrently
+    backend_executor = ThreadPoolExecutor(
+        int(os.environ.get('BACKEND_CONCURRENCY', '12')))
+    # transactions per page of /api/home
+    app.config['HISTORY_PAGE_SIZE'] = int(os.environ.get('HISTORY_PAGE_SIZE', '20'))
+    app.config['HISTORY_MAX_PAGE_SIZE'] = int(
+        os.environ.get('HISTORY_MAX_PAGE_SIZE', '100'))
+    # dashboards are kept up to date over server-sent events. Each stream
+    # holds one of the worker's threads for its whole duration, so by default
+    # half of them stream and the rest serve requests. Dashboards that are
+    # refused a stream poll /api/home instead
+    app.config['LIVE_UPDATES_MAX_CONNECTIONS'] = int(
+        os.environ.get('LIVE_UPDATES_MAX_CONNECTIONS',
+                       max(int(os.environ.get('GUNICORN_THREADS', '4')) // 2, 1)))
+    app.config['LIVE_UPDATES_MAX_SECONDS'] = int(
+        os.environ.get('LIVE_UPDATES_MAX_SECONDS', '300'))
+    app.config['LIVE_UPDATES_HEARTBEAT'] = 15
+    app.config['LIVE_UPDATES_HISTORY_INTERVAL'] = float(
+        os.environ.get('LIVE_UPDATES_HISTORY_INTERVAL', '15'))
+    live_updates = LiveUpdates(
+        lambda account_id, token: _fetch_balance(
+            account_id, {'Authorization': 'Bearer ' + token}),
+        lambda account_id, token: _get_history(
+            account_id, {'Authorization': 'Bearer ' + token})[0],
+        label=lambda account_id, token, transactions: _populate_contact_labels(
+            account_id, transactions,
+            _get_contacts(decode_token(token)['user'],
+                          {'Authorization': 'Bearer ' + token})[0] or []),
+        balance_interval=float(os.environ.get('LIVE_UPDATES_BALANCE_INTERVAL', '5')),
+        history_interval=app.config['LIVE_UPDATES_HISTORY_INTERVAL'],
+        max_connections=app.config['LIVE_UPDATES_MAX_CONNECTIONS'],
+        logger=app.logger)
+    # balances are served from the cache for a few seconds after a fetch,
+    # with the account's own transactions added until the ledger shows them
+    balance_cache = BalanceCache(
+        ttl=float(os.environ.get('BALANCE_CACHE_TTL', '5')),
+        max_entries=int(os.environ.get('BALANCE_CACHE_SIZE', '10000')),
+        settle=float(os.environ.get('BALANCE_SETTLE_SECONDS', '60')))
+
+    # Serialize and parse JSON, including backend responses, with orjson
+    # when it is installed
+    json_provider = fastjson.load_provider(os.environ.get('JSON_LIBRARY', 'auto'))
+    fastjson.init_app(app, json_provider)
 
     # where am I? - use AWS meta IMDSv2 to hop to underlying ec2 info, needs a token auth
     pod_zone = os.getenv('POD_ZONE', 'unknown')
@@ -636,7 +1163,7 @@ def create_app():
             if tags["Key"] == 'aws:eks:cluster-name':
                 cluster_name = tags["Value"]
                 break
-    except (RequestException, HTTPError) as err:
+    except (RequestException, HTTPError, OSError) as err:
         app.logger.warning(
             "Unable to retrieve cluster name from Deployment manifest.")
 
@@ -644,6 +1171,10 @@ def create_app():
     pod_name = "unknown"
     pod_name = socket.gethostname()
 
+    # Serve static files under content-hashed URLs, precompressed
+    page_files = [assets.init_app(app),
+                  assets.manifest(os.path.join(app.root_path, app.template_folder))]
+
     # register formater functions
     app.jinja_env.globals.update(format_currency=format_currency)
     app.jinja_env.globals.update(format_timestamp_month=format_timestamp_month)
@@ -658,21 +1189,9 @@ def create_app():
     if os.environ['ENABLE_TRACING'] == "true":
         app.logger.info("✅ Tracing enabled.")
 
-        trace.set_tracer_provider(
-            TracerProvider(
-                resource=Resource.create(
-                    {SERVICE_NAME: f"{namespace}-frontend"})
-            )
-        )
+        tracing.init_tracer_provider(f"{namespace}-frontend")
         tracer = trace.get_tracer(__name__)
 
-        trace.get_tracer_provider().add_span_processor(
-            BatchSpanProcessor(OTLPSpanExporter())
-        )
-        set_global_textmap(CompositePropagator(
-            [B3MultiFormat(), TraceContextTextMapPropagator(), W3CBaggagePropagator()]))
-
-
         # Add tracing auto-instrumentation for Flask, jinja and requests
         FlaskInstrumentor().instrument_app(app)
         RequestsInstrumentor().instrument()
@@ -680,6 +1199,32 @@ def create_app():
     else:
         app.logger.info("🚫 Tracing disabled.")
 
+    # Break request handling time down in a Server-Timing header
+    if os.environ.get('SERVER_TIMING', 'true') == 'true':
+        server_timing.init_app(app, log=os.environ.get('SERVER_TIMING_LOG') == 'true')
+
+    # Compress responses with brotli or gzip
+    if os.environ.get('COMPRESSION', 'true') == 'true':
+        response_compression.init_app(
+            app, min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+            level=int(os.environ.get('COMPRESSION_LEVEL', '6')))
+
+    # Export Prometheus metrics at /metrics
+    if os.environ.get('ENABLE_METRICS') == "true":
+        metrics.init_app(app)
+        metrics.instrument_backends([app.config[name] for name in (
+            'TRANSACTIONS_URI', 'USERSERVICE_URI', 'BALANCES_URI',
+            'HISTORY_URI', 'LOGIN_URI', 'CONTACTS_URI')])
+
+    # Profile a share of the requests, and requests with a signed X-Profile header
+    profile_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    if profile_rate > 0 or os.environ.get('PROFILE_SECRET'):
+        sampling_profiler.init_app(
+            app, sample_rate=profile_rate,
+            secret=os.environ.get('PROFILE_SECRET', ''),
+            interval=float(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000,
+            directory=os.environ.get('PROFILE_DIR'))
+
     return app
 
 
@@ -0,0 +1,213 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+idempotency short-circuits duplicate transaction submissions
+"""
+
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+PENDING = 'pending'
+
+
+class LocalIdempotencyStore:
+    """
+    LocalIdempotencyStore is a bounded, in-process key/value store
+    whose entries expire after a fixed time-to-live.
+
+    Any object providing the same add/get/set/delete methods can be
+    used in its place, e.g. a store backed by a cache shared across pods.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        """Drop expired entries, then the oldest entries over capacity."""
+        while self._entries:
+            key, (expiry, _) = next(iter(self._entries.items()))
+            if expiry > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def add(self, key, value):
+        """Store value under key only if key is not already present.
+
+        Return: True if the value was stored, False otherwise
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if key in self._entries:
+                return False
+            self._entries[key] = (now + self.ttl, value)
+            self._expire(now)
+            return True
+
+    def get(self, key):
+        """Return the value stored under key, or None if absent or expired."""
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value):
+        """Store value under key, resetting its time-to-live."""
+        with self._lock:
+            now = time.monotonic()
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl, value)
+            self._expire(now)
+
+    def delete(self, key):
+        """Remove key from the store if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisIdempotencyStore:
+    """
+    RedisIdempotencyStore keeps the entries in the Redis database at
+    REDIS_URL, so that every worker and pod sees the same outcomes and
+    transaction statuses. Entries expire after ttl seconds. The number of
+    entries is bounded by the database's own memory policy rather than
+    max_entries.
+
+    Values are stored as JSON.
+    """
+
+    PREFIX = 'frontend:'
+
+    def __init__(self, max_entries=10000, ttl=300, url=None):  # pylint: disable=unused-argument
+        if redis is None:
+            raise ValueError('RedisIdempotencyStore requires the redis package')
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(
+            url or os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+
+    def add(self, key, value):
+        """Store value under key only if key is not already present.
+
+        Return: True if the value was stored, False otherwise
+        """
+        return bool(self._client.set(self.PREFIX + key, json.dumps(value),
+                                     nx=True, ex=self.ttl))
+
+    def get(self, key):
+        """Return the value stored under key, or None if absent or expired."""
+        data = self._client.get(self.PREFIX + key)
+        return json.loads(data) if data is not None else None
+
+    def set(self, key, value):
+        """Store value under key, resetting its time-to-live."""
+        self._client.set(self.PREFIX + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        """Remove key from the store if present."""
+        self._client.delete(self.PREFIX + key)
+
+
+def load_store(path, max_entries, ttl):
+    """Instantiate an idempotency store.
+
+    Params: path - optional 'module:Class' import path of a store class.
+                   Defaults to LocalIdempotencyStore if empty.
+            max_entries - the maximum number of entries to keep
+            ttl - the number of seconds an entry is kept
+    Raises: ValueError if path does not name a class
+    """
+    if not path:
+        return LocalIdempotencyStore(max_entries=max_entries, ttl=ttl)
+    try:
+        module_name, class_name = path.split(':', 1)
+        store_class = getattr(importlib.import_module(module_name), class_name)
+    except (ValueError, ImportError, AttributeError) as err:
+        raise ValueError(
+            'invalid idempotency store {}, expected module:Class'.format(path)) from err
+    return store_class(max_entries=max_entries, ttl=ttl)
+
+
+class IdempotencyCache:
+    """
+    IdempotencyCache records the outcome of each transaction submission,
+    keyed by account and transaction uuid, so that retries and double
+    submits are answered without another call to the ledger.
+    """
+
+    def __init__(self, store, logger=logging, poll_interval=0.05):
+        self.store = store
+        self.logger = logger
+        self.poll_interval = poll_interval
+
+    def submit(self, account_id, uuid, submit, timeout):
+        """Run submit() once per (account_id, uuid) within the store's TTL.
+
+        Duplicates return or raise the recorded outcome of the first call.
+        A duplicate arriving while the first call is still in flight waits
+        up to timeout seconds for that outcome.
+
+        Only successes and rejections (UserWarning) are recorded. Any other
+        error releases the key so that the client can retry.
+
+        Raises: UserWarning if the transaction was rejected
+        """
+        key = '{}:{}'.format(account_id, uuid)
+        while not self.store.add(key, PENDING):
+            outcome = self._wait(key, timeout)
+            if outcome is not None:
+                self.logger.info(
+                    'Duplicate transaction %s. Replaying outcome.', uuid)
+                self._replay(outcome)
+                return
+            # the first submission failed without an outcome; take it over
+        try:
+            submit()
+        except UserWarning as warn:
+            self.store.set(key, {'ok': False, 'msg': str(warn)})
+            raise
+        except BaseException:
+            self.store.delete(key)
+            raise
+        self.store.set(key, {'ok': True})
+
+    def _wait(self, key, timeout):
+        """Poll the store until the outcome for key has been recorded."""
+        deadline = time.monotonic() + timeout
+        outcome = self.store.get(key)
+        while outcome == PENDING and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            outcome = self.store.get(key)
+        return outcome
+
+    @staticmethod
+    def _replay(outcome):
+        """Reproduce a recorded outcome."""
+        if outcome == PENDING:
+            raise UserWarning('transaction is still being processed')
+        if not outcome['ok']:
+            raise UserWarning(outcome['msg'])
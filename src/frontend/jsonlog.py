@@ -0,0 +1,135 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+jsonlog writes log records as JSON lines from a background thread, so that
+logging never blocks the thread handling a request on stdout
+
+Both classes are set up by logging.conf, which gunicorn loads with
+--log-config.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+
+from metrics import LOG_MESSAGES_DROPPED
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a JSON object with a timestamp, severity and
+    message, and the traceback of an exception if there is one."""
+
+    def format(self, record):
+        entry = {
+            'timestamp': self.formatTime(record, self.datefmt),
+            'message': '{} | {}'.format(record.funcName, record.getMessage()),
+            'severity': record.levelname,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+
+class QueuedStreamHandler(logging.Handler):
+    """Writes records to stream from a background thread.
+
+    The logging thread only renders the message and puts the record on a
+    queue of at most maxsize records, LOG_QUEUE_SIZE by default. When the
+    queue is full the record is dropped and counted, and the number of
+    dropped records is logged once the queue has drained. Every process
+    starts its own writer thread, so the handler survives gunicorn's
+    fork of its workers.
+    """
+
+    def __init__(self, stream=None, maxsize=None):
+        super().__init__()
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.maxsize = maxsize or int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+        self.dropped = 0
+        self._reported = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            # render now, arguments may change once the request goes on
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_MESSAGES_DROPPED.inc()
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def flush(self):
+        """Wait until the queued records are written."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+            self._pid = None
+        self.target.close()
+        super().close()
+
+    def _start(self):
+        """Start the writer thread of this process."""
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.maxsize)
+            self._thread = threading.Thread(target=self._write, args=(self._queue,),
+                                            name='jsonlog', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+        atexit.register(self.close)
+
+    def _write(self, records):
+        """Write queued records until a None record."""
+        while True:
+            record = records.get()
+            try:
+                if record is None:
+                    return
+                self.target.handle(record)
+                dropped = self.dropped - self._reported
+                if dropped and records.empty():
+                    self._reported += dropped
+                    self.target.handle(logging.makeLogRecord({
+                        'name': __name__, 'levelno': logging.WARNING,
+                        'levelname': 'WARNING', 'funcName': 'emit',
+                        'msg': 'Dropped %d log messages, the log queue was full',
+                        'args': (dropped,)}))
+            finally:
+                records.task_done()
@@ -0,0 +1,231 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+live_updates polls the balance and history of the accounts with open
+dashboards, once per account whatever the number of dashboards, and
+pushes what changed to them as server-sent events
+"""
+
+import logging
+import queue
+import threading
+import time
+
+BALANCE = 'balance'
+TRANSACTIONS = 'transactions'
+
+
+def format_event(event, data):
+    """Return a server-sent event named event with the string data."""
+    lines = ['event: {}'.format(event)]
+    lines.extend('data: {}'.format(line) for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """
+    Subscription is an open stream of the events of one account. A
+    subscription whose client falls max_events behind is closed, and the
+    client is expected to reconnect.
+
+    The transactions newer than last_transaction, the newest the client
+    has, are pushed to it. Without one, the first poll of the history
+    sets it.
+    """
+
+    def __init__(self, account_id, token, last_transaction=None, max_events=100):
+        self.account_id = account_id
+        self.token = token
+        self.last_transaction = last_transaction
+        self.closed = False
+        self._events = queue.Queue(maxsize=max_events)
+
+    def push(self, event, data):
+        """Queue the event for the client, closing the subscription if
+        the client is too far behind."""
+        try:
+            self._events.put_nowait((event, data))
+        except queue.Full:
+            self.closed = True
+
+    def next_event(self, timeout):
+        """Return the next (event, data), or None if none came within
+        timeout seconds."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _Account:
+    """The polling schedule and last known state of an account."""
+
+    def __init__(self):
+        self.subscriptions = []
+        self.balance = None
+        self.balance_due = 0
+        self.history_due = 0
+
+
+class LiveUpdates:
+    """
+    LiveUpdates polls the balance of every account with a subscription
+    every balance_interval seconds and its history every history_interval
+    seconds, with the token of its latest subscription. A changed balance
+    is pushed to all the subscriptions of the account, and the transactions
+    to the subscriptions that do not have them yet.
+
+    The polling thread is started on first use so that it is created in
+    the serving process rather than in a pre-fork parent.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, fetch_balance, fetch_history, label=None,
+                 balance_interval=5, history_interval=15, max_connections=2,
+                 logger=logging, clock=time.monotonic):
+        """
+        Params: fetch_balance - (account_id, token) -> the balance, or None
+                fetch_history - (account_id, token) -> the transactions,
+                                newest first, or None
+                label - (account_id, token, transactions) labels new
+                        transactions before they are pushed. Optional
+                max_connections - the maximum number of subscriptions
+        """
+        self.fetch_balance = fetch_balance
+        self.fetch_history = fetch_history
+        self.label = label
+        self.balance_interval = balance_interval
+        self.history_interval = history_interval
+        self.max_connections = max_connections
+        self.logger = logger
+        self._clock = clock
+        self._accounts = {}
+        self._connections = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='live-updates',
+                                            daemon=True)
+            self._thread.start()
+
+    def subscribe(self, account_id, token, last_transaction=None):
+        """Open a subscription to the events of account_id. The last known
+        balance of the account is its first event.
+
+        Params: last_transaction - the transactionId of the newest transaction
+                                   the client has, None to start from the
+                                   next poll of the history
+
+        Raises: UserWarning if max_connections subscriptions are open
+        """
+        self._start()
+        subscription = Subscription(account_id, token, last_transaction)
+        with self._lock:
+            if self._connections >= self.max_connections:
+                raise UserWarning('too many live update connections, please retry')
+            self._connections += 1
+            account = self._accounts.setdefault(account_id, _Account())
+            account.subscriptions.append(subscription)
+            if account.balance is not None:
+                subscription.push(BALANCE, {'balance': account.balance})
+            # a new account is polled right away
+            self._wakeup.notify()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Close a subscription. An account without subscriptions is no
+        longer polled."""
+        subscription.closed = True
+        with self._lock:
+            account = self._accounts.get(subscription.account_id)
+            if account is None or subscription not in account.subscriptions:
+                return
+            self._connections -= 1
+            account.subscriptions.remove(subscription)
+            if not account.subscriptions:
+                del self._accounts[subscription.account_id]
+
+    def poll(self):
+        """Poll the accounts that are due and push what changed."""
+        now = self._clock()
+        with self._lock:
+            due = [(account_id, account, account.subscriptions[-1].token)
+                   for account_id, account in self._accounts.items()
+                   if min(account.balance_due, account.history_due) <= now]
+        for account_id, account, token in due:
+            try:
+                if account.balance_due <= now:
+                    account.balance_due = now + self.balance_interval
+                    self._poll_balance(account_id, account, token)
+                if account.history_due <= now:
+                    account.history_due = now + self.history_interval
+                    self._poll_history(account_id, account, token)
+            except Exception as err:  # pylint: disable=broad-except
+                self.logger.error('Error polling live updates: %s', str(err))
+
+    def _poll_balance(self, account_id, account, token):
+        balance = self.fetch_balance(account_id, token)
+        if balance is not None and balance != account.balance:
+            account.balance = balance
+            self._publish(account, BALANCE, {'balance': balance})
+
+    def _poll_history(self, account_id, account, token):
+        transactions = self.fetch_history(account_id, token)
+        if transactions is None:
+            return
+        newest = max((t['transactionId'] for t in transactions), default=0)
+        with self._lock:
+            subscriptions = list(account.subscriptions)
+        # the first poll only sets the baseline of subscriptions without one
+        baselines = [subscription.last_transaction for subscription in subscriptions
+                     if subscription.last_transaction is not None]
+        new = []
+        if baselines:
+            new = [t for t in transactions if t['transactionId'] > min(baselines)]
+        if new and self.label is not None:
+            self.label(account_id, token, new)
+        for subscription in subscriptions:
+            if subscription.last_transaction is not None:
+                missing = [t for t in new if t['transactionId'] > subscription.last_transaction]
+                if missing:
+                    subscription.push(TRANSACTIONS, {'transactions': missing})
+            subscription.last_transaction = max(newest, subscription.last_transaction or 0)
+
+    def _publish(self, account, event, data):
+        with self._lock:
+            subscriptions = list(account.subscriptions)
+        for subscription in subscriptions:
+            subscription.push(event, data)
+
+    def _delay(self):
+        """Return the seconds until the next poll is due, or None when no
+        account is subscribed."""
+        if not self._accounts:
+            return None
+        return min(min(account.balance_due, account.history_due)
+                   for account in self._accounts.values()) - self._clock()
+
+    def _run(self):
+        while True:
+            self.poll()
+            with self._lock:
+                delay = self._delay()
+                if delay is None or delay > 0:
+                    self._wakeup.wait(delay)
@@ -0,0 +1,104 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+metrics exposes Prometheus metrics of requests and backend calls
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(see gunicorn.conf.py) and /metrics aggregates the samples of all workers.
+"""
+
+import os
+import time
+
+import requests
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests',
+    ['method', 'route', 'status'])
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being handled',
+    multiprocess_mode='livesum')
+BACKEND_SECONDS = Histogram(
+    'backend_request_duration_seconds', 'Time spent waiting for backend services',
+    ['uri', 'method', 'status'])
+TRACE_SPANS = Counter(
+    'trace_spans_total', 'Finished spans by what became of them', ['outcome'])
+LOG_MESSAGES_DROPPED = Counter(
+    'log_messages_dropped_total', 'Log records dropped because the log queue was full')
+
+# base URIs of the known backends, longest first
+_backends = []
+
+
+def init_app(app):
+    """Time every request of app and serve the metrics at /metrics."""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.after_request
+    def _record_request(response):
+        if 'metrics_start' in g:
+            # the route template keeps the label set small, unlike the path
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - g.metrics_start)
+        return response
+
+    @app.teardown_request
+    def _end_request(_exc):
+        if g.pop('metrics_start', None) is not None:
+            REQUESTS_IN_FLIGHT.dec()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():  # pylint: disable=unused-variable
+        """Metrics in the Prometheus text format."""
+        registry = REGISTRY
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_backends(uris):
+    """Time every call made through requests, labelled by the longest of
+    uris that the URL starts with.
+
+    Params: uris - the base URIs of the backends, e.g. http://contacts:8080/contacts
+    """
+    _backends[:] = sorted(uris, key=len, reverse=True)
+    if getattr(requests.Session.send, 'metrics_instrumented', False):
+        return
+    send = requests.Session.send
+
+    def timed_send(session, prepared, **kwargs):
+        uri = next((base for base in _backends if prepared.url.startswith(base)), 'other')
+        status = 'error'
+        start = time.perf_counter()
+        try:
+            response = send(session, prepared, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            BACKEND_SECONDS.labels(uri, prepared.method, status).observe(
+                time.perf_counter() - start)
+
+    timed_send.metrics_instrumented = True
+    requests.Session.send = timed_send
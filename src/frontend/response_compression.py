@@ -0,0 +1,86 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+response_compression compresses responses with brotli or gzip, as negotiated with
+the Accept-Encoding header of the request
+
+Brotli is used when the brotli module is installed.
+"""
+
+import gzip
+
+from flask import request
+
+import server_timing
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+COMPRESSIBLE_MIMETYPES = frozenset((
+    'application/javascript', 'application/json', 'image/svg+xml',
+    'image/vnd.microsoft.icon', 'image/x-icon', 'text/css', 'text/html',
+    'text/javascript', 'text/plain'))
+
+
+def choose_encoding(accept_encodings, available=ENCODINGS):
+    """Return the preferred encoding of available that the client accepts,
+    or None for the identity encoding.
+
+    Params: accept_encodings - the werkzeug Accept of the request's
+                               Accept-Encoding header
+    """
+    for encoding in available:
+        if accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level=6):
+    """Return data compressed with encoding, br or gzip, at level 1 to 9."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level)
+
+
+def init_app(app, min_size=1024, level=6):
+    """Compress the responses of app that are at least min_size bytes.
+
+    Streamed and file responses, and responses already encoded, are sent
+    as they are. Static files are precompressed by assets.
+    """
+
+    @app.after_request
+    def _compress(response):
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        data = response.get_data()
+        if encoding is None or len(data) < min_size:
+            return response
+        with server_timing.timed('compress'):
+            response.set_data(compress(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # a strong validator must differ between encodings
+            response.set_etag('{}-{}'.format(etag, encoding))
+        return response
@@ -0,0 +1,80 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+server_timing breaks the handling time of a request down into phases and
+reports them in a Server-Timing response header
+"""
+
+import contextlib
+import json
+import time
+
+from flask import g, has_request_context, request
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """Add the time spent in the block to phase of the current request.
+
+    Outside of a request, or if timing is not enabled, the block runs untimed.
+    """
+    phases = g.get('server_timing') if has_request_context() else None
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[phase] = phases.get(phase, 0) + time.perf_counter() - start
+
+
+def header_value(phases, total):
+    """Format phase durations in seconds as a Server-Timing header value."""
+    metrics = ['{};dur={:.1f}'.format(phase, 1000 * seconds)
+               for phase, seconds in phases.items()]
+    metrics.append('total;dur={:.1f}'.format(1000 * total))
+    return ', '.join(metrics)
+
+
+def init_app(app, log=False):
+    """Time the requests of app.
+
+    Params: log - also log the breakdown of every timed request as JSON
+    """
+
+    @app.before_request
+    def _start_timing():
+        g.server_timing = {}
+        g.server_timing_start = time.perf_counter()
+
+    @app.after_request
+    def _report_timing(response):
+        phases = g.pop('server_timing', None)
+        start = g.pop('server_timing_start', None)
+        if not phases:
+            # nothing to break down
+            return response
+        total = time.perf_counter() - start
+        response.headers.add('Server-Timing', header_value(phases, total))
+        if log:
+            app.logger.info('Server timing: %s', json.dumps({
+                'method': request.method,
+                'route': request.url_rule.rule if request.url_rule else None,
+                'status': response.status_code,
+                'total_ms': round(1000 * total, 1),
+                'phases_ms': {phase: round(1000 * seconds, 1)
+                              for phase, seconds in phases.items()}}))
+        return response
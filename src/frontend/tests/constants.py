@@ -0,0 +1,74 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Example constants used in tests
+"""
+import os
+import tempfile
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+def generate_rsa_key():
+    """Generate priv,pub key pair for test"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(serialization.Encoding.PEM,
+                                    serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    public_key = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return private_key, public_key
+
+
+EXAMPLE_PRIVATE_KEY, EXAMPLE_PUBLIC_KEY = generate_rsa_key()
+
+EXAMPLE_PUBLIC_KEY_PATH = os.path.join(tempfile.mkdtemp(), 'publickey')
+with open(EXAMPLE_PUBLIC_KEY_PATH, 'wb') as key_file:
+    key_file.write(EXAMPLE_PUBLIC_KEY)
+
+EXAMPLE_ACCOUNT = '1234567890'
+
+EXAMPLE_ROUTING = '123456789'
+
+EXAMPLE_USER_PAYLOAD = {'user': 'foo', 'acct': EXAMPLE_ACCOUNT, 'name': 'Foo Bar',
+                        'exp': 4102444800}
+
+EXAMPLE_TOKEN = jwt.encode(EXAMPLE_USER_PAYLOAD, EXAMPLE_PRIVATE_KEY, algorithm='RS256')
+
+EXAMPLE_HEADERS = {'Authorization': 'Bearer ' + EXAMPLE_TOKEN}
+
+EXAMPLE_ENV = {
+    'VERSION': '1',
+    'PUB_KEY_PATH': EXAMPLE_PUBLIC_KEY_PATH,
+    'LOCAL_ROUTING_NUM': EXAMPLE_ROUTING,
+    'ENABLE_TRACING': 'false',
+    'TRANSACTIONS_API_ADDR': 'ledgerwriter:8080',
+    'BALANCES_API_ADDR': 'balancereader:8080',
+    'HISTORY_API_ADDR': 'transactionhistory:8080',
+    'CONTACTS_API_ADDR': 'contacts:8080',
+    'USERSERVICE_API_ADDR': 'userservice:8080',
+}
+
+EXAMPLE_TRANSACTION = {
+    'transactionId': 1,
+    'fromAccountNum': '9876543210',
+    'fromRoutingNum': EXAMPLE_ROUTING,
+    'toAccountNum': EXAMPLE_ACCOUNT,
+    'toRoutingNum': EXAMPLE_ROUTING,
+    'amount': 1000,
+    'timestamp': '2022-06-01T10:00:00.000+0000',
+}
@@ -0,0 +1,52 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Helpers shared by the tests of the frontend app
+"""
+
+import json
+from unittest.mock import MagicMock, patch
+
+from requests.exceptions import HTTPError, RequestException
+
+from frontend.frontend import create_app
+from frontend.tests.constants import EXAMPLE_ENV
+
+
+def create_test_app(**env):
+    """Create the app with the example environment updated with env,
+    without asking the AWS metadata server where it runs"""
+    with patch.dict('os.environ', dict(EXAMPLE_ENV, **env)):
+        with patch('requests.put', side_effect=RequestException('no metadata server')):
+            app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+def backend_response(data=None, status=200, headers=None, text=None):
+    """Mock a backend response with the JSON of data, or text"""
+    response = MagicMock()
+    response.status_code = status
+    response.ok = status < 400
+    response.__bool__.return_value = status < 400
+    if text is None:
+        text = json.dumps(data) if data is not None else ''
+    response.text = text
+    response.content = text.encode()
+    response.headers = headers or {}
+    response.json.return_value = data
+    if status >= 400:
+        response.raise_for_status.side_effect = HTTPError(response=response)
+    return response
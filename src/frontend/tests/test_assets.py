@@ -0,0 +1,121 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for assets module
+"""
+
+import gzip
+import os
+import tempfile
+import unittest
+
+import brotli
+from flask import Flask, render_template_string
+
+from frontend import assets
+
+CSS = 'body { color: black; }\n' * 50
+
+
+class TestAssets(unittest.TestCase):
+    """Tests the hashed and precompressed static files"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        static = self.directory.name
+        os.makedirs(os.path.join(static, 'styles'))
+        with open(os.path.join(static, 'styles', 'site.css'), 'w') as file:
+            file.write(CSS)
+        with open(os.path.join(static, 'logo.png'), 'wb') as file:
+            file.write(b'\x89PNG')
+        self.written = assets.build(static)
+
+        self.flask_app = Flask(__name__, static_folder=static, static_url_path='/static')
+        self.digests = assets.init_app(self.flask_app)
+        self.test_app = self.flask_app.test_client()
+
+    def static_url(self, path):
+        """Return the URL that templates use for the static file path"""
+        with self.flask_app.test_request_context():
+            return render_template_string('{{ static_url(path) }}', path=path)
+
+    def test_build(self):
+        """compressible files get a copy in each encoding, others none"""
+        self.assertEqual(self.written, 2)
+        self.assertEqual(assets.walk(self.directory.name), ['logo.png', 'styles/site.css'])
+        self.assertEqual(assets.precompressed(self.directory.name, self.digests),
+                         {'styles/site.css': ('br', 'gzip')})
+
+    def test_hashed_names(self):
+        """hashed names carry the digest before the extension"""
+        self.assertEqual(assets.hashed_name('styles/site.css', '0123456789'),
+                         'styles/site.0123456789.css')
+        self.assertEqual(assets.split_hashed_name('styles/site.0123456789.css'),
+                         ('styles/site.css', '0123456789'))
+        self.assertEqual(assets.split_hashed_name('jquery.min.js'), ('jquery.min.js', None))
+
+    def test_static_url(self):
+        """existing files get a hashed URL, missing ones the plain URL"""
+        digest = self.digests['styles/site.css']
+        self.assertEqual(self.static_url('styles/site.css'),
+                         '/static/styles/site.{}.css'.format(digest))
+        self.assertEqual(self.static_url('missing.css'), '/static/missing.css')
+
+    def test_hashed_url_immutable(self):
+        """a hashed URL is cached for a year"""
+        response = self.test_app.get(self.static_url('logo.png'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), b'\x89PNG')
+        cache_control = response.cache_control
+        self.assertTrue(cache_control.public)
+        self.assertTrue(cache_control.immutable)
+        self.assertEqual(cache_control.max_age, assets.IMMUTABLE_MAX_AGE)
+        response.close()
+
+    def test_plain_url_not_immutable(self):
+        """the plain URL is revalidated"""
+        response = self.test_app.get('/static/logo.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.cache_control.immutable)
+        response.close()
+
+    def test_precompressed(self):
+        """the precompressed copy the client prefers is sent"""
+        url = self.static_url('styles/site.css')
+        for accept_encoding, encoding, decompress in (('gzip, br', 'br', brotli.decompress),
+                                                      ('gzip', 'gzip', gzip.decompress)):
+            with self.subTest(encoding=encoding):
+                response = self.test_app.get(url, headers={'Accept-Encoding': accept_encoding})
+                self.assertEqual(response.headers['Content-Encoding'], encoding)
+                self.assertEqual(response.mimetype, 'text/css')
+                self.assertIn('Accept-Encoding', response.headers['Vary'])
+                self.assertEqual(decompress(response.get_data()).decode(), CSS)
+                response.close()
+
+    def test_identity(self):
+        """a client accepting no encoding gets the file itself"""
+        response = self.test_app.get(self.static_url('styles/site.css'))
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(as_text=True), CSS)
+        response.close()
+
+    def test_stale_copy_ignored(self):
+        """a compressed copy older than its file is not served"""
+        path = os.path.join(self.directory.name, 'styles', 'site.css')
+        mtime = os.path.getmtime(path)
+        os.utime(path + '.br', (mtime - 10, mtime - 10))
+        self.assertEqual(assets.precompressed(self.directory.name, self.digests),
+                         {'styles/site.css': ('gzip',)})
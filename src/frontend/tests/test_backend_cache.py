@@ -0,0 +1,151 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for backend_cache module
+"""
+
+import unittest
+
+from frontend.backend_cache import BalanceCache
+
+
+class FakeClock:
+    """A clock moved by the tests"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestBalanceCache(unittest.TestCase):
+    """Tests the balance cache and its read-your-writes"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = BalanceCache(ttl=5, max_entries=2, settle=60, clock=self.clock)
+
+    def test_get_is_fresh_for_ttl_seconds(self):
+        """a fetched balance is served until it is ttl seconds old"""
+        self.assertIsNone(self.cache.get('1'))
+        self.assertEqual(self.cache.put('1', 1000), 1000)
+        self.clock.now += 4
+        self.assertEqual(self.cache.get('1'), 1000)
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get('1'))
+
+    def test_get_adds_own_transactions(self):
+        """a fresh balance includes the transactions committed since"""
+        self.cache.put('1', 1000, position=10)
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        self.assertEqual(self.cache.get('1'), 900)
+
+    def test_pay_after_ttl_then_read(self):
+        """a payment made after the balance expired is shown until the
+        ledger shows it, and not counted twice once it does"""
+        self.cache.put('1', 1000, position=10)
+        self.clock.now += 10
+        self.assertIsNone(self.cache.get('1'))
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        # balancereader has not seen the payment yet
+        self.assertIsNone(self.cache.get('1'))
+        self.assertEqual(self.cache.put('1', 1000, position=10), 900)
+        self.assertEqual(self.cache.get('1'), 900)
+        # balancereader has seen it
+        self.assertEqual(self.cache.put('1', 900, position=11), 900)
+        self.assertEqual(self.cache.put('1', 900, position=11), 900)
+
+    def test_pay_before_any_balance(self):
+        """transactions recorded before any balance is fetched are added
+        to the first one that does not show them"""
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        self.assertEqual(self.cache.put('1', 1000, position=10), 900)
+
+    def test_ledger_shows_some_transactions(self):
+        """only the transactions past the ledger position are added"""
+        self.cache.put('1', 1000, position=10)
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        self.cache.apply('1', 'b', -50, transaction_id=13)
+        self.assertEqual(self.cache.put('1', 900, position=12), 850)
+        self.assertEqual(self.cache.put('1', 850, position=13), 850)
+
+    def test_other_transactions_do_not_drop_own(self):
+        """a balance moved by another account's payment still gets the
+        account's own transactions that it does not show"""
+        self.cache.put('1', 1000, position=10)
+        self.cache.apply('1', 'a', -100, transaction_id=12)
+        # payment of 500 from another account, transaction 11
+        self.assertEqual(self.cache.put('1', 1500, position=11), 1400)
+        self.assertEqual(self.cache.get('1'), 1400)
+
+    def test_same_uuid_recorded_once(self):
+        """a transaction recorded twice is added once"""
+        self.cache.put('1', 1000, position=10)
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        self.assertEqual(self.cache.get('1'), 900)
+
+    def test_shown_transaction_not_recorded(self):
+        """a transaction the cached balance already shows is not added"""
+        self.cache.put('1', 900, position=11)
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        self.assertEqual(self.cache.get('1'), 900)
+
+    def test_unknown_transaction_id_drops_balance(self):
+        """a transaction without an id makes the balance be fetched again"""
+        self.cache.put('1', 1000, position=10)
+        self.cache.apply('1', 'a', -100)
+        self.assertIsNone(self.cache.get('1'))
+        self.assertEqual(self.cache.put('1', 900, position=11), 900)
+
+    def test_unknown_position_shows_all(self):
+        """a balance without a ledger position is taken as it is"""
+        self.cache.put('1', 1000, position=10)
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        self.assertEqual(self.cache.put('1', 900), 900)
+        self.assertEqual(self.cache.get('1'), 900)
+
+    def test_transactions_settle(self):
+        """transactions are no longer added after settle seconds"""
+        self.cache.put('1', 1000, position=10)
+        self.cache.apply('1', 'a', -100, transaction_id=11)
+        self.clock.now += 60
+        self.assertEqual(self.cache.put('1', 1000, position=10), 1000)
+
+    def test_ttl_zero_keeps_transactions(self):
+        """a zero ttl disables caching but not read-your-writes"""
+        cache = BalanceCache(ttl=0, clock=self.clock)
+        cache.put('1', 1000, position=10)
+        cache.apply('1', 'a', -100, transaction_id=11)
+        self.assertIsNone(cache.get('1'))
+        self.assertEqual(cache.put('1', 1000, position=10), 900)
+
+    def test_size_zero_disables_cache(self):
+        """a zero size disables caching and read-your-writes"""
+        cache = BalanceCache(max_entries=0, clock=self.clock)
+        cache.apply('1', 'a', -100, transaction_id=11)
+        self.assertEqual(cache.put('1', 1000, position=10), 1000)
+        self.assertIsNone(cache.get('1'))
+
+    def test_least_recently_used_is_evicted(self):
+        """the least recently used account is evicted over capacity"""
+        self.cache.put('1', 100)
+        self.cache.put('2', 200)
+        self.cache.get('1')
+        self.cache.put('3', 300)
+        self.assertEqual(self.cache.get('1'), 100)
+        self.assertIsNone(self.cache.get('2'))
+        self.assertEqual(self.cache.get('3'), 300)
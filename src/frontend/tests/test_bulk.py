@@ -0,0 +1,192 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for bulk module and the /payments/bulk endpoint
+"""
+
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from frontend.bulk import parse_rows, validate_rows
+from frontend.tests.constants import EXAMPLE_ACCOUNT, EXAMPLE_HEADERS, EXAMPLE_ROUTING
+from frontend.tests.helpers import backend_response, create_test_app
+
+EXAMPLE_CSV = 'account_num,amount,uuid\n9876543210,10.50,uuid-1\n1111111111,2,uuid-2\n'
+
+
+class TestParseRows(unittest.TestCase):
+    """Tests parsing batches"""
+
+    def test_csv(self):
+        """CSV rows are keyed by the header"""
+        self.assertEqual(parse_rows(EXAMPLE_CSV, 'csv'), [
+            {'account_num': '9876543210', 'amount': '10.50', 'uuid': 'uuid-1'},
+            {'account_num': '1111111111', 'amount': '2', 'uuid': 'uuid-2'}])
+
+    def test_csv_missing_column(self):
+        """a CSV header must have every field"""
+        with self.assertRaisesRegex(UserWarning, 'CSV header'):
+            parse_rows('account_num,amount\n9876543210,10\n', 'csv')
+        with self.assertRaisesRegex(UserWarning, 'CSV header'):
+            parse_rows('', 'csv')
+
+    def test_json(self):
+        """a JSON batch is a list of objects"""
+        rows = [{'account_num': '9876543210', 'amount': 10, 'uuid': 'uuid-1'}]
+        self.assertEqual(parse_rows(json.dumps(rows), 'json'), rows)
+
+    def test_bad_json(self):
+        """unparseable JSON and other shapes are rejected"""
+        for body in ('[', '{"account_num": "9876543210"}', '[1, 2]'):
+            with self.assertRaises(UserWarning):
+                parse_rows(body, 'json')
+
+
+class TestValidateRows(unittest.TestCase):
+    """Tests validating batches"""
+
+    def validate(self, *rows):
+        """Return the errors of rows"""
+        return [error for _, error in validate_rows(list(rows), EXAMPLE_ACCOUNT,
+                                                    EXAMPLE_ROUTING)]
+
+    def test_valid_row(self):
+        """a valid row becomes a transaction from the account"""
+        transaction, error = validate_rows(
+            [{'account_num': ' 9876543210 ', 'amount': '10.50', 'uuid': 'uuid-1'}],
+            EXAMPLE_ACCOUNT, EXAMPLE_ROUTING)[0]
+        self.assertIsNone(error)
+        self.assertEqual(transaction, {'fromAccountNum': EXAMPLE_ACCOUNT,
+                                       'fromRoutingNum': EXAMPLE_ROUTING,
+                                       'toAccountNum': '9876543210',
+                                       'toRoutingNum': EXAMPLE_ROUTING,
+                                       'amount': 1050,
+                                       'uuid': 'uuid-1'})
+
+    def test_duplicate_uuid(self):
+        """a uuid is only submitted once per batch"""
+        row = {'account_num': '9876543210', 'amount': '1', 'uuid': 'uuid-1'}
+        self.assertEqual(self.validate(row, dict(row)), [None, 'duplicate uuid in batch'])
+
+    def test_bad_account(self):
+        """recipients must be other 10 digit accounts"""
+        for account, error in (('12345', 'invalid account number'),
+                               ('12345678901', 'invalid account number'),
+                               ('abcdefghij', 'invalid account number'),
+                               (EXAMPLE_ACCOUNT, 'may not send payment to yourself')):
+            self.assertEqual(
+                self.validate({'account_num': account, 'amount': '1', 'uuid': 'u'}), [error])
+
+    def test_amounts(self):
+        """amounts must be positive numbers"""
+        for amount, error in (('0', 'amount must be positive'),
+                              ('-5', 'amount must be positive'),
+                              ('0.001', 'amount must be positive'),
+                              ('ten', 'ten is not a valid number'),
+                              ('NaN', 'NaN is not a valid number')):
+            self.assertEqual(
+                self.validate({'account_num': '9876543210', 'amount': amount, 'uuid': 'u'}),
+                [error])
+
+    def test_missing_fields(self):
+        """every field is required"""
+        self.assertEqual(self.validate({'account_num': '9876543210', 'amount': '1'},
+                                       {'account_num': '9876543210', 'amount': '',
+                                        'uuid': 'u'}),
+                         ['missing required field(s)'] * 2)
+
+
+class TestBulkPayment(unittest.TestCase):
+    """Tests the /payments/bulk endpoint"""
+
+    def setUp(self):
+        self.flask_app = create_test_app(BULK_MAX_ROWS='3', MAX_CONTENT_LENGTH='1000')
+        self.test_app = self.flask_app.test_client()
+
+    def submit(self, ledger_responses, **kwargs):
+        """Submit a batch, answering each uuid's post with its response
+
+        Return: (status code, results by row)
+        """
+        def post(url, data, headers, timeout):  # pylint: disable=unused-argument
+            response = ledger_responses[json.loads(data)['uuid']]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with patch('requests.get', return_value=backend_response(10000)), \
+                patch('requests.Session.post', side_effect=post):
+            response = self.test_app.post('/payments/bulk', headers=EXAMPLE_HEADERS,
+                                          **kwargs)
+            if response.status_code != 200:
+                return response.status_code, None
+            results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        return 200, sorted(results, key=lambda result: result['row'])
+
+    def test_requires_token(self):
+        """a batch without a valid token is refused"""
+        response = self.test_app.post('/payments/bulk', data=EXAMPLE_CSV,
+                                      content_type='text/csv')
+        self.assertEqual(response.status_code, 401)
+
+    def test_row_outcomes(self):
+        """each row has its own outcome, in a JSON line"""
+        batch = [{'account_num': '9876543210', 'amount': '10', 'uuid': 'ok'},
+                 {'account_num': '9876543210', 'amount': '0', 'uuid': 'invalid'},
+                 {'account_num': '1111111111', 'amount': '5', 'uuid': 'rejected'}]
+        status, results = self.submit(
+            {'ok': backend_response(status=201),
+             'rejected': backend_response(status=400, text='insufficient balance')},
+            data=json.dumps(batch), content_type='application/json')
+        self.assertEqual(status, 200)
+        self.assertEqual(results, [
+            {'row': 0, 'uuid': 'ok', 'status': 'succeeded'},
+            {'row': 1, 'uuid': 'invalid', 'status': 'failed',
+             'message': 'amount must be positive'},
+            {'row': 2, 'uuid': 'rejected', 'status': 'failed',
+             'message': 'insufficient balance'}])
+
+    def test_ledger_unavailable(self):
+        """a row the ledger could not be reached for fails"""
+        status, results = self.submit(
+            {'uuid-1': RequestsConnectionError(), 'uuid-2': backend_response(status=201)},
+            data={'file': (io.BytesIO(EXAMPLE_CSV.encode()), 'batch.csv')})
+        self.assertEqual(status, 200)
+        self.assertEqual([result['status'] for result in results], ['failed', 'succeeded'])
+        self.assertEqual(results[0]['message'], 'ledger unavailable')
+
+    def test_unparseable_batch(self):
+        """a batch that cannot be parsed is refused"""
+        self.assertEqual(self.submit({}, data='[', content_type='application/json')[0], 400)
+
+    def test_row_cap(self):
+        """a batch over BULK_MAX_ROWS is refused before any row is submitted"""
+        batch = [{'account_num': '9876543210', 'amount': '1', 'uuid': str(i)}
+                 for i in range(4)]
+        self.assertEqual(
+            self.submit({}, data=json.dumps(batch), content_type='application/json')[0], 400)
+
+    def test_body_cap(self):
+        """a batch over MAX_CONTENT_LENGTH is refused before it is parsed"""
+        body = EXAMPLE_CSV + 'x' * 1000
+        with patch('frontend.frontend.parse_rows') as parse:
+            self.assertEqual(self.submit({}, data=body, content_type='text/csv')[0], 413)
+            self.assertEqual(self.submit(
+                {}, data={'file': (io.BytesIO(body.encode()), 'batch.csv')})[0], 413)
+        parse.assert_not_called()
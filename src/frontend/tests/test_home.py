@@ -0,0 +1,173 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the home page and its JSON API
+"""
+
+import unittest
+from unittest.mock import patch
+
+from frontend.tests.constants import (EXAMPLE_ACCOUNT, EXAMPLE_HEADERS, EXAMPLE_TOKEN,
+                                      EXAMPLE_TRANSACTION)
+from frontend.tests.helpers import backend_response, create_test_app
+
+
+def backends(history=(EXAMPLE_TRANSACTION,), history_etag='"history-1"', contacts=(),
+             failing=()):
+    """Return a side effect of requests.get that responds as the backends
+    the home page reads, with history and contacts, and with a 500 from
+    the failing backends"""
+    def get(url, **_):
+        backend = url.split('/')[2].split(':')[0]
+        if backend in failing:
+            return backend_response(status=500, text='error')
+        if backend == 'balancereader':
+            return backend_response(10000)
+        if backend == 'transactionhistory':
+            return backend_response(list(history), headers={'ETag': history_etag})
+        return backend_response(list(contacts), headers={'ETag': '"contacts-1"'})
+    return get
+
+
+class TestHome(unittest.TestCase):
+    """Tests the rendering and revalidation of the home page"""
+
+    def setUp(self):
+        self.test_app = create_test_app().test_client()
+        self.test_app.set_cookie('localhost', 'token', EXAMPLE_TOKEN)
+
+    def test_unauthenticated(self):
+        """a user without a valid token is sent to the login page"""
+        self.test_app.delete_cookie('localhost', 'token')
+        response = self.test_app.get('/home')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/login', response.headers['Location'])
+
+    def test_rendered(self):
+        """the page is private and has a weak ETag"""
+        with patch('requests.get', side_effect=backends()):
+            response = self.test_app.get('/home')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Foo Bar', response.get_data(as_text=True))
+        self.assertTrue(response.headers['ETag'].startswith('W/'))
+        self.assertTrue(response.cache_control.private)
+        self.assertTrue(response.cache_control.no_cache)
+
+    def test_not_modified(self):
+        """a client with the current page gets a 304 without a body"""
+        with patch('requests.get', side_effect=backends()):
+            etag = self.test_app.get('/home').headers['ETag']
+            response = self.test_app.get('/home', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_modified(self):
+        """the page is rendered again when the backend data changed"""
+        with patch('requests.get', side_effect=backends()):
+            etag = self.test_app.get('/home').headers['ETag']
+        with patch('requests.get', side_effect=backends(history=(), history_etag='"history-2"')):
+            response = self.test_app.get('/home', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+class TestApiHome(unittest.TestCase):
+    """Tests the JSON API of the home page data"""
+
+    def setUp(self):
+        self.test_app = create_test_app(HISTORY_PAGE_SIZE='2').test_client()
+        self.history = [dict(EXAMPLE_TRANSACTION, transactionId=transaction_id)
+                        for transaction_id in (3, 2, 1)]
+        self.contacts = [{'label': 'Alice', 'account_num': '9876543210',
+                          'routing_num': EXAMPLE_TRANSACTION['fromRoutingNum'],
+                          'is_external': False}]
+
+    def get(self, query='', headers=None, **backend_args):
+        """Return the response to a GET of /api/home?query"""
+        backend_args.setdefault('history', self.history)
+        backend_args.setdefault('contacts', self.contacts)
+        with patch('requests.get', side_effect=backends(**backend_args)):
+            return self.test_app.get('/api/home' + query,
+                                     headers=EXAMPLE_HEADERS if headers is None else headers)
+
+    def test_all_fields(self):
+        """the balance, the first history page with contact labels and the
+        contacts are returned"""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/json')
+        data = response.get_json()
+        self.assertEqual(sorted(data), ['balance', 'contacts', 'history'])
+        self.assertEqual(data['balance'], 10000)
+        self.assertEqual(data['contacts'], self.contacts)
+        self.assertEqual(sorted(data['history']), ['next', 'transactions'])
+        transactions = data['history']['transactions']
+        self.assertEqual([t['transactionId'] for t in transactions], [3, 2])
+        self.assertEqual(transactions[0]['toAccountNum'], EXAMPLE_ACCOUNT)
+        self.assertEqual({t['accountLabel'] for t in transactions}, {'Alice'})
+        self.assertEqual(data['history']['next'], 2)
+        self.assertTrue(response.headers['ETag'].startswith('W/'))
+        self.assertTrue(response.cache_control.private)
+
+    def test_next_page(self):
+        """before starts the page after that transaction, the last page
+        has no next"""
+        data = self.get('?fields=history&before=2&limit=5').get_json()
+        self.assertEqual(sorted(data), ['history'])
+        self.assertEqual([t['transactionId'] for t in data['history']['transactions']], [1])
+        self.assertIsNone(data['history']['next'])
+
+    def test_selected_fields(self):
+        """only the requested fields are returned"""
+        data = self.get('?fields=contacts,balance').get_json()
+        self.assertEqual(data, {'balance': 10000, 'contacts': self.contacts})
+
+    def test_failed_field(self):
+        """a field whose backend failed is null and listed in errors"""
+        response = self.get(failing=('transactionhistory',))
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertIsNone(data['history'])
+        self.assertEqual(data['errors'], ['history'])
+        self.assertEqual(data['balance'], 10000)
+
+    def test_invalid_parameters(self):
+        """unknown fields and out of range limits are rejected"""
+        for query in ('?fields=balance,secrets', '?limit=0', '?limit=101', '?before=x'):
+            with self.subTest(query=query):
+                self.assertEqual(self.get(query).status_code, 400)
+
+    def test_not_modified(self):
+        """a client with the current data gets a 304"""
+        etag = self.get().headers['ETag']
+        response = self.get(headers=dict(EXAMPLE_HEADERS, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+
+    def test_cookie_token(self):
+        """the token cookie authenticates like the Authorization header"""
+        self.test_app.set_cookie('localhost', 'token', EXAMPLE_TOKEN)
+        self.assertEqual(self.get(headers={}).status_code, 200)
+
+    def test_authentication_required(self):
+        """requests without a valid token are refused without backend calls"""
+        for headers in ({}, {'Authorization': 'Bearer invalid'},
+                        {'Authorization': 'Bearer ' + EXAMPLE_TOKEN[:-4]}):
+            with self.subTest(headers=headers):
+                with patch('requests.get') as get:
+                    response = self.test_app.get('/api/home', headers=headers)
+                self.assertEqual(response.status_code, 401)
+                get.assert_not_called()
@@ -0,0 +1,203 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for idempotency module
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+from frontend.idempotency import (PENDING, IdempotencyCache, LocalIdempotencyStore,
+                                  RedisIdempotencyStore, load_store)
+
+
+class FakeRedis:
+    """An in-memory stand-in for the redis client commands used by the store"""
+
+    def __init__(self):
+        self.data = {}
+        self.expiries = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        """SET with the NX and EX options"""
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode()
+        self.expiries[key] = ex
+        return True
+
+    def get(self, key):
+        """GET"""
+        return self.data.get(key)
+
+    def delete(self, key):
+        """DEL"""
+        self.data.pop(key, None)
+
+
+class TestLocalIdempotencyStore(unittest.TestCase):
+    """Tests the in-process store"""
+
+    def test_add_only_once(self):
+        """add stores a value only if the key is absent"""
+        store = LocalIdempotencyStore()
+        self.assertTrue(store.add('key', 1))
+        self.assertFalse(store.add('key', 2))
+        self.assertEqual(store.get('key'), 1)
+
+    def test_entries_expire_after_ttl(self):
+        """entries are dropped ttl seconds after they were set"""
+        store = LocalIdempotencyStore(ttl=10)
+        with patch('frontend.idempotency.time.monotonic', return_value=100):
+            store.add('key', 1)
+        with patch('frontend.idempotency.time.monotonic', return_value=109):
+            self.assertEqual(store.get('key'), 1)
+        with patch('frontend.idempotency.time.monotonic', return_value=110):
+            self.assertIsNone(store.get('key'))
+            self.assertTrue(store.add('key', 2))
+
+    def test_oldest_entries_evicted_over_capacity(self):
+        """the oldest entries are dropped over max_entries"""
+        store = LocalIdempotencyStore(max_entries=2)
+        for key in ('a', 'b', 'c'):
+            store.set(key, key)
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.get('b'), 'b')
+        self.assertEqual(store.get('c'), 'c')
+
+    def test_delete(self):
+        """deleted keys can be added again"""
+        store = LocalIdempotencyStore()
+        store.add('key', 1)
+        store.delete('key')
+        self.assertIsNone(store.get('key'))
+        self.assertTrue(store.add('key', 2))
+
+
+class TestRedisIdempotencyStore(unittest.TestCase):
+    """Tests the Redis store against a fake client"""
+
+    def setUp(self):
+        self.client = FakeRedis()
+        fake_redis = MagicMock()
+        fake_redis.Redis.from_url.return_value = self.client
+        with patch('frontend.idempotency.redis', fake_redis):
+            self.store = RedisIdempotencyStore(ttl=30, url='redis://redis:6379/1')
+        fake_redis.Redis.from_url.assert_called_once_with('redis://redis:6379/1')
+
+    def test_add_only_once(self):
+        """add stores a value only if the key is absent, with the ttl"""
+        self.assertTrue(self.store.add('key', PENDING))
+        self.assertFalse(self.store.add('key', {'ok': True}))
+        self.assertEqual(self.store.get('key'), PENDING)
+        self.assertEqual(self.client.expiries['frontend:key'], 30)
+
+    def test_values_round_trip_as_json(self):
+        """values are stored as JSON under the frontend prefix"""
+        self.store.set('key', {'ok': False, 'msg': 'rejected'})
+        self.assertEqual(self.client.data['frontend:key'],
+                         b'{"ok": false, "msg": "rejected"}')
+        self.assertEqual(self.store.get('key'), {'ok': False, 'msg': 'rejected'})
+
+    def test_delete(self):
+        """deleted keys are absent"""
+        self.store.set('key', 1)
+        self.store.delete('key')
+        self.assertIsNone(self.store.get('key'))
+
+    def test_requires_redis_package(self):
+        """the store cannot be created without the redis package"""
+        with patch('frontend.idempotency.redis', None):
+            with self.assertRaises(ValueError):
+                RedisIdempotencyStore()
+
+
+class TestLoadStore(unittest.TestCase):
+    """Tests loading a store from its import path"""
+
+    def test_default_store(self):
+        """an empty path loads the in-process store"""
+        store = load_store('', max_entries=5, ttl=7)
+        self.assertIsInstance(store, LocalIdempotencyStore)
+        self.assertEqual((store.max_entries, store.ttl), (5, 7))
+
+    def test_store_class(self):
+        """a module:Class path loads that class"""
+        store = load_store('frontend.idempotency:LocalIdempotencyStore',
+                           max_entries=5, ttl=7)
+        self.assertIsInstance(store, LocalIdempotencyStore)
+
+    def test_bad_path(self):
+        """paths that do not name a class raise ValueError"""
+        for path in ('frontend.idempotency', 'frontend.nosuchmodule:Store',
+                     'frontend.idempotency:NoSuchStore'):
+            with self.assertRaises(ValueError):
+                load_store(path, max_entries=5, ttl=7)
+
+
+class TestIdempotencyCache(unittest.TestCase):
+    """Tests submitting transactions once per uuid"""
+
+    def setUp(self):
+        self.store = LocalIdempotencyStore(ttl=60)
+        self.cache = IdempotencyCache(self.store, logger=MagicMock(), poll_interval=0)
+
+    def test_success_replayed(self):
+        """a duplicate of a committed transaction is not submitted again"""
+        submit = MagicMock()
+        self.cache.submit('acct', 'uuid', submit, timeout=1)
+        self.cache.submit('acct', 'uuid', submit, timeout=1)
+        submit.assert_called_once()
+
+    def test_rejection_replayed(self):
+        """a duplicate of a rejected transaction raises the same warning"""
+        submit = MagicMock(side_effect=UserWarning('insufficient balance'))
+        for _ in range(2):
+            with self.assertRaisesRegex(UserWarning, 'insufficient balance'):
+                self.cache.submit('acct', 'uuid', submit, timeout=1)
+        submit.assert_called_once()
+
+    def test_uuids_are_per_account(self):
+        """the same uuid from another account is submitted"""
+        submit = MagicMock()
+        self.cache.submit('acct', 'uuid', submit, timeout=1)
+        self.cache.submit('other', 'uuid', submit, timeout=1)
+        self.assertEqual(submit.call_count, 2)
+
+    def test_error_releases_key(self):
+        """a submission that failed without an outcome can be retried"""
+        submit = MagicMock(side_effect=[RuntimeError('ledger down'), None])
+        with self.assertRaises(RuntimeError):
+            self.cache.submit('acct', 'uuid', submit, timeout=1)
+        self.cache.submit('acct', 'uuid', submit, timeout=1)
+        self.assertEqual(submit.call_count, 2)
+
+    def test_outcome_expires(self):
+        """a uuid is submitted again once its outcome expired"""
+        submit = MagicMock()
+        with patch('frontend.idempotency.time.monotonic', return_value=100):
+            self.cache.submit('acct', 'uuid', submit, timeout=1)
+        with patch('frontend.idempotency.time.monotonic', return_value=160):
+            self.cache.submit('acct', 'uuid', submit, timeout=1)
+        self.assertEqual(submit.call_count, 2)
+
+    def test_in_flight_duplicate_times_out(self):
+        """a duplicate of a submission still in flight is rejected after
+        the timeout"""
+        self.store.add('acct:uuid', PENDING)
+        submit = MagicMock()
+        with self.assertRaisesRegex(UserWarning, 'still being processed'):
+            self.cache.submit('acct', 'uuid', submit, timeout=0)
+        submit.assert_not_called()
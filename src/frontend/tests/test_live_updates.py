@@ -0,0 +1,248 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for live_updates module and the /api/home/events stream
+"""
+
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from frontend.live_updates import (BALANCE, TRANSACTIONS, LiveUpdates, Subscription,
+                                   format_event)
+from frontend.tests.constants import EXAMPLE_ACCOUNT, EXAMPLE_TOKEN, EXAMPLE_TRANSACTION
+from frontend.tests.helpers import create_test_app
+
+
+def transactions(*transaction_ids):
+    """Return a history of transactions with transaction_ids, newest first"""
+    return [dict(EXAMPLE_TRANSACTION, transactionId=transaction_id)
+            for transaction_id in sorted(transaction_ids, reverse=True)]
+
+
+def events(subscription):
+    """Return the events queued for subscription"""
+    queued = []
+    event = subscription.next_event(0)
+    while event is not None:
+        queued.append(event)
+        event = subscription.next_event(0)
+    return queued
+
+
+class TestSubscription(unittest.TestCase):
+    """Tests the event queue of a subscription"""
+
+    def test_events_in_order(self):
+        """events are returned in the order they were pushed"""
+        subscription = Subscription(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        subscription.push(BALANCE, {'balance': 1})
+        subscription.push(BALANCE, {'balance': 2})
+        self.assertEqual(events(subscription),
+                         [(BALANCE, {'balance': 1}), (BALANCE, {'balance': 2})])
+
+    def test_overflow_closes(self):
+        """a client max_events behind is closed"""
+        subscription = Subscription(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN, max_events=2)
+        subscription.push(BALANCE, {'balance': 1})
+        subscription.push(BALANCE, {'balance': 2})
+        self.assertFalse(subscription.closed)
+        subscription.push(BALANCE, {'balance': 3})
+        self.assertTrue(subscription.closed)
+
+    def test_format_event(self):
+        """each line of the data is sent as a data field"""
+        self.assertEqual(format_event('balance', '{"balance": 1}\n2'),
+                         'event: balance\ndata: {"balance": 1}\ndata: 2\n\n')
+
+
+class TestLiveUpdates(unittest.TestCase):
+    """Tests the polling of the accounts with subscriptions"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.balance = 10000
+        self.history = transactions(1, 2)
+        self.label = MagicMock()
+        self.live_updates = LiveUpdates(lambda account_id, token: self.balance,
+                                        lambda account_id, token: self.history,
+                                        label=self.label, balance_interval=5,
+                                        history_interval=15, max_connections=2,
+                                        clock=lambda: self.now)
+        # no polling thread: the tests poll
+        patcher = patch.object(self.live_updates, '_start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_first_poll_sets_baseline(self):
+        """without last_transaction, the first poll pushes no transactions,
+        and the next ones push those newer than it"""
+        subscription = self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        self.live_updates.poll()
+        self.assertEqual(events(subscription), [(BALANCE, {'balance': 10000})])
+        self.history = transactions(1, 2, 3)
+        self.now += 15
+        self.live_updates.poll()
+        self.assertEqual(events(subscription),
+                         [(TRANSACTIONS, {'transactions': transactions(3)})])
+        self.label.assert_called_once_with(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN, transactions(3))
+
+    def test_last_transaction_baseline(self):
+        """transactions newer than the client's last_transaction are pushed
+        on the first poll"""
+        subscription = self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN, 1)
+        self.live_updates.poll()
+        self.assertIn((TRANSACTIONS, {'transactions': transactions(2)}), events(subscription))
+
+    def test_baselines_per_subscription(self):
+        """each subscription gets the transactions it does not have"""
+        first = self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN, 2)
+        self.live_updates.poll()
+        self.assertEqual(events(first), [(BALANCE, {'balance': 10000})])
+        self.history = transactions(1, 2, 3)
+        second = self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN, 1)
+        self.now += 15
+        self.live_updates.poll()
+        self.assertEqual(events(first), [(TRANSACTIONS, {'transactions': transactions(3)})])
+        self.assertEqual(events(second), [(BALANCE, {'balance': 10000}),
+                                          (TRANSACTIONS, {'transactions': transactions(2, 3)})])
+
+    def test_balance_pushed_when_changed(self):
+        """the balance is pushed on subscription and when it changes"""
+        subscription = self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        self.live_updates.poll()
+        self.now += 5
+        self.live_updates.poll()
+        self.assertEqual(events(subscription), [(BALANCE, {'balance': 10000})])
+        self.balance = 9000
+        self.now += 5
+        self.live_updates.poll()
+        self.assertEqual(events(subscription), [(BALANCE, {'balance': 9000})])
+        late = self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        self.assertEqual(events(late), [(BALANCE, {'balance': 9000})])
+
+    def test_not_due_not_polled(self):
+        """accounts are polled at their intervals"""
+        self.live_updates.fetch_history = MagicMock(return_value=self.history)
+        self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        self.live_updates.poll()
+        self.now += 5
+        self.live_updates.poll()
+        self.live_updates.fetch_history.assert_called_once()
+
+    def test_max_connections(self):
+        """subscriptions over max_connections are refused until one closes"""
+        first = self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        self.live_updates.subscribe('other', EXAMPLE_TOKEN)
+        with self.assertRaises(UserWarning):
+            self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        self.live_updates.unsubscribe(first)
+        self.live_updates.unsubscribe(first)
+        self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        with self.assertRaises(UserWarning):
+            self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+
+    def test_unsubscribed_not_polled(self):
+        """an account without subscriptions is no longer polled"""
+        self.live_updates.fetch_balance = MagicMock(return_value=self.balance)
+        subscription = self.live_updates.subscribe(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        self.live_updates.unsubscribe(subscription)
+        self.live_updates.poll()
+        self.live_updates.fetch_balance.assert_not_called()
+        self.assertTrue(subscription.closed)
+
+
+class FakeSubscription(Subscription):
+    """A subscription that closes once its queued events are read"""
+
+    def next_event(self, timeout):
+        event = super().next_event(0)
+        if event is None:
+            self.closed = True
+        return event
+
+
+class TestHomeEvents(unittest.TestCase):
+    """Tests the /api/home/events stream"""
+
+    def setUp(self):
+        # no polling thread: the streams get no events unless faked
+        patcher = patch('frontend.frontend.LiveUpdates._start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_client(self, **env):
+        """Return a test client of the app, logged in"""
+        test_app = create_test_app(**env).test_client()
+        test_app.set_cookie('localhost', 'token', EXAMPLE_TOKEN)
+        return test_app
+
+    def test_unauthenticated(self):
+        """a request without a valid token is refused"""
+        test_app = self.create_client()
+        test_app.delete_cookie('localhost', 'token')
+        self.assertEqual(test_app.get('/api/home/events').status_code, 401)
+
+    def test_events_streamed(self):
+        """events are sent as server-sent events, from after"""
+        subscription = FakeSubscription(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        subscription.push(BALANCE, {'balance': 10000})
+        subscription.push(TRANSACTIONS, {'transactions': transactions(3)})
+        with patch('frontend.frontend.LiveUpdates.subscribe',
+                   return_value=subscription) as subscribe:
+            response = self.create_client().get('/api/home/events?after=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        streamed = [event.split('\n') for event in
+                    response.get_data(as_text=True).split('\n\n')
+                    if event.startswith('event: ')]
+        self.assertEqual([(name, json.loads(data[len('data: '):])) for name, data in streamed],
+                         [('event: balance', {'balance': 10000}),
+                          ('event: transactions', {'transactions': transactions(3)})])
+        subscribe.assert_called_once_with(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN, 2)
+
+    def test_invalid_after_ignored(self):
+        """a stream with an invalid after starts from the next poll"""
+        subscription = FakeSubscription(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN)
+        with patch('frontend.frontend.LiveUpdates.subscribe',
+                   return_value=subscription) as subscribe:
+            self.create_client().get('/api/home/events?after=x').get_data()
+        subscribe.assert_called_once_with(EXAMPLE_ACCOUNT, EXAMPLE_TOKEN, None)
+
+    def test_connection_cap(self):
+        """a worker at LIVE_UPDATES_MAX_CONNECTIONS answers 503"""
+        test_app = self.create_client(LIVE_UPDATES_MAX_CONNECTIONS='0',
+                                      LIVE_UPDATES_MAX_SECONDS='120')
+        response = test_app.get('/api/home/events')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '120')
+
+    def test_stream_lifetime(self):
+        """a stream ends after LIVE_UPDATES_MAX_SECONDS, and frees its
+        connection"""
+        test_app = self.create_client(LIVE_UPDATES_MAX_CONNECTIONS='1',
+                                      LIVE_UPDATES_MAX_SECONDS='0')
+        for _ in range(2):
+            response = test_app.get('/api/home/events')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_data(), b'')
+
+    def test_default_connection_cap(self):
+        """half of the threads stream by default, at least one"""
+        for threads, connections in (('4', 2), ('8', 4), ('1', 1)):
+            with self.subTest(threads=threads):
+                app = create_test_app(GUNICORN_THREADS=threads)
+                self.assertEqual(app.config['LIVE_UPDATES_MAX_CONNECTIONS'], connections)
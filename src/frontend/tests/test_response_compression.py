@@ -0,0 +1,143 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for response_compression module
+"""
+
+import gzip
+import unittest
+
+import brotli
+from flask import Flask, Response
+from werkzeug.http import parse_accept_header
+
+from frontend import response_compression
+
+BODY = 'compress me ' * 100
+
+
+class TestChooseEncoding(unittest.TestCase):
+    """Tests the Accept-Encoding negotiation"""
+
+    def choose(self, header, available=('br', 'gzip')):
+        """Return the encoding chosen for an Accept-Encoding header"""
+        return response_compression.choose_encoding(parse_accept_header(header), available)
+
+    def test_preferred_encoding(self):
+        """the first available encoding that the client accepts is chosen"""
+        self.assertEqual(self.choose('gzip, deflate, br'), 'br')
+        self.assertEqual(self.choose('gzip, deflate'), 'gzip')
+        self.assertEqual(self.choose('gzip, br'), 'br')
+        self.assertEqual(self.choose('gzip, br', available=('gzip',)), 'gzip')
+
+    def test_refused_encoding(self):
+        """an encoding of quality 0 is not chosen"""
+        self.assertEqual(self.choose('br;q=0, gzip'), 'gzip')
+        self.assertEqual(self.choose('*, br;q=0'), 'gzip')
+
+    def test_identity(self):
+        """None is chosen when no available encoding is accepted"""
+        self.assertIsNone(self.choose(''))
+        self.assertIsNone(self.choose('deflate'))
+        self.assertIsNone(self.choose('gzip', available=()))
+
+
+class TestCompressResponses(unittest.TestCase):
+    """Tests which responses are compressed"""
+
+    def setUp(self):
+        self.flask_app = Flask(__name__)
+        response_compression.init_app(self.flask_app, min_size=100)
+
+        @self.flask_app.route('/text')
+        def text():
+            response = Response(BODY, mimetype='text/plain')
+            response.set_etag('abc')
+            return response
+
+        @self.flask_app.route('/small')
+        def small():
+            return 'small'
+
+        @self.flask_app.route('/image')
+        def image():
+            return Response(BODY, mimetype='image/png')
+
+        @self.flask_app.route('/streamed')
+        def streamed():
+            return Response((BODY for _ in range(2)), mimetype='text/plain')
+
+        @self.flask_app.route('/passthrough')
+        def passthrough():
+            return Response(BODY.encode(), mimetype='text/plain', direct_passthrough=True)
+
+        @self.flask_app.route('/encoded')
+        def encoded():
+            return Response(BODY, mimetype='text/plain', headers={'Content-Encoding': 'gzip'})
+
+        @self.flask_app.route('/missing')
+        def missing():
+            return Response(BODY, status=404, mimetype='text/plain')
+
+        self.test_app = self.flask_app.test_client()
+
+    def get(self, path, accept_encoding='gzip, br'):
+        """Return the response to a GET of path"""
+        return self.test_app.get(path, headers={'Accept-Encoding': accept_encoding})
+
+    def assert_not_compressed(self, response):
+        """Assert that response is sent as it is"""
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('compress me', response.get_data(as_text=True))
+
+    def test_brotli(self):
+        """a client accepting brotli gets brotli"""
+        response = self.get('/text')
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.get_data()).decode(), BODY)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_gzip(self):
+        """a client accepting only gzip gets gzip"""
+        response = self.get('/text', accept_encoding='gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.get_data()).decode(), BODY)
+
+    def test_strong_etag_per_encoding(self):
+        """a strong ETag names the encoding"""
+        self.assertEqual(self.get('/text').headers['ETag'], '"abc-br"')
+        self.assertEqual(self.get('/text', accept_encoding='').headers['ETag'], '"abc"')
+
+    def test_identity(self):
+        """a client accepting no encoding gets the response as it is"""
+        response = self.get('/text', accept_encoding='')
+        self.assert_not_compressed(response)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_small_not_compressed(self):
+        """responses under min_size are sent as they are"""
+        response = self.get('/small')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(as_text=True), 'small')
+
+    def test_skipped(self):
+        """incompressible, streamed, passthrough, encoded and non-200
+        responses are sent as they are"""
+        for path in ('/image', '/streamed', '/passthrough', '/missing'):
+            with self.subTest(path=path):
+                self.assert_not_compressed(self.get(path))
+        response = self.get('/encoded')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('compress me', response.get_data(as_text=True))
@@ -0,0 +1,77 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for server_timing module
+"""
+
+import re
+import unittest
+from unittest.mock import MagicMock
+
+from flask import Flask
+
+from frontend import server_timing
+
+
+class TestServerTiming(unittest.TestCase):
+    """Tests the Server-Timing header"""
+
+    def setUp(self):
+        self.flask_app = Flask(__name__)
+        self.flask_app.logger = MagicMock()
+        server_timing.init_app(self.flask_app, log=True)
+
+        @self.flask_app.route('/timed')
+        def timed():
+            with server_timing.timed('balance'):
+                pass
+            with server_timing.timed('render'):
+                pass
+            with server_timing.timed('balance'):
+                pass
+            return 'ok'
+
+        @self.flask_app.route('/untimed')
+        def untimed():
+            return 'ok'
+
+        self.test_app = self.flask_app.test_client()
+
+    def test_phases_reported(self):
+        """each phase is reported once, in order, followed by the total"""
+        header = self.test_app.get('/timed').headers['Server-Timing']
+        self.assertRegex(header, r'\Abalance;dur=\d+\.\d, render;dur=\d+\.\d, '
+                                 r'total;dur=\d+\.\d\Z')
+        durations = [float(d) for d in re.findall(r'dur=([\d.]+)', header)]
+        self.assertLessEqual(sum(durations[:-1]), durations[-1] + 0.2)
+        logged = self.flask_app.logger.info.call_args.args[1]
+        self.assertIn('"route": "/timed"', logged)
+
+    def test_no_phases_no_header(self):
+        """a request without phases has no header, and is not logged"""
+        response = self.test_app.get('/untimed')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.flask_app.logger.info.assert_not_called()
+
+    def test_outside_request(self):
+        """blocks outside of a request run untimed"""
+        with server_timing.timed('balance'):
+            ran = True
+        self.assertTrue(ran)
+
+    def test_header_value(self):
+        """durations in seconds are formatted in milliseconds"""
+        self.assertEqual(server_timing.header_value({'ledger': 0.01234}, 0.05),
+                         'ledger;dur=12.3, total;dur=50.0')
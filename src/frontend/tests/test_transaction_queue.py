@@ -0,0 +1,143 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for transaction_queue module and the asynchronous transactions of the app
+"""
+
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from requests.exceptions import ConnectionError as RequestsConnectionError, ReadTimeout
+
+from frontend.idempotency import LocalIdempotencyStore
+from frontend.transaction_queue import FAILED, PENDING, SUCCEEDED, TransactionQueue
+from frontend.tests.constants import EXAMPLE_TOKEN
+from frontend.tests.helpers import backend_response, create_test_app
+
+
+class TestTransactionQueue(unittest.TestCase):
+    """Tests the queue's retries and job statuses"""
+
+    def setUp(self):
+        self.store = LocalIdempotencyStore()
+        # no worker threads: jobs are run by the tests
+        self.queue = TransactionQueue(self.store, workers=0, max_size=1, retries=2,
+                                      backoff=0.5, retry_on=(RequestsConnectionError,),
+                                      logger=MagicMock())
+
+    def run_job(self, submit):
+        """Run submit as the queue's workers do, without sleeping"""
+        with patch('frontend.transaction_queue.time.sleep') as sleep:
+            self.queue._run('key', submit)  # pylint: disable=protected-access
+        return [call.args[0] for call in sleep.call_args_list]
+
+    def test_succeeded(self):
+        """a job that returns succeeds"""
+        self.assertEqual(self.run_job(MagicMock()), [])
+        self.assertEqual(self.queue.status('key'), {'status': SUCCEEDED})
+
+    def test_retried_with_backoff(self):
+        """retry_on errors are retried after exponentially longer delays"""
+        submit = MagicMock(side_effect=[RequestsConnectionError(), RequestsConnectionError(),
+                                        None])
+        self.assertEqual(self.run_job(submit), [0.5, 1.0])
+        self.assertEqual(submit.call_count, 3)
+        self.assertEqual(self.queue.status('key'), {'status': SUCCEEDED})
+
+    def test_retries_exhausted(self):
+        """a job failing more than retries times fails"""
+        submit = MagicMock(side_effect=RequestsConnectionError())
+        self.run_job(submit)
+        self.assertEqual(submit.call_count, 3)
+        self.assertEqual(self.queue.status('key'),
+                         {'status': FAILED, 'message': 'ledger unavailable'})
+
+    def test_other_errors_not_retried(self):
+        """errors other than retry_on fail the job at once"""
+        submit = MagicMock(side_effect=ReadTimeout())
+        self.assertEqual(self.run_job(submit), [])
+        submit.assert_called_once()
+        self.assertEqual(self.queue.status('key')['status'], FAILED)
+
+    def test_rejection_not_retried(self):
+        """a rejected transaction fails with the rejection"""
+        submit = MagicMock(side_effect=UserWarning('insufficient balance'))
+        self.run_job(submit)
+        submit.assert_called_once()
+        self.assertEqual(self.queue.status('key'),
+                         {'status': FAILED, 'message': 'insufficient balance'})
+
+    def test_enqueue_pending_until_full(self):
+        """queued jobs are pending, and a full queue refuses jobs"""
+        self.queue.enqueue('first', MagicMock())
+        self.assertEqual(self.queue.status('first'), {'status': PENDING})
+        with self.assertRaises(UserWarning):
+            self.queue.enqueue('second', MagicMock())
+        self.assertIsNone(self.queue.status('second'))
+
+
+class TestAsyncTransactions(unittest.TestCase):
+    """Tests payments queued by the app"""
+
+    def setUp(self):
+        self.flask_app = create_test_app(ASYNC_TRANSACTIONS='true',
+                                         TRANSACTION_RETRY_BACKOFF='0')
+        self.test_app = self.flask_app.test_client()
+        self.test_app.set_cookie('localhost', 'token', EXAMPLE_TOKEN)
+
+    def pay(self, ledger_responses):
+        """Queue a payment and wait until it completes
+
+        Return: (status, number of posts to the ledger)
+        """
+        with patch('requests.get', return_value=backend_response(10000)), \
+                patch('requests.post', side_effect=ledger_responses) as post:
+            response = self.test_app.post('/payment', data={
+                'account_num': '9876543210', 'amount': '10.00', 'uuid': 'uuid-1'})
+            self.assertEqual(response.status_code, 303)
+            self.assertIn('pending=uuid-1', response.headers['Location'])
+            deadline = time.monotonic() + 5
+            while True:
+                status = self.test_app.get('/transaction-status/uuid-1').get_json()
+                if status['status'] != PENDING or time.monotonic() > deadline:
+                    return status, post.call_count
+                time.sleep(0.01)
+
+    def test_committed(self):
+        """a committed payment succeeds"""
+        self.assertEqual(self.pay([backend_response(status=201)]),
+                         ({'status': SUCCEEDED}, 1))
+
+    def test_duplicate_after_lost_response_succeeds(self):
+        """a retry rejected as a duplicate of the committed first attempt
+        succeeds"""
+        duplicate = backend_response(status=400, text='duplicate transaction uuid')
+        self.assertEqual(self.pay([RequestsConnectionError('Connection aborted'), duplicate]),
+                         ({'status': SUCCEEDED}, 2))
+
+    def test_read_timeout_not_retried(self):
+        """a payment that may have committed is not posted again"""
+        self.assertEqual(self.pay(ReadTimeout()),
+                         ({'status': FAILED, 'message': 'ledger unavailable'}, 1))
+
+    def test_unknown_status_404(self):
+        """the status of a transaction the account did not queue is 404"""
+        self.assertEqual(self.test_app.get('/transaction-status/unknown').status_code, 404)
+
+    def test_status_requires_token(self):
+        """statuses are only shown to signed in accounts"""
+        self.test_app.delete_cookie('localhost', 'token')
+        self.assertEqual(self.test_app.get('/transaction-status/uuid-1').status_code, 401)
@@ -0,0 +1,119 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+transaction_queue submits transactions to the ledger in the background
+"""
+
+import logging
+import queue
+import threading
+import time
+
+PENDING = 'pending'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class TransactionQueue:
+    """
+    TransactionQueue is a bounded work queue drained by a pool of
+    worker threads. The status of each job is kept in a store with the
+    same interface as idempotency.LocalIdempotencyStore.
+
+    Worker threads are started on first use so that they are created in
+    the serving process rather than in a pre-fork parent.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, store, workers=4, max_size=100, retries=3,
+                 backoff=0.5, retry_on=(Exception,), logger=logging):
+        self.store = store
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_on = retry_on
+        self.logger = logger
+        self._jobs = queue.Queue(maxsize=max_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work,
+                                          name='transaction-worker-{}'.format(i),
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, key, submit):
+        """Queue submit() for background execution.
+
+        Params: key - the key under which the job status is recorded
+                submit - a callable performing the submission
+        Raises: UserWarning if the queue is full
+        """
+        self._start()
+        self.store.set(key, {'status': PENDING})
+        try:
+            self._jobs.put_nowait((key, submit))
+        except queue.Full as err:
+            self.store.delete(key)
+            raise UserWarning(
+                'too many pending transactions, please retry') from err
+
+    def status(self, key):
+        """Return the status recorded for key, or None if unknown.
+
+        Return: a dict of the form {'status': status, 'message': message}
+        """
+        return self.store.get(key)
+
+    def _work(self):
+        while True:
+            key, submit = self._jobs.get()
+            try:
+                self._run(key, submit)
+            finally:
+                self._jobs.task_done()
+
+    def _run(self, key, submit):
+        """Run submit(), retrying with exponential backoff on retry_on errors.
+
+        UserWarning marks a rejected transaction and is never retried.
+        """
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                submit()
+            except UserWarning as warn:
+                self.store.set(key, {'status': FAILED, 'message': str(warn)})
+                return
+            except Exception as err:  # pylint: disable=broad-except
+                if attempt == self.retries or not isinstance(err, self.retry_on):
+                    self.logger.error('Error submitting queued transaction: %s',
+                                      str(err))
+                    self.store.set(key, {'status': FAILED,
+                                         'message': 'ledger unavailable'})
+                    return
+                self.logger.warning('Retrying queued transaction in %.2fs: %s',
+                                    delay, str(err))
+                time.sleep(delay)
+                delay *= 2
+            else:
+                self.store.set(key, {'status': SUCCEEDED})
+                return
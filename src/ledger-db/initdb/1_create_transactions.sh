@@ -40,13 +40,12 @@ readonly ENV_VARS=(
 )
 
 
+# add_transaction prints a SQL statement. main() pipes them all into a single
+# psql session rather than starting one psql process per transaction.
 add_transaction() {
     DATE=$(date -u +"%Y-%m-%d %H:%M:%S.%3N%z" --date="@$(($6))")
-    echo "adding demo transaction: $1 -> $2"
-    psql -X -v ON_ERROR_STOP=1 -v fromacct="$1" -v toacct="$2" -v fromroute="$3" -v toroute="$4" -v amount="$5" --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
-        INSERT INTO TRANSACTIONS (FROM_ACCT, TO_ACCT, FROM_ROUTE, TO_ROUTE, AMOUNT, TIMESTAMP)
-        VALUES (:'fromacct', :'toacct', :'fromroute', :'toroute', :'amount', '$DATE');
-EOSQL
+    echo "adding demo transaction: $1 -> $2" >&2
+    echo "INSERT INTO TRANSACTIONS (FROM_ACCT, TO_ACCT, FROM_ROUTE, TO_ROUTE, AMOUNT, TIMESTAMP) VALUES ('$1', '$2', '$3', '$4', '$5', '$DATE');"
 }
 
 
@@ -109,7 +108,7 @@ main() {
     fi
   done
 
-  create_ledger
+  create_ledger | psql -X -v ON_ERROR_STOP=1 --single-transaction --quiet --username "$POSTGRES_USER" --dbname "$POSTGRES_DB"
 }
 
 
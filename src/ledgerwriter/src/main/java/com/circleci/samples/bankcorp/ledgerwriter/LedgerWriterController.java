@@ -67,6 +67,7 @@ public final class LedgerWriterController {
     public static final String READINESS_CODE = "ok";
     public static final String UNAUTHORIZED_CODE = "not authorized";
     public static final String JWT_ACCOUNT_KEY = "acct";
+    public static final String TRANSACTION_ID_HEADER = "X-Transaction-Id";
 
     @Autowired
     RestTemplate restTemplate;
@@ -172,7 +173,11 @@ public final class LedgerWriterController {
             this.cache.put(transaction.getRequestUuid(),
                     transaction.getTransactionId());
             LOGGER.info("Submitted transaction successfully");
-            return new ResponseEntity<String>(READINESS_CODE,
+            // lets clients tell when balancereader shows the transaction
+            HttpHeaders headers = new HttpHeaders();
+            headers.set(TRANSACTION_ID_HEADER,
+                    Long.toString(transaction.getTransactionId()));
+            return new ResponseEntity<String>(READINESS_CODE, headers,
                     HttpStatus.CREATED);
 
         } catch (JWTVerificationException e) {
@@ -153,6 +153,25 @@ class LedgerWriterControllerTest {
         assertEquals(HttpStatus.CREATED, actualResult.getStatusCode());
     }
 
+    @Test
+    @DisplayName("Given the transaction is committed, return its transaction id")
+    void addTransactionReturnsTransactionId(TestInfo testInfo) {
+        // Given
+        when(transaction.getFromRoutingNum()).thenReturn(NON_LOCAL_ROUTING_NUM);
+        when(transaction.getRequestUuid()).thenReturn(testInfo.getDisplayName());
+        when(transaction.getTransactionId()).thenReturn(42L);
+
+        // When
+        final ResponseEntity actualResult =
+                ledgerWriterController.addTransaction(
+                        BEARER_TOKEN, transaction);
+
+        // Then
+        assertNotNull(actualResult);
+        assertEquals("42", actualResult.getHeaders().getFirst(
+                LedgerWriterController.TRANSACTION_ID_HEADER));
+    }
+
     @Test
     @DisplayName("Given the transaction is internal and the transaction amount == sender balance, " +
             "return HTTP Status 201")
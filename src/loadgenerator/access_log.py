@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Reads frontend access logs for replay
+"""
+
+import collections
+import datetime
+import json
+import re
+
+LogEntry = collections.namedtuple('LogEntry', ['timestamp', 'session', 'method', 'path'])
+
+# Common and combined log formats, as written by gunicorn, nginx or Apache
+CLF_PATTERN = re.compile(
+    r'(?P<host>\S+) \S+ (?P<user>\S+) \[(?P<time>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<path>\S+)[^"]*"')
+CLF_TIME_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+
+
+def parse_time(value):
+    """Convert an epoch number, ISO 8601 or CLF timestamp to epoch seconds.
+
+    Raises: ValueError if the timestamp is not understood
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for parse in (lambda v: datetime.datetime.fromisoformat(v.replace('Z', '+00:00')),
+                  lambda v: datetime.datetime.strptime(v, CLF_TIME_FORMAT)):
+        try:
+            moment = parse(value)
+        except ValueError:
+            continue
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=datetime.timezone.utc)
+        return moment.timestamp()
+    raise ValueError('unknown timestamp format: {}'.format(value))
+
+
+def parse_line(line):
+    """Parse one access log line.
+
+    Lines are either in common/combined log format, or JSON objects with
+    "time", "method" and "path" keys and optionally "user" and "host".
+    The session is the (anonymized) user if logged, otherwise the client.
+
+    Return: a LogEntry, or None if the line cannot be parsed
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        if line.startswith('{'):
+            record = json.loads(line)
+            user = record.get('user')
+            session = user if user not in (None, '', '-') else record.get('host', '-')
+            return LogEntry(parse_time(record['time']), str(session),
+                            record['method'].upper(), record['path'])
+        match = CLF_PATTERN.match(line)
+        if match is None:
+            return None
+        user = match.group('user')
+        session = user if user != '-' else match.group('host')
+        return LogEntry(parse_time(match.group('time')), session,
+                        match.group('method'), match.group('path'))
+    except (KeyError, AttributeError, TypeError, ValueError):
+        return None
+
+
+def read_log(stream):
+    """Lazily parse an access log, skipping lines that cannot be parsed.
+
+    Return: an iterator of LogEntry in log order
+    """
+    for line in stream:
+        entry = parse_line(line)
+        if entry is not None:
+            yield entry
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+#
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Open-model arrival rate profiles for the load generator
+"""
+
+import json
+
+STAGE_TYPES = ('step', 'ramp', 'spike')
+ARRIVAL_PROCESSES = ('poisson', 'uniform')
+
+# seconds between re-evaluations of the rate during a ramp
+RAMP_RESOLUTION = 0.1
+
+
+class ArrivalProfile:
+    """
+    ArrivalProfile describes the target request rate of each endpoint
+    over the course of a test.
+
+    endpoints maps endpoint names to base rates in requests per second.
+    Every stage scales all base rates by a factor over a duration:
+    - step holds its scale for the whole stage
+    - ramp moves linearly from the previous scale to its scale
+    - spike holds its scale, then returns to the previous scale
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, endpoints, stages, arrivals='poisson',
+                 max_in_flight=100, max_lag=1.0):
+        if not endpoints or any(rate < 0 for rate in endpoints.values()):
+            raise ValueError('endpoints must map endpoint names to rates >= 0')
+        if arrivals not in ARRIVAL_PROCESSES:
+            raise ValueError('arrivals must be one of {}'.format(
+                ', '.join(ARRIVAL_PROCESSES)))
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1')
+        self.endpoints = dict(endpoints)
+        self.arrivals = arrivals
+        self.max_in_flight = max_in_flight
+        self.max_lag = max_lag
+        self.segments = []
+        start = 0.0
+        baseline = 0.0
+        for stage in stages:
+            stage_type = stage.get('type', 'step')
+            duration = float(stage['duration'])
+            scale = float(stage['scale'])
+            if stage_type not in STAGE_TYPES:
+                raise ValueError('unknown stage type {}'.format(stage_type))
+            if duration <= 0 or scale < 0:
+                raise ValueError('stage duration must be > 0 and scale >= 0')
+            from_scale = baseline if stage_type == 'ramp' else scale
+            self.segments.append((start, start + duration, from_scale, scale))
+            if stage_type != 'spike':
+                baseline = scale
+            start += duration
+        if not self.segments:
+            raise ValueError('profile must contain at least one stage')
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a profile from a JSON file.
+
+        Raises: ValueError if the profile is invalid
+        """
+        with open(path) as stream:
+            config = json.load(stream)
+        try:
+            return cls(config['endpoints'], config['stages'],
+                       arrivals=config.get('arrivals', 'poisson'),
+                       max_in_flight=int(config.get('max_in_flight', 100)),
+                       max_lag=float(config.get('max_lag', 1.0)))
+        except (KeyError, TypeError) as err:
+            raise ValueError('invalid profile {}: {}'.format(path, err)) from err
+
+    @property
+    def duration(self):
+        """The length of the profile in seconds."""
+        return self.segments[-1][1]
+
+    def next_arrival(self, endpoint, elapsed, share, rng):
+        """Return the number of seconds until the next request to endpoint.
+
+        Params: endpoint - the endpoint name
+                elapsed - seconds since the start of the test
+                share - the fraction of the target rate this caller generates
+                rng - a random.Random instance
+        Return: the delay, or None once the profile has ended
+        """
+        # integrate the rate until it accounts for one more arrival; the
+        # amount needed is exponential for a (non-homogeneous) Poisson process
+        needed = 1.0 if self.arrivals == 'uniform' else rng.expovariate(1)
+        base = self.endpoints[endpoint] * share
+        now = elapsed
+        for start, end, from_scale, to_scale in self.segments:
+            while now < end:
+                step = end - now
+                if from_scale != to_scale:
+                    step = min(step, RAMP_RESOLUTION)
+                middle = now + step / 2
+                rate = base * (from_scale + (to_scale - from_scale) * (middle - start) / (end - start))
+                if rate * step >= needed:
+                    return now + needed / rate - elapsed
+                needed -= rate * step
+                now += step
+        return None
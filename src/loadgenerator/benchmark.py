@@ -0,0 +1,318 @@
+#!/usr/bin/python
+#
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Runs locustfile.py headless and reports latency, throughput and errors
+
+Usage:
+  python benchmark.py run --host URL --run-time SECONDS [--report FILE]
+                          [--baseline FILE] [--slo FILE] ...
+  python benchmark.py compare REPORT --baseline FILE [--slo FILE] ...
+
+Exits with status 1 if an SLO is violated or a regression against the
+baseline is found.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+import gevent
+import locust
+from locust import events
+from locust.env import Environment
+from locust.main import load_locustfile
+
+from histogram import Histogram
+
+REPORT_FORMAT_VERSION = 1
+PERCENTILES = (('p50', 50), ('p90', 90), ('p99', 99), ('p99.9', 99.9))
+# environment variables read by locustfile.py, recorded in every report
+WORKLOAD_SETTINGS = ('CREDENTIALS_FILE', 'LOGIN_RATE', 'WORKLOAD_PROFILE',
+                     'ACCOUNT_SKEW', 'PAYEE_SKEW', 'CONTACTS_MEDIAN',
+                     'CONTACTS_SIGMA', 'CONTACT_SHARE', 'AMOUNT_MEDIAN',
+                     'AMOUNT_SIGMA', 'WORKLOAD_SEED', 'REPLAY_LOG',
+                     'REPLAY_SPEED', 'REPLAY_MAX_LAG')
+
+
+class Recorder:
+    """
+    Recorder keeps a latency histogram and failure count per endpoint
+    for every request completed after the warmup period.
+    """
+
+    def __init__(self, warmup):
+        self.warmup = warmup
+        self.start = None
+        self.histograms = {}
+        self.failures = {}
+
+    def begin(self):
+        """Start the measurement clock."""
+        self.start = time.monotonic()
+
+    def on_request(self, request_type, name, response_time, exception=None, **_kwargs):
+        """events.request listener"""
+        if self.start is None or time.monotonic() - self.start < self.warmup:
+            return
+        key = '{} {}'.format(request_type, name)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+            self.failures[key] = 0
+        # record microseconds, locust reports milliseconds
+        histogram.record((response_time or 0) * 1000)
+        if exception is not None:
+            self.failures[key] += 1
+
+
+def summarize(histogram, failures, window):
+    """Summarize one endpoint for the report."""
+    latency = {'mean': round(histogram.mean / 1000, 3)}
+    for label, percentile in PERCENTILES:
+        latency[label] = histogram.percentile(percentile) / 1000
+    latency['max'] = histogram.max / 1000
+    return {'requests': histogram.total,
+            'failures': failures,
+            'error_rate': failures / histogram.total if histogram.total else 0,
+            'throughput': histogram.total / window if window else 0,
+            'latency_ms': latency,
+            'histogram': histogram.to_dict()}
+
+
+def build_report(recorder, args, started_at, window):
+    """Assemble the JSON report of a run."""
+    total = Histogram()
+    for histogram in recorder.histograms.values():
+        total.merge(histogram)
+    return {
+        'format_version': REPORT_FORMAT_VERSION,
+        'label': args.label,
+        'started_at': started_at,
+        'config': {
+            'host': args.host,
+            'users': args.users,
+            'spawn_rate': args.spawn_rate,
+            'run_time': args.run_time,
+            'warmup': args.warmup,
+            'locust_version': locust.__version__,
+            'python_version': platform.python_version(),
+            'settings': {name: os.environ[name] for name in WORKLOAD_SETTINGS
+                         if name in os.environ},
+        },
+        'endpoints': {key: summarize(histogram, recorder.failures[key], window)
+                      for key, histogram in sorted(recorder.histograms.items())},
+        'total': summarize(total, sum(recorder.failures.values()), window),
+    }
+
+
+def run(args):
+    """Run the load test and return its report."""
+    _, user_classes, shape_class = load_locustfile(args.locustfile)
+    environment = Environment(user_classes=list(user_classes.values()),
+                              shape_class=shape_class,
+                              host=args.host, events=events)
+    runner = environment.create_local_runner()
+    recorder = Recorder(args.warmup)
+    events.request.add_listener(recorder.on_request)
+    events.init.fire(environment=environment, runner=runner, web_ui=None)
+
+    started_at = datetime.datetime.utcnow().isoformat() + 'Z'
+    logging.info('Running %d users against %s for %ss (warmup %ss).',
+                 args.users, args.host, args.run_time, args.warmup)
+    recorder.begin()
+    if shape_class:
+        runner.start_shape()
+    else:
+        runner.start(args.users, spawn_rate=args.spawn_rate)
+    gevent.spawn_later(args.run_time, runner.quit)
+    runner.greenlet.join()
+    events.quitting.fire(environment=environment, reverse=True)
+    return build_report(recorder, args, started_at, args.run_time - args.warmup)
+
+
+def compare(report, baseline, max_regression, min_delta_ms, max_error_increase):
+    """Compare a report against a baseline report.
+
+    Latency percentiles regress when they grow by more than max_regression
+    (a fraction) and by more than min_delta_ms. Throughput regresses when
+    it falls by more than max_regression, error rate when it grows by more
+    than max_error_increase.
+
+    Return: a list of regressions as human readable strings
+    """
+    regressions = []
+    entries = dict(baseline['endpoints'], total=baseline['total'])
+    current = dict(report['endpoints'], total=report['total'])
+    for key, base in sorted(entries.items()):
+        entry = current.get(key)
+        if entry is None:
+            continue
+        for label, _ in PERCENTILES:
+            old, new = base['latency_ms'][label], entry['latency_ms'][label]
+            if new > old * (1 + max_regression) and new - old > min_delta_ms:
+                regressions.append('{}: {} latency {:.1f}ms -> {:.1f}ms'.format(
+                    key, label, old, new))
+        old, new = base['throughput'], entry['throughput']
+        if new < old * (1 - max_regression):
+            regressions.append('{}: throughput {:.2f}/s -> {:.2f}/s'.format(key, old, new))
+        old, new = base['error_rate'], entry['error_rate']
+        if new > old + max_error_increase:
+            regressions.append('{}: error rate {:.2%} -> {:.2%}'.format(key, old, new))
+    return regressions
+
+
+def check_slo(report, slo):
+    """Check a report against service level objectives.
+
+    slo has the form {"total": objectives, "endpoints": {key: objectives}},
+    where the endpoint key "*" applies to every endpoint. Objectives may
+    set latency percentiles ("p50" ... "max") and "error_rate" as upper
+    bounds, and "throughput" as a lower bound.
+
+    Return: a list of violations as human readable strings
+    """
+    checks = [('total', report['total'], slo.get('total', {}))]
+    endpoint_slos = slo.get('endpoints', {})
+    for key, entry in sorted(report['endpoints'].items()):
+        objectives = dict(endpoint_slos.get('*', {}), **endpoint_slos.get(key, {}))
+        checks.append((key, entry, objectives))
+
+    violations = []
+    for key, entry, objectives in checks:
+        for name, limit in sorted(objectives.items()):
+            if name == 'throughput':
+                if entry['throughput'] < limit:
+                    violations.append('{}: throughput {:.2f}/s below {}/s'.format(
+                        key, entry['throughput'], limit))
+            elif name == 'error_rate':
+                if entry['error_rate'] > limit:
+                    violations.append('{}: error rate {:.2%} above {:.2%}'.format(
+                        key, entry['error_rate'], limit))
+            elif name in entry['latency_ms']:
+                if entry['latency_ms'][name] > limit:
+                    violations.append('{}: {} latency {:.1f}ms above {}ms'.format(
+                        key, name, entry['latency_ms'][name], limit))
+            else:
+                raise ValueError('unknown objective {} for {}'.format(name, key))
+    return violations
+
+
+def print_summary(report, stream=sys.stdout):
+    """Print a table of the report."""
+    columns = ['requests', 'errors', 'req/s'] + [label for label, _ in PERCENTILES] + ['max']
+    stream.write('{:<40}'.format('endpoint') + ''.join('{:>10}'.format(c) for c in columns) + '\n')
+    for key, entry in list(report['endpoints'].items()) + [('total', report['total'])]:
+        latency = entry['latency_ms']
+        values = [entry['requests'], '{:.2%}'.format(entry['error_rate']),
+                  '{:.2f}'.format(entry['throughput'])]
+        values += ['{:.1f}'.format(latency[label]) for label, _ in PERCENTILES]
+        values.append('{:.1f}'.format(latency['max']))
+        stream.write('{:<40}'.format(key[:39]) + ''.join('{:>10}'.format(v) for v in values) + '\n')
+
+
+def verdict(report, args):
+    """Apply the SLO and baseline checks to a report.
+
+    Return: the process exit status
+    """
+    problems = []
+    if not report['total']['requests']:
+        problems.append('no requests were recorded')
+    if args.slo:
+        with open(args.slo) as stream:
+            problems += check_slo(report, json.load(stream))
+    if args.baseline:
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)
+        if baseline.get('format_version') != REPORT_FORMAT_VERSION:
+            raise ValueError('unsupported baseline format version {}'.format(
+                baseline.get('format_version')))
+        problems += compare(report, baseline, args.max_regression,
+                            args.min_latency_delta, args.max_error_increase)
+    for problem in problems:
+        logging.error('FAIL %s', problem)
+    if not problems:
+        logging.info('PASS')
+    return 1 if problems else 0
+
+
+def parse_args(argv):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run a benchmark')
+    run_parser.add_argument('--host', default='http://{}'.format(
+        os.environ.get('FRONTEND_ADDR', 'localhost:8080')),
+                            help='frontend URL (default: http://$FRONTEND_ADDR)')
+    run_parser.add_argument('--locustfile', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'locustfile.py'))
+    run_parser.add_argument('--users', type=int, default=int(os.environ.get('USERS', '10')),
+                            help='simulated users (default: $USERS or 10)')
+    run_parser.add_argument('--spawn-rate', type=float, default=10,
+                            help='users started per second (default: %(default)s)')
+    run_parser.add_argument('--run-time', type=float, required=True,
+                            help='test duration in seconds')
+    run_parser.add_argument('--warmup', type=float, default=0,
+                            help='seconds at the start of the test excluded from '
+                                 'the report (default: %(default)s)')
+    run_parser.add_argument('--label', default=os.environ.get('BENCHMARK_LABEL'),
+                            help='label of the run, e.g. the release version')
+    run_parser.add_argument('--report', help='write the JSON report to this file')
+
+    compare_parser = subparsers.add_parser('compare', help='check an existing report')
+    compare_parser.add_argument('report', help='JSON report to check')
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--baseline', help='JSON report to compare against')
+        sub.add_argument('--slo', help='JSON service level objectives to check')
+        sub.add_argument('--max-regression', type=float, default=0.1,
+                         help='tolerated relative regression (default: %(default)s)')
+        sub.add_argument('--min-latency-delta', type=float, default=5,
+                         help='latency changes below this many ms are never '
+                              'regressions (default: %(default)s)')
+        sub.add_argument('--max-error-increase', type=float, default=0.01,
+                         help='tolerated increase of the error rate (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if args.command == 'run' and args.warmup >= args.run_time:
+        parser.error('--warmup must be shorter than --run-time')
+    return args
+
+
+def main(argv):
+    """Run or check a benchmark."""
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args(argv)
+    if args.command == 'run':
+        report = run(args)
+        if args.report:
+            with open(args.report, 'w') as stream:
+                json.dump(report, stream, indent=2)
+    else:
+        with open(args.report) as stream:
+            report = json.load(stream)
+    print_summary(report)
+    return verdict(report, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
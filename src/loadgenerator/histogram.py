@@ -0,0 +1,104 @@
+#!/usr/bin/python
+#
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+High dynamic range latency histograms
+"""
+
+import math
+
+
+class Histogram:
+    """
+    Histogram counts integer values in log-linear buckets, as in
+    HdrHistogram: every recorded value is kept to significant_figures
+    decimal digits of precision, at any magnitude, in memory that grows
+    only with the logarithm of the value range. Histograms with the same
+    precision can be merged and serialized losslessly.
+    """
+
+    def __init__(self, significant_figures=3):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError('significant_figures must be between 1 and 5')
+        self.significant_figures = significant_figures
+        # bits needed to count to 2 * 10^significant_figures within a bucket
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10**significant_figures))
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def _lowest_equivalent(self, value):
+        shift = max(value.bit_length() - self._sub_bucket_bits, 0)
+        return (value >> shift) << shift
+
+    def _highest_equivalent(self, lowest):
+        shift = max(lowest.bit_length() - self._sub_bucket_bits, 0)
+        return lowest + (1 << shift) - 1
+
+    def record(self, value, count=1):
+        """Record value, a non-negative number, count times."""
+        value = max(int(value), 0)
+        key = self._lowest_equivalent(value)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.total += count
+        self.sum += value * count
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Add the counts of other, a Histogram of the same precision."""
+        if other.significant_figures != self.significant_figures:
+            raise ValueError('cannot merge histograms of different precision')
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile):
+        """Return the value below which percentile % of values fall,
+        to the precision of the histogram, or 0 if it is empty."""
+        if not self.total:
+            return 0
+        target = max(math.ceil(self.total * percentile / 100), 1)
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= target:
+                return min(self._highest_equivalent(key), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        """The mean of the recorded values."""
+        return self.sum / self.total if self.total else 0
+
+    def to_dict(self):
+        """Serialize the histogram to a JSON-compatible dict."""
+        return {'significant_figures': self.significant_figures,
+                'total': self.total,
+                'sum': self.sum,
+                'max': self.max,
+                'counts': {str(key): count for key, count in sorted(self.counts.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Deserialize a histogram written by to_dict."""
+        histogram = cls(data['significant_figures'])
+        histogram.counts = {int(key): count for key, count in data['counts'].items()}
+        histogram.total = data['total']
+        histogram.sum = data['sum']
+        histogram.max = data['max']
+        return histogram
@@ -18,18 +18,170 @@ Exercises the frontend endpoints for the system
 """
 
 
+import base64
+import csv
+import itertools
 import json
 import logging
+import os
+import time
+import zlib
 from string import ascii_letters, digits
-from random import randint, random, choice
+from random import Random, randint, random, choice
 
-from locust import HttpUser, TaskSet, SequentialTaskSet, task, between
+from gevent.local import local
+from gevent.lock import Semaphore
+from gevent.pool import Group, Pool
+from gevent.queue import Queue
+from locust import HttpUser, TaskSet, SequentialTaskSet, task, between, constant, events
+from locust.exception import StopUser
+
+from access_log import read_log
+from arrival_profile import ArrivalProfile
+from workload_model import WorkloadModel
 
 MASTER_PASSWORD = "password"
 
 TRANSACTION_ACCT_LIST = [str(randint(1111100000, 1111199999))
                          for _ in range(50)]
 
+# re-login this many seconds before a cached token expires
+TOKEN_REFRESH_MARGIN = 60
+
+
+class CredentialPool:
+    """
+    Pre-provisioned user credentials, handed out according to a
+    WorkloadModel, and the tokens obtained for them. Tokens are shared
+    by every simulated user in this process, so each account logs in
+    once rather than once per simulated session.
+    """
+
+    def __init__(self, path, **model_settings):
+        with open(path, newline='') as stream:
+            credentials = [(row['username'], row.get('password') or MASTER_PASSWORD,
+                            row.get('accountid'))
+                           for row in csv.DictReader(stream)]
+        if not credentials:
+            raise ValueError('no credentials in {}'.format(path))
+        self.account_ids = {username: account_id
+                            for username, _, account_id in credentials}
+        self.model = WorkloadModel(credentials, **model_settings)
+        self.tokens = {}
+
+    def checkout(self):
+        """Return the (username, password) of the next account to act as."""
+        return self.model.actor()[:2]
+
+    def payment(self, username):
+        """
+        Return (account_num, amount) of a payment by username,
+        or None if the pool has no account ids
+        """
+        payee = self.model.payee(username, self.account_ids.get(username))
+        if payee is None:
+            return None
+        return payee, self.model.amount()
+
+    def token(self, username):
+        """Return a cached token for username that is not about to expire."""
+        token, expiry = self.tokens.get(username, (None, 0))
+        if expiry - TOKEN_REFRESH_MARGIN > time.time():
+            return token
+        return None
+
+    def store(self, username, token):
+        """Cache token for username until it expires."""
+        self.tokens[username] = (token, token_expiry(token))
+
+
+class LoginLimiter:
+    """
+    Token bucket capping the rate of logins from this process.
+    A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = 1.0
+        self.last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.allowance = min(1.0, self.allowance + (now - self.last) * self.rate)
+        self.last = now
+
+    def try_acquire(self):
+        """Take a login slot if one is free. Return True on success."""
+        if not self.rate:
+            return True
+        self._refill()
+        if self.allowance < 1:
+            return False
+        self.allowance -= 1
+        return True
+
+    def acquire(self):
+        """Wait for a login slot."""
+        while not self.try_acquire():
+            # time.sleep is cooperative under locust's gevent monkey patching
+            time.sleep((1 - self.allowance) / self.rate)
+
+
+def token_expiry(token):
+    """
+    read the expiry time of a JWT without verifying it
+    returns 0 if the token cannot be decoded
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))['exp']
+    except (IndexError, KeyError, TypeError, ValueError):
+        return 0
+
+
+CREDENTIAL_POOL = (CredentialPool(
+    os.environ['CREDENTIALS_FILE'],
+    account_skew=float(os.environ.get('ACCOUNT_SKEW', '1.0')),
+    payee_skew=float(os.environ.get('PAYEE_SKEW', '1.0')),
+    contacts_median=float(os.environ.get('CONTACTS_MEDIAN', '5')),
+    contacts_sigma=float(os.environ.get('CONTACTS_SIGMA', '1.0')),
+    contact_share=float(os.environ.get('CONTACT_SHARE', '0.8')),
+    amount_median=float(os.environ.get('AMOUNT_MEDIAN', '25')),
+    amount_sigma=float(os.environ.get('AMOUNT_SIGMA', '1.2')),
+    seed=int(os.environ.get('WORKLOAD_SEED', '0')))
+                   if os.environ.get('CREDENTIALS_FILE') else None)
+LOGIN_LIMITER = LoginLimiter(float(os.environ.get('LOGIN_RATE', '1')))
+ARRIVAL_PROFILE = (ArrivalProfile.from_file(os.environ['WORKLOAD_PROFILE'])
+                   if os.environ.get('WORKLOAD_PROFILE') else None)
+REPLAY_LOG = os.environ.get('REPLAY_LOG')
+REPLAY_SPEED = float(os.environ.get('REPLAY_SPEED', '1'))
+REPLAY_MAX_LAG = float(os.environ.get('REPLAY_MAX_LAG', '1'))
+if REPLAY_LOG and (ARRIVAL_PROFILE is not None or CREDENTIAL_POOL is None):
+    raise ValueError("REPLAY_LOG requires CREDENTIALS_FILE and excludes WORKLOAD_PROFILE")
+# arrivals are scheduled relative to the start of the test
+TEST_START = {'time': None}
+
+
+@events.test_start.add_listener
+def on_test_start(**_kwargs):
+    """record the start of the test"""
+    TEST_START['time'] = time.time()
+
+
+@events.test_stop.add_listener
+def on_test_stop(environment, **_kwargs):
+    """warn if the target arrival rate was not met"""
+    if ARRIVAL_PROFILE is None:
+        return
+    missed = [entry for entry in environment.stats.entries.values()
+              if entry.method == 'ARRIVAL']
+    if missed:
+        logging.warning("target arrival rate not met: %s",
+                        ", ".join("{} {}".format(entry.num_failures, entry.name)
+                                  for entry in missed))
+
 
 def signup_helper(locust, username):
     """
@@ -60,6 +212,42 @@ def signup_helper(locust, username):
         return found_token
 
 
+def login_helper(locust, username, password):
+    """
+    log in as an existing user
+    returns the token cookie, or None if the login failed
+    """
+    with locust.client.post("/login", {"username": username,
+                                       "password": password},
+                            catch_response=True) as response:
+        token = None
+        for r_hist in response.history:
+            token = r_hist.cookies.get('token') or token
+        if token:
+            response.success()
+        else:
+            response.failure("login failed")
+        return token
+
+
+def payment_details(username, amount=None):
+    """
+    returns the (account_num, amount) of a payment by username,
+    following the workload model if pre-provisioned accounts are in use
+    """
+    payment = CREDENTIAL_POOL.payment(username) if CREDENTIAL_POOL else None
+    if payment is None:
+        payment = (choice(TRANSACTION_ACCT_LIST), random() * 1000)
+    return payment[0], payment[1] if amount is None else amount
+
+
+def token_cookie(token):
+    """
+    returns the cookies to send with a request made as the owner of token
+    """
+    return {'token': token} if token else None
+
+
 def generate_username():
     """
     generates random 15 character
@@ -153,9 +341,8 @@ class AllTasks(SequentialTaskSet):
             """
             POST to /payment, sending money to other account
             """
-            if amount is None:
-                amount = random() * 1000
-            transaction = {"account_num": choice(TRANSACTION_ACCT_LIST),
+            account_num, amount = payment_details(self.user.username, amount)
+            transaction = {"account_num": account_num,
                            "amount": amount,
                            "uuid": generate_username()}
             with self.client.post("/payment",
@@ -188,16 +375,7 @@ class AllTasks(SequentialTaskSet):
             sends POST request to /login with stored credentials
             succeeds if a token was returned
             """
-            with self.client.post("/login", {"username": self.user.username,
-                                             "password": MASTER_PASSWORD},
-                                  catch_response=True) as response:
-                found_token = False
-                for r_hist in response.history:
-                    found_token |= r_hist.cookies.get('token') is not None
-                if found_token:
-                    response.success()
-                else:
-                    response.failure("login failed")
+            login_helper(self, self.user.username, MASTER_PASSWORD)
 
         @task(1)
         def logout(self):
@@ -212,9 +390,378 @@ class AllTasks(SequentialTaskSet):
             self.interrupt()
 
 
+class PooledTasks(AllTasks.AuthenticatedTasks):
+    """
+    AuthenticatedTasks run as pre-provisioned users, for steady-state
+    load without signups. Cached tokens are reused and new logins are
+    limited to LOGIN_RATE per second.
+    """
+
+    def on_start(self):
+        self.authenticate()
+        super().on_start()
+
+    def authenticate(self):
+        """
+        check out pooled credentials and install a token cookie,
+        logging in only if no usable token is cached
+        """
+        username, password = CREDENTIAL_POOL.checkout()
+        self.user.username = username
+        self.user.password = password
+        token = CREDENTIAL_POOL.token(username)
+        while token is None:
+            LOGIN_LIMITER.acquire()
+            token = login_helper(self, username, password)
+            if token is None:
+                time.sleep(1)
+        CREDENTIAL_POOL.store(username, token)
+        self.client.cookies.set('token', token)
+
+    @task(5)
+    def login(self):
+        """
+        refresh the token of the current user with a new login,
+        if the login rate allows it
+        """
+        if CREDENTIAL_POOL.token(self.user.username) is None:
+            LOGIN_LIMITER.acquire()
+        elif not LOGIN_LIMITER.try_acquire():
+            return
+        token = login_helper(self, self.user.username, self.user.password)
+        if token is not None:
+            CREDENTIAL_POOL.store(self.user.username, token)
+
+    @task(1)
+    def logout(self):
+        """
+        sends a /logout POST request, then continues as another
+        pooled user. The old token stays cached for reuse.
+        """
+        self.client.post("/logout")
+        self.client.cookies.clear()
+        self.authenticate()
+
+
+class OpenModelUser(HttpUser):
+    """
+    Locust class generating requests at the rates of WORKLOAD_PROFILE,
+    whether or not earlier requests have completed.
+
+    The target rates are shared evenly by the simulated users of each
+    load generator process. Arrivals that find max_in_flight requests
+    outstanding are dropped, and arrivals sent more than max_lag seconds
+    late are reported, both as ARRIVAL failures.
+    """
+    abstract = ARRIVAL_PROFILE is None
+    wait_time = constant(0)
+    # the methods a workload profile may set rates for
+    endpoints = ('view_login', 'view_signup', 'view_index', 'view_home',
+                 'payment', 'deposit', 'login', 'signup')
+
+    def on_start(self):
+        self.rng = Random()
+        self.in_flight = Pool(ARRIVAL_PROFILE.max_in_flight)
+        self.funded = set()
+        # without a credential pool, requests are sent as one account
+        # created on first use
+        self.account = None
+        self.account_lock = Semaphore()
+
+    def local_share(self):
+        """the fraction of the target rates generated by this user"""
+        runner = self.environment.runner
+        users = runner.target_user_count or sum(runner.target_user_classes_count.values())
+        return 1 / max(users, 1)
+
+    @task
+    def drive(self):
+        """
+        send requests until the workload ends
+        """
+        self.dispatch()
+
+    def dispatch(self):
+        """
+        issue requests to every endpoint of the profile at its target
+        rate until the profile ends
+        """
+        start = TEST_START['time'] or time.time()
+        now = time.time()
+        due = {}
+        for endpoint in ARRIVAL_PROFILE.endpoints:
+            delay = ARRIVAL_PROFILE.next_arrival(endpoint, now - start,
+                                                 self.local_share(), self.rng)
+            if delay is not None:
+                due[endpoint] = now + delay
+        while due:
+            endpoint = min(due, key=due.get)
+            when = due[endpoint]
+            time.sleep(max(when - time.time(), 0))
+            self.arrive(endpoint, when)
+            delay = ARRIVAL_PROFILE.next_arrival(endpoint, when - start,
+                                                 self.local_share(), self.rng)
+            if delay is None:
+                del due[endpoint]
+            else:
+                due[endpoint] = when + delay
+        logging.info("workload profile complete")
+        self.in_flight.join()
+        raise StopUser()
+
+    def arrive(self, endpoint, when):
+        """send one request to endpoint, scheduled for time when"""
+        lag = time.time() - when
+        if self.in_flight.full():
+            self.missed(endpoint, "dropped", lag,
+                        "{} requests in flight".format(ARRIVAL_PROFILE.max_in_flight))
+            return
+        if lag > ARRIVAL_PROFILE.max_lag:
+            self.missed(endpoint, "late", lag,
+                        "sent over {}s late".format(ARRIVAL_PROFILE.max_lag))
+        self.in_flight.spawn(getattr(self, endpoint))
+
+    def missed(self, endpoint, name, lag, reason):
+        """report an arrival that was not sent on time"""
+        self.environment.events.request.fire(
+            request_type="ARRIVAL", name="{} ({})".format(endpoint, name),
+            response_time=lag * 1000, response_length=0,
+            exception=Exception(reason), context={})
+
+    def identity(self):
+        """
+        returns (username, password, token) of the account to send a
+        request as, funding it on first use
+        token is None if the account could not be created
+        """
+        if CREDENTIAL_POOL is None:
+            with self.account_lock:
+                if self.account is None:
+                    username = generate_username()
+                    signup_helper(self, username)
+                    self.account = (username, MASTER_PASSWORD,
+                                    self.client.cookies.get('token'))
+                    self.client.cookies.clear()
+            username, password, token = self.account
+            if token is None:
+                return self.account
+        else:
+            username, password = self.choose_account()
+            token = CREDENTIAL_POOL.token(username)
+            while token is None:
+                LOGIN_LIMITER.acquire()
+                token = login_helper(self, username, password)
+                self.client.cookies.clear()
+                if token is None:
+                    # back off from a failing userservice, whatever LOGIN_RATE
+                    time.sleep(1)
+            CREDENTIAL_POOL.store(username, token)
+        if username not in self.funded:
+            self.funded.add(username)
+            self.deposit(1000000, token)
+        return username, password, token
+
+    def choose_account(self):
+        """returns the (username, password) of the pooled account to act as"""
+        return CREDENTIAL_POOL.checkout()
+
+    def get_page(self, path, token=None):
+        """load a page, failing on redirects"""
+        with self.client.get(path, cookies=token_cookie(token),
+                             catch_response=True) as response:
+            for r_hist in response.history:
+                if r_hist.status_code > 200 and r_hist.status_code < 400:
+                    response.failure("Got redirect")
+
+    def view_login(self):
+        """load the /login page"""
+        self.get_page("/login")
+
+    def view_signup(self):
+        """load the /signup page"""
+        self.get_page("/signup")
+
+    def view_index(self):
+        """load the / page"""
+        self.get_page("/", self.identity()[2])
+
+    def view_home(self):
+        """load the /home page"""
+        self.get_page("/home", self.identity()[2])
+
+    def payment(self):
+        """POST to /payment, sending money to other account"""
+        username, _, token = self.identity()
+        account_num, amount = payment_details(username)
+        transaction = {"account_num": account_num,
+                       "amount": amount,
+                       "uuid": generate_username()}
+        with self.client.post("/payment", data=transaction,
+                              cookies=token_cookie(token),
+                              catch_response=True) as response:
+            if response.url is None or "failed" in response.url:
+                response.failure("payment failed")
+
+    def deposit(self, amount=None, token=None):
+        """POST to /deposit, depositing external money into account"""
+        if amount is None:
+            amount = random() * 1000
+        acct_info = {"account_num": choice(TRANSACTION_ACCT_LIST),
+                     "routing_num": "111111111"}
+        transaction = {"account": json.dumps(acct_info),
+                       "amount": amount,
+                       "uuid": generate_username()}
+        with self.client.post("/deposit", data=transaction,
+                              cookies=token_cookie(token or self.identity()[2]),
+                              catch_response=True) as response:
+            if response.url is None or "failed" in response.url:
+                response.failure("deposit failed")
+
+    def login(self):
+        """sends POST request to /login, refreshing a cached token"""
+        username, password, _ = self.identity()
+        token = login_helper(self, username, password)
+        self.client.cookies.clear()
+        if token is None:
+            return
+        if CREDENTIAL_POOL is None:
+            self.account = (username, password, token)
+        else:
+            CREDENTIAL_POOL.store(username, token)
+
+    def signup(self):
+        """sends POST request to /signup to create a new user"""
+        signup_helper(self, generate_username())
+        self.client.cookies.clear()
+
+
+if ARRIVAL_PROFILE is not None:
+    UNKNOWN_ENDPOINTS = set(ARRIVAL_PROFILE.endpoints) - set(OpenModelUser.endpoints)
+    if UNKNOWN_ENDPOINTS:
+        raise ValueError("unknown endpoints in workload profile: {}".format(
+            ", ".join(sorted(UNKNOWN_ENDPOINTS))))
+
+
+class ReplaySession:
+    """
+    A logged user session being replayed as a pooled account. Its
+    requests are queued and sent one at a time, in log order.
+    """
+
+    def __init__(self, account, authenticated):
+        self.account = account
+        self.authenticated = authenticated
+        self.queue = Queue()
+        self.worker = None
+
+
+class ReplayUser(OpenModelUser):
+    """
+    Locust class replaying the access log REPLAY_LOG at REPLAY_SPEED
+    times the logged rate.
+
+    Each logged session (user, or client address if anonymous) is mapped
+    onto a pooled account, and its requests are sent in log order, each
+    no earlier than its logged time. The sessions are partitioned between
+    the simulated users of each load generator process.
+    """
+    abstract = REPLAY_LOG is None
+    # POST requests replayed by the corresponding OpenModelUser methods
+    actions = {'/payment': 'payment', '/deposit': 'deposit', '/login': 'login',
+               '/signup': 'signup', '/logout': 'logout'}
+    anonymous_paths = ('/login', '/signup')
+    counter = itertools.count()
+
+    def on_start(self):
+        self.funded = set()
+        self.account = None
+        self.index = next(self.counter)
+        self.sessions = {}
+        self.workers = Group()
+        self.current = local()
+
+    def on_stop(self):
+        self.workers.kill()
+
+    def dispatch(self):
+        """
+        hand every logged request of this user's partition to its
+        session when it is due
+        """
+        start = TEST_START['time'] or time.time()
+        first = None
+        users = round(1 / self.local_share())
+        accounts = CREDENTIAL_POOL.model.accounts
+        with open(REPLAY_LOG) as stream:
+            for entry in read_log(stream):
+                if first is None:
+                    first = entry.timestamp
+                key = zlib.crc32(entry.session.encode('utf-8'))
+                if key % users != self.index % users:
+                    continue
+                session = self.sessions.get(entry.session)
+                if session is None:
+                    path = entry.path.split('?')[0]
+                    session = self.sessions[entry.session] = ReplaySession(
+                        accounts[key % len(accounts)][:2],
+                        path not in self.anonymous_paths)
+                when = start + (entry.timestamp - first) / REPLAY_SPEED
+                time.sleep(max(when - time.time(), 0))
+                session.queue.put((when, entry))
+                if session.worker is None or session.worker.dead:
+                    session.worker = self.workers.spawn(self.run_session, session)
+        self.workers.join()
+        logging.info("access log replay complete")
+        raise StopUser()
+
+    def run_session(self, session):
+        """send the queued requests of session in order"""
+        self.current.session = session
+        while not session.queue.empty():
+            when, entry = session.queue.get()
+            lag = time.time() - when
+            path = entry.path.split('?')[0]
+            if lag > REPLAY_MAX_LAG:
+                self.missed(path, "late", lag, "sent over {}s late".format(REPLAY_MAX_LAG))
+            self.replay(session, entry, path)
+
+    def replay(self, session, entry, path):
+        """send one logged request"""
+        action = self.actions.get(path) if entry.method == 'POST' else None
+        if action is not None:
+            getattr(self, action)()
+            if action in ('login', 'signup'):
+                session.authenticated = True
+            elif action == 'logout':
+                session.authenticated = False
+        elif entry.method == 'GET':
+            token = self.identity()[2] if session.authenticated else None
+            self.client.get(entry.path, name=path, cookies=token_cookie(token))
+        else:
+            self.missed(path, "unsupported", 0, "{} not replayed".format(entry.method))
+
+    def choose_account(self):
+        """the account the current session is mapped to"""
+        return self.current.session.account
+
+    def login(self):
+        """sends POST request to /login as the current session's account"""
+        username, password = self.choose_account()
+        token = login_helper(self, username, password)
+        self.client.cookies.clear()
+        if token is not None:
+            CREDENTIAL_POOL.store(username, token)
+
+    def logout(self):
+        """sends a /logout POST request"""
+        self.client.post("/logout", cookies=token_cookie(self.identity()[2]))
+        self.client.cookies.clear()
+
+
 class WebsiteUser(HttpUser):
     """
     Locust class to simulate HTTP users
     """
-    tasks = [AllTasks]
+    abstract = ARRIVAL_PROFILE is not None or REPLAY_LOG is not None
+    tasks = [PooledTasks] if CREDENTIAL_POOL else [AllTasks]
     wait_time = between(1, 1)
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+#
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Skewed workload model over pre-provisioned accounts
+"""
+
+import bisect
+import itertools
+import math
+from random import Random
+
+
+class ZipfSampler:
+    """
+    ZipfSampler draws indexes in [0, n) where index k has probability
+    proportional to 1 / (k + 1) ** skew. A skew of 0 is uniform.
+    """
+
+    def __init__(self, n, skew):
+        if n < 1:
+            raise ValueError('cannot sample from an empty population')
+        self.cumulative = list(itertools.accumulate(
+            1 / (k + 1) ** skew for k in range(n)))
+
+    def sample(self, rng):
+        """Draw an index."""
+        point = rng.random() * self.cumulative[-1]
+        return min(bisect.bisect_right(self.cumulative, point),
+                   len(self.cumulative) - 1)
+
+
+class WorkloadModel:
+    """
+    WorkloadModel chooses which accounts act, whom they pay and how much.
+
+    Accounts are ranked by popularity in an order fixed by the seed, so
+    that every load generator process agrees on the popular accounts.
+    The acting account and the payees both follow Zipf distributions
+    over that ranking. Each account has its own contact list, of
+    lognormally distributed size, and pays a contact with probability
+    contact_share, otherwise any account.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, accounts, account_skew=1.0, payee_skew=1.0,
+                 contacts_median=5, contacts_sigma=1.0, contact_share=0.8,
+                 amount_median=25.0, amount_sigma=1.2, max_amount=1000.0,
+                 seed=0):
+        """
+        Params: accounts - a list of (username, password, accountid) tuples,
+                           accountid may be None if unknown
+        """
+        self.accounts = list(accounts)
+        Random(seed).shuffle(self.accounts)
+        self.account_ids = [account[2] for account in self.accounts if account[2]]
+        self.actors = ZipfSampler(len(self.accounts), account_skew)
+        self.payees = ZipfSampler(len(self.account_ids), payee_skew) \
+            if self.account_ids else None
+        self.contacts_median = contacts_median
+        self.contacts_sigma = contacts_sigma
+        self.contact_share = contact_share
+        self.amount_median = amount_median
+        self.amount_sigma = amount_sigma
+        self.max_amount = max_amount
+        self.seed = seed
+        self.rng = Random()
+        self._contacts = {}
+
+    def actor(self):
+        """Return the (username, password, accountid) of an acting account."""
+        return self.accounts[self.actors.sample(self.rng)]
+
+    def contacts(self, username):
+        """Return the account ids username pays most, fixed by the seed."""
+        contacts = self._contacts.get(username)
+        if contacts is None:
+            rng = Random('{}:{}'.format(self.seed, username))
+            size = int(round(rng.lognormvariate(math.log(self.contacts_median),
+                                                self.contacts_sigma)))
+            contacts = [self.account_ids[self.payees.sample(rng)]
+                        for _ in range(max(size, 1))]
+            self._contacts[username] = contacts
+        return contacts
+
+    def payee(self, username, account_id=None):
+        """Return the account id of a payee of username, or None if no
+        account ids are known."""
+        if self.payees is None:
+            return None
+        for _ in range(10):
+            if self.rng.random() < self.contact_share:
+                payee = self.rng.choice(self.contacts(username))
+            else:
+                payee = self.account_ids[self.payees.sample(self.rng)]
+            if payee != account_id:
+                return payee
+        return None
+
+    def amount(self):
+        """Return a payment amount in dollars."""
+        amount = self.rng.lognormvariate(math.log(self.amount_median),
+                                         self.amount_sigma)
+        return round(min(max(amount, 0.01), self.max_amount), 2)
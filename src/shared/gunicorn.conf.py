@@ -0,0 +1,43 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+gunicorn server hooks, loaded from the working directory on start
+
+With ENABLE_METRICS=true, workers share their Prometheus samples through
+files in PROMETHEUS_MULTIPROC_DIR (default: /tmp/prometheus).
+"""
+
+import os
+import shutil
+
+# prometheus_client picks its storage when first imported, so this must be
+# set before the app is loaded
+if os.environ.get('ENABLE_METRICS') == 'true':
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Discard the samples of a previous run."""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drop the live gauges of a worker that exited."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,75 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Copy the shared Python modules into the services that use them.
+
+The services are built from their own directories, so each keeps a copy
+of the modules it shares with the others. The copies in src/shared are
+the canonical ones: edit them, then run this script. With --check, it
+changes nothing and fails if a copy differs from its canonical module.
+"""
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+SHARED_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.dirname(SHARED_DIR)
+
+# the services keeping a copy of each shared module
+COPIES = {
+    'fastjson.py': ('contacts', 'frontend', 'userservice'),
+    'gunicorn.conf.py': ('contacts', 'frontend', 'userservice'),
+    'jsonlog.py': ('contacts', 'frontend', 'userservice'),
+    'querylog.py': ('contacts', 'userservice'),
+    'sampling_profiler.py': ('contacts', 'frontend', 'userservice'),
+    'tracing.py': ('contacts', 'frontend', 'userservice'),
+}
+
+
+def stale_copies():
+    """Return (canonical, copy) paths of the copies that differ."""
+    stale = []
+    for name, services in sorted(COPIES.items()):
+        canonical = os.path.join(SHARED_DIR, name)
+        for service in services:
+            copy = os.path.join(SRC_DIR, service, name)
+            if not os.path.exists(copy) or not filecmp.cmp(canonical, copy, shallow=False):
+                stale.append((canonical, copy))
+    return stale
+
+
+def main(argv):
+    """Sync or check the copies."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--check', action='store_true',
+                        help='fail if a copy differs instead of updating it')
+    args = parser.parse_args(argv)
+    stale = stale_copies()
+    for canonical, copy in stale:
+        if args.check:
+            print('{} differs from {}, run {} to update it'.format(
+                os.path.relpath(copy), os.path.relpath(canonical),
+                os.path.relpath(__file__)), file=sys.stderr)
+        else:
+            shutil.copyfile(canonical, copy)
+            print('updated {}'.format(os.path.relpath(copy)))
+    return 1 if args.check and stale else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,238 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+tracing installs the OpenTelemetry tracer provider, sampling and exporting
+spans as configured by the environment
+
+TRACE_SAMPLE_RATIO keeps that share of traces, decided by trace id so that
+every service keeps the same traces. Traces left out are not recorded at
+all. With TRACE_KEEP_ERRORS=true, traces with a failed span are kept as
+well, and with TRACE_KEEP_SLOW_MS, traces whose request took that long.
+Either one means recording every span of every trace and deciding when
+the request ends, so the ratio then only reduces what is exported, not
+the cost of recording. The batch exporter is tuned with the standard
+OTEL_BSP_* variables. What became of finished spans is counted in the
+trace_spans_total metric.
+"""
+
+import collections
+import os
+import threading
+
+from opentelemetry import trace
+from opentelemetry.baggage.propagation import W3CBaggagePropagator
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.propagate import set_global_textmap
+from opentelemetry.propagators.b3 import B3MultiFormat
+from opentelemetry.propagators.composite import CompositePropagator
+from opentelemetry.sdk.environment_variables import OTEL_BSP_MAX_QUEUE_SIZE
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import (BatchSpanProcessor, SpanExporter,
+                                            SpanExportResult)
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+from metrics import TRACE_SPANS
+
+# traces held back or remembered by TailSamplingProcessor
+MAX_PENDING_TRACES = 10000
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """Passes the spans of the traces worth keeping on to processor.
+
+    The spans of a trace are held back until its local root span, the
+    first span of the trace in this process, ends. The trace is kept if
+    its trace id falls within ratio, as TraceIdRatioBased decides it, if
+    keep_errors and one of its spans failed, or if the root span took at
+    least slow_seconds. Spans ending after their root follow the decision
+    made for it.
+    """
+
+    def __init__(self, processor, ratio, keep_errors=True, slow_seconds=None,
+                 max_traces=MAX_PENDING_TRACES):
+        self._processor = processor
+        self._bound = TraceIdRatioBased.get_bound_for_rate(ratio)
+        self._keep_errors = keep_errors
+        self._slow_ns = None if slow_seconds is None else int(slow_seconds * 1e9)
+        self._max_traces = max_traces
+        self._pending = collections.OrderedDict()  # trace id -> ended spans
+        self._decided = collections.OrderedDict()  # trace id -> kept
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None):
+        self._processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        with self._lock:
+            kept = self._decided.get(trace_id)
+            if kept is not None:
+                spans = [span]
+            else:
+                spans = self._pending.setdefault(trace_id, [])
+                spans.append(span)
+                if span.parent is not None and not span.parent.is_remote:
+                    if len(self._pending) > self._max_traces:
+                        # the root of the oldest trace never ended here
+                        _, evicted = self._pending.popitem(last=False)
+                        TRACE_SPANS.labels('evicted').inc(len(evicted))
+                    return
+                del self._pending[trace_id]
+                kept = self._keep(span, spans)
+                self._decided[trace_id] = kept
+                if len(self._decided) > self._max_traces:
+                    self._decided.popitem(last=False)
+        if not kept:
+            TRACE_SPANS.labels('not_kept').inc(len(spans))
+            return
+        for ended in spans:
+            self._processor.on_end(ended)
+
+    def _keep(self, root, spans):
+        """Return whether to keep the trace of local root span root."""
+        if root.context.trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self._bound:
+            return True
+        if self._keep_errors and any(span.status.status_code is StatusCode.ERROR
+                                     for span in spans):
+            return True
+        return (self._slow_ns is not None
+                and root.end_time - root.start_time >= self._slow_ns)
+
+    def shutdown(self):
+        self._processor.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self._processor.force_flush(timeout_millis)
+
+
+class CountingBatchSpanProcessor(SpanProcessor):
+    """Exports spans through a BatchSpanProcessor with a queue of
+    max_queue_size spans, counting the spans it drops when its queue is
+    full.
+
+    The queued spans are counted as they are passed on and as their batch
+    is handed to the exporter, having left the queue.
+
+    Params: kwargs - further BatchSpanProcessor arguments
+    """
+
+    def __init__(self, exporter, max_queue_size=None, **kwargs):
+        if max_queue_size is None:
+            max_queue_size = int(os.environ.get(OTEL_BSP_MAX_QUEUE_SIZE, '2048'))
+        self.max_queue_size = max_queue_size
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._processor = BatchSpanProcessor(
+            CountingSpanExporter(exporter, on_export=self._dequeued),
+            max_queue_size=max_queue_size, **kwargs)
+
+    def _dequeued(self, count):
+        with self._lock:
+            self._queued = max(self._queued - count, 0)
+
+    def on_start(self, span, parent_context=None):
+        self._processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        if span.context.trace_flags.sampled:
+            with self._lock:
+                if self._queued >= self.max_queue_size:
+                    # the queue is bounded, so the oldest queued span is dropped
+                    TRACE_SPANS.labels('queue_full').inc()
+                else:
+                    self._queued += 1
+        self._processor.on_end(span)
+
+    def shutdown(self):
+        self._processor.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self._processor.force_flush(timeout_millis)
+
+
+class CountingSpanExporter(SpanExporter):
+    """Counts the spans that exporter exported or failed to export.
+
+    Params: on_export - called with the number of spans of each batch,
+                        before it is exported. Optional
+    """
+
+    def __init__(self, exporter, on_export=None):
+        self._exporter = exporter
+        self._on_export = on_export
+
+    def export(self, spans):
+        if self._on_export is not None:
+            self._on_export(len(spans))
+        result = self._exporter.export(spans)
+        TRACE_SPANS.labels('exported' if result is SpanExportResult.SUCCESS
+                           else 'export_failed').inc(len(spans))
+        return result
+
+    def shutdown(self):
+        self._exporter.shutdown()
+
+
+class _DiscardingSpanExporter(SpanExporter):
+    """Accepts spans without sending them anywhere."""
+
+    def export(self, spans):
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def init_tracer_provider(service_name):
+    """Install the global tracer provider and propagators for service_name.
+
+    Return: the tracer provider
+    Raises: ValueError if a TRACE_* variable is invalid
+    """
+    ratio = float(os.environ.get('TRACE_SAMPLE_RATIO', '1'))
+    if not 0 <= ratio <= 1:
+        raise ValueError('TRACE_SAMPLE_RATIO must be between 0 and 1')
+    keep_errors = os.environ.get('TRACE_KEEP_ERRORS', 'false') == 'true'
+    slow_ms = os.environ.get('TRACE_KEEP_SLOW_MS')
+    slow_seconds = float(slow_ms) / 1000 if slow_ms else None
+    exporter_name = os.environ.get('TRACE_EXPORTER', 'otlp')
+    if exporter_name == 'otlp':
+        exporter = OTLPSpanExporter()
+    elif exporter_name == 'none':
+        exporter = _DiscardingSpanExporter()
+    else:
+        raise ValueError('TRACE_EXPORTER must be otlp or none')
+
+    processor = CountingBatchSpanProcessor(exporter)
+    # Errors and slow requests are only known once a request ends, so
+    # keeping them means recording every trace and deciding at the end.
+    # Otherwise unsampled traces are not recorded at all, which is why
+    # keeping errors is opt-in.
+    if ratio < 1 and (keep_errors or slow_seconds is not None):
+        sampler = ParentBased(ALWAYS_ON)
+        processor = TailSamplingProcessor(processor, ratio, keep_errors, slow_seconds)
+    else:
+        sampler = ParentBased(TraceIdRatioBased(ratio))
+
+    provider = TracerProvider(sampler=sampler,
+                              resource=Resource.create({SERVICE_NAME: service_name}))
+    provider.add_span_processor(processor)
+    trace.set_tracer_provider(provider)
+    set_global_textmap(CompositePropagator(
+        [B3MultiFormat(), TraceContextTextMapPropagator(), W3CBaggagePropagator()]))
+    return provider
@@ -0,0 +1,99 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmarks of the per-request work of userservice, run by
+extras/microbench/microbench.py
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import bleach
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from userservice import create_app
+from validation import sanitize
+
+NEW_USER_REQUEST = {
+    'username': 'jdoe_1234',
+    'password': 'correct horse battery staple',
+    'password-repeat': 'correct horse battery staple',
+    'firstname': 'John',
+    'lastname': 'Doe',
+    'birthday': '2000-01-01',
+    'timezone': 'GMT+1',
+    'address': '1600 Amphitheatre Parkway <script>alert(1)</script>',
+    'state': 'CA',
+    'zip': '94043',
+    'ssn': '123-45-6789',
+}
+
+
+def closure(function, name):
+    """Return the variable name that function closes over, such as a
+    helper defined inside create_app."""
+    cells = dict(zip(function.__code__.co_freevars, function.__closure__ or ()))
+    return cells[name].cell_contents
+
+
+def cases():
+    """Build the fixtures and return the benchmarks."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with tempfile.TemporaryDirectory() as directory:
+        private_key_path = os.path.join(directory, 'jwtRS256.key')
+        public_key_path = os.path.join(directory, 'jwtRS256.key.pub')
+        with open(private_key_path, 'wb') as file:
+            file.write(key.private_bytes(serialization.Encoding.PEM,
+                                         serialization.PrivateFormat.PKCS8,
+                                         serialization.NoEncryption()))
+        with open(public_key_path, 'wb') as file:
+            file.write(key.public_key().public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+        # run with ENABLE_TRACING=true to measure the tracing overhead
+        os.environ.setdefault('ENABLE_TRACING', 'false')
+        os.environ.setdefault('TRACE_EXPORTER', 'none')
+        os.environ.setdefault('POD_NAMESPACE', 'microbench')
+        os.environ.update({'TOKEN_EXPIRY_SECONDS': '3600',
+                           'PRIV_KEY_PATH': private_key_path,
+                           'PUB_KEY_PATH': public_key_path,
+                           'ACCOUNTS_DB_URI': 'sqlite://'})
+        app = create_app()
+
+    validate_new_user = closure(app.view_functions['create_user'], '__validate_new_user')
+    sanitized = sanitize(NEW_USER_REQUEST)
+
+    def encode_token():
+        # the token issued by /login
+        jwt.encode({'user': 'jdoe_1234',
+                    'acct': '1011226111',
+                    'name': 'John Doe',
+                    'iat': datetime.utcnow(),
+                    'exp': datetime.utcnow() + timedelta(
+                        seconds=app.config['EXPIRY_SECONDS'])},
+                   app.config['PRIVATE_KEY'], algorithm='RS256')
+
+    client = app.test_client()
+
+    return {
+        'ready_request': lambda: client.get('/ready'),
+        'validate_new_user': lambda: validate_new_user(sanitized),
+        'sanitize_new_user': lambda: sanitize(NEW_USER_REQUEST),
+        'sanitize_login': lambda: (bleach.clean(NEW_USER_REQUEST['username']),
+                                   bleach.clean(NEW_USER_REQUEST['password'])),
+        'encode_token': encode_token,
+    }
@@ -16,9 +16,12 @@
 db manages interactions with the underlying database
 """
 
+import csv
+import io
 import logging
 import random
-from sqlalchemy import create_engine, MetaData, Table, Column, String, Date, LargeBinary
+from sqlalchemy import create_engine, select, MetaData, Table, Column, String, Date, LargeBinary
+from sqlalchemy.exc import DBAPIError
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 
 
@@ -28,7 +31,7 @@ class UserDb:
     to handle db operations for userservice
     """
 
-    def __init__(self, uri, logger=logging):
+    def __init__(self, uri, logger=logging, query_log=None):
         self.engine = create_engine(uri)
         self.logger = logger
         self.users_table = Table(
@@ -52,6 +55,9 @@ class UserDb:
             engine=self.engine,
             service='users',
         )
+        # Time statements and log the slow ones
+        if query_log is not None:
+            query_log.instrument(self.engine, 'users')
 
     def add_user(self, user):
         """Add a user to the database.
@@ -61,10 +67,81 @@ class UserDb:
         Raises: SQLAlchemyError if there was an issue with the database
         """
         statement = self.users_table.insert().values(user)
-        self.logger.debug('QUERY: %s', str(statement))
+        self.logger.debug('QUERY: %s', statement)
         with self.engine.connect() as conn:
             conn.execute(statement)
 
+    def add_users(self, users):
+        """Add many users to the database in a single transaction.
+
+        Loads through PostgreSQL COPY when available, otherwise falls back
+        to a multi-row INSERT.
+
+        Params: users - a list of key/value dicts of attributes describing
+                        new users, each with the same keys as for add_user
+        Raises: SQLAlchemyError if there was an issue with the database,
+                in which case no user is added
+        """
+        if not users:
+            return
+        if self.engine.dialect.name != 'postgresql':
+            with self.engine.begin() as conn:
+                conn.execute(self.users_table.insert(), users)
+            return
+
+        columns = [column.name for column in self.users_table.columns]
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for user in users:
+            writer.writerow([_copy_value(user[column]) for column in columns])
+        buf.seek(0)
+        statement = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            self.users_table.name, ', '.join(columns))
+        self.logger.debug('QUERY: %s', statement)
+        dbapi = self.engine.dialect.dbapi
+        with self.engine.begin() as conn:
+            try:
+                with conn.connection.cursor() as cursor:
+                    cursor.copy_expert(statement, buf)
+            except dbapi.Error as err:
+                raise DBAPIError.instance(statement, None, err, dbapi.Error)
+        self.logger.debug('RESULT: copied %d users.', len(users))
+
+    def generate_accountids(self, count):
+        """Generates count globally unique alphanumerical accountids.
+
+        Candidates are checked against the database in batches rather
+        than one query per accountid.
+        """
+        self.logger.debug('Generating %d account IDs', count)
+        accountids = set()
+        with self.engine.connect() as conn:
+            while len(accountids) < count:
+                candidates = {str(random.randint(10**9, 10**10 - 1))
+                              for _ in range(count - len(accountids))}
+                candidates -= accountids
+                existing = self._existing(
+                    conn, self.users_table.c.accountid, candidates)
+                accountids |= candidates - existing
+        self.logger.debug('RESULT: %d account IDs generated.', count)
+        return list(accountids)
+
+    def get_existing_usernames(self, usernames):
+        """Return the subset of usernames that already exist."""
+        with self.engine.connect() as conn:
+            return self._existing(conn, self.users_table.c.username, usernames)
+
+    def _existing(self, conn, column, values, batch_size=1000):
+        """Return the subset of values present in column."""
+        values = list(values)
+        existing = set()
+        for i in range(0, len(values), batch_size):
+            statement = select(column).where(
+                column.in_(values[i:i + batch_size]))
+            self.logger.debug('QUERY: %s', statement)
+            existing.update(row[0] for row in conn.execute(statement))
+        return existing
+
     def generate_accountid(self):
         """Generates a globally unique alphanumerical accountid."""
         self.logger.debug('Generating an account ID')
@@ -76,7 +153,7 @@ class UserDb:
                 statement = self.users_table.select().where(
                     self.users_table.c.accountid == accountid
                 )
-                self.logger.debug('QUERY: %s', str(statement))
+                self.logger.debug('QUERY: %s', statement)
                 result = conn.execute(statement).first()
                 # If there already exists an account, try again.
                 if result is not None:
@@ -97,8 +174,17 @@ class UserDb:
         """
         statement = self.users_table.select().where(
             self.users_table.c.username == username)
-        self.logger.debug('QUERY: %s', str(statement))
+        self.logger.debug('QUERY: %s', statement)
         with self.engine.connect() as conn:
             result = conn.execute(statement).first()
         self.logger.debug('RESULT: fetched user data for %s', username)
         return dict(result) if result is not None else None
+
+
+def _copy_value(value):
+    """Format a value for PostgreSQL COPY in CSV format."""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return '\\x' + value.hex()
+    return value
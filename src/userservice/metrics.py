@@ -0,0 +1,128 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+metrics exposes Prometheus metrics of requests, database queries and
+password hashing
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(see gunicorn.conf.py) and /metrics aggregates the samples of all workers.
+"""
+
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+from sqlalchemy import event
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests',
+    ['method', 'route', 'status'])
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being handled',
+    multiprocess_mode='livesum')
+QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'Time spent executing database statements',
+    ['db', 'operation'])
+QUERY_ERRORS = Counter(
+    'db_query_errors_total', 'Database statements that raised an error',
+    ['db', 'operation'])
+POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Connections of the database pool by state',
+    ['db', 'state'], multiprocess_mode='livesum')
+BCRYPT_SECONDS = Histogram(
+    'bcrypt_duration_seconds', 'Time spent hashing and checking passwords',
+    ['operation'], buckets=(.05, .1, .15, .2, .25, .3, .4, .5, .75, 1, 2, 5))
+TRACE_SPANS = Counter(
+    'trace_spans_total', 'Finished spans by what became of them', ['outcome'])
+LOG_MESSAGES_DROPPED = Counter(
+    'log_messages_dropped_total', 'Log records dropped because the log queue was full')
+
+
+def init_app(app):
+    """Time every request of app and serve the metrics at /metrics."""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.after_request
+    def _record_request(response):
+        if 'metrics_start' in g:
+            # the route template keeps the label set small, unlike the path
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - g.metrics_start)
+        return response
+
+    @app.teardown_request
+    def _end_request(_exc):
+        if g.pop('metrics_start', None) is not None:
+            REQUESTS_IN_FLIGHT.dec()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():  # pylint: disable=unused-variable
+        """Metrics in the Prometheus text format."""
+        registry = REGISTRY
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_engine(engine, db_name):
+    """Time the statements of a SQLAlchemy engine and track its pool."""
+    checked_out = POOL_CONNECTIONS.labels(db_name, 'checked_out')
+    pooled = POOL_CONNECTIONS.labels(db_name, 'pooled')
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_execute(conn, _cursor, _statement, _parameters, _context, _executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_execute(conn, _cursor, statement, _parameters, _context, _executemany):
+        QUERY_SECONDS.labels(db_name, _operation(statement)).observe(
+            time.perf_counter() - conn.info['metrics_start'].pop())
+
+    @event.listens_for(engine, 'handle_error')
+    def _on_error(context):
+        starts = context.connection.info.get('metrics_start') if context.connection else None
+        if starts:
+            starts.pop()
+        QUERY_ERRORS.labels(db_name, _operation(context.statement or '')).inc()
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(_dbapi_connection, _record):
+        pooled.inc()
+
+    @event.listens_for(engine, 'close')
+    def _on_close(_dbapi_connection, _record):
+        pooled.dec()
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(_dbapi_connection, _record, _proxy):
+        checked_out.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def _on_checkin(_dbapi_connection, _record):
+        checked_out.dec()
+
+
+def _operation(statement):
+    """Return the SQL verb of statement, e.g. SELECT."""
+    words = statement.split(None, 1)
+    return words[0].upper() if words else 'UNKNOWN'
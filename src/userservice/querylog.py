@@ -0,0 +1,165 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+querylog times the statements of SQLAlchemy engines, logs the slow ones and
+keeps per-statement stats
+
+Only the types of bound parameters are logged, never their values.
+"""
+
+import collections
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+# statements with more distinct texts are not tracked
+MAX_STATEMENTS = 1000
+# parameter lists longer than this are summarized by type
+MAX_SHAPE_PARAMETERS = 10
+
+_PLACEHOLDER = r'(?:%\(\w+\)s|%s|\?|:\w+)'
+_PLACEHOLDER_LIST = re.compile(r'\(\s*{0}(?:\s*,\s*{0})*\s*\)'.format(_PLACEHOLDER))
+_REPEATED_ROWS = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+
+
+def normalize(statement):
+    """Return statement with lists of placeholders, such as expanded IN
+    lists and multi-row VALUES, collapsed so that they share one entry."""
+    statement = _PLACEHOLDER_LIST.sub('(...)', ' '.join(statement.split()))
+    return _REPEATED_ROWS.sub(r'\1, ...', statement)
+
+
+def parameter_shape(parameters, executemany=False):
+    """Describe the types of bound parameters without their values,
+    e.g. 'username_1: str' or '100 x (str, int)'."""
+    if executemany:
+        return '{} x ({})'.format(len(parameters),
+                                  parameter_shape(parameters[0]) if parameters else '')
+    if isinstance(parameters, dict):
+        items = [(name, type(value).__name__) for name, value in parameters.items()]
+    else:
+        items = [(None, type(value).__name__) for value in parameters or ()]
+    if len(items) > MAX_SHAPE_PARAMETERS:
+        counts = collections.Counter(type_name for _, type_name in items)
+        return ', '.join('{} x {}'.format(count, type_name)
+                         for type_name, count in counts.most_common())
+    return ', '.join(type_name if name is None else '{}: {}'.format(name, type_name)
+                     for name, type_name in items)
+
+
+class QueryLog:
+    """Times every statement of the engines it instruments.
+
+    Statements that take at least slow_seconds are logged with the shape
+    of their parameters. On PostgreSQL, an explain_rate share of the slow
+    SELECT statements is run again under EXPLAIN (ANALYZE, BUFFERS) and
+    the plan is logged and kept with the stats of the statement.
+    """
+
+    def __init__(self, slow_seconds=0.1, explain_rate=0, logger=logging):
+        self.slow_seconds = slow_seconds
+        self.explain_rate = explain_rate
+        self.logger = logger
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def instrument(self, engine, db_name):
+        """Time the statements of engine, recorded under db_name."""
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _before_execute(conn, _cursor, _statement, _parameters, _context, _executemany):
+            conn.info.setdefault('querylog_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _after_execute(conn, _cursor, statement, parameters, _context, executemany):
+            elapsed = time.perf_counter() - conn.info['querylog_start'].pop()
+            self._record(conn, db_name, statement, parameters, executemany, elapsed)
+
+        @event.listens_for(engine, 'handle_error')
+        def _on_error(context):
+            starts = (context.connection.info.get('querylog_start')
+                      if context.connection else None)
+            if starts:
+                starts.pop()
+
+    def stats(self):
+        """Return the stats of every statement, the most time consuming first."""
+        with self._lock:
+            stats = [dict(stat, statement=statement, db=db_name)
+                     for (db_name, statement), stat in self._stats.items()]
+        for stat in stats:
+            stat['mean_ms'] = round(stat['total_ms'] / stat['calls'], 3)
+            stat['total_ms'] = round(stat['total_ms'], 3)
+            stat['max_ms'] = round(stat['max_ms'], 3)
+        return sorted(stats, key=lambda stat: stat['total_ms'], reverse=True)
+
+    def _record(self, conn, db_name, statement, parameters, executemany, elapsed):
+        """Add a statement that took elapsed seconds to the stats."""
+        key = (db_name, normalize(statement))
+        slow = elapsed >= self.slow_seconds
+        plan = None
+        if slow:
+            if (self.explain_rate and random.random() < self.explain_rate
+                    and not executemany and conn.dialect.name == 'postgresql'
+                    and statement.lstrip()[:6].upper() == 'SELECT'):
+                plan = self._explain(conn, statement, parameters)
+            self.logger.warning('Slow query: %s', json.dumps({
+                'db': db_name,
+                'duration_ms': round(1000 * elapsed, 1),
+                'statement': key[1],
+                'parameters': parameter_shape(parameters, executemany),
+                'plan': plan}))
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                if len(self._stats) >= MAX_STATEMENTS:
+                    return
+                stat = self._stats[key] = {'calls': 0, 'slow_calls': 0, 'total_ms': 0.0,
+                                           'max_ms': 0.0, 'plan': None}
+            stat['calls'] += 1
+            stat['slow_calls'] += slow
+            stat['total_ms'] += 1000 * elapsed
+            stat['max_ms'] = max(stat['max_ms'], 1000 * elapsed)
+            if plan is not None:
+                stat['plan'] = plan
+
+    def _explain(self, conn, statement, parameters):
+        """Return the plan of a SELECT statement, run on the same connection
+        in a savepoint so that a failure does not abort its transaction."""
+        dbapi = conn.dialect.dbapi
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute('SAVEPOINT querylog_explain')
+        except dbapi.Error as err:
+            # not in a transaction, e.g. in autocommit mode
+            cursor.close()
+            self.logger.warning('Could not explain query: %s', str(err))
+            return None
+        try:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute('RELEASE SAVEPOINT querylog_explain')
+            return plan
+        except dbapi.Error as err:
+            cursor.execute('ROLLBACK TO SAVEPOINT querylog_explain')
+            self.logger.warning('Could not explain query: %s', str(err))
+            return None
+        finally:
+            cursor.close()
@@ -89,3 +89,49 @@ class TestDb(unittest.TestCase):
         self.assertEqual('5', self.db.generate_accountid())
         # mock_rand was called twice, first generating 4, then 5
         self.assertEqual(2, mock_rand.call_count)
+
+    def test_add_users_adds_all_users(self):
+        """test adding several users at once"""
+        users = []
+        for i in range(3):
+            user = EXAMPLE_USER.copy()
+            user['username'] = 'bulk{}'.format(i)
+            user['accountid'] = str(10 + i)
+            users.append(user)
+        self.db.add_users(users)
+        for user in users:
+            self.assertEqual(user, self.db.get_user(user['username']))
+
+    def test_add_users_adds_no_user_if_one_fails(self):
+        """test that a bulk add is a single transaction"""
+        user = EXAMPLE_USER.copy()
+        user['username'] = 'dup'
+        user['accountid'] = '20'
+        self.db.add_user(user)
+        new_user = EXAMPLE_USER.copy()
+        new_user['username'] = 'new'
+        new_user['accountid'] = '21'
+        # second user conflicts with the existing accountid
+        self.assertRaises(IntegrityError, self.db.add_users, [new_user, user])
+        self.assertIsNone(self.db.get_user('new'))
+
+    def test_get_existing_usernames_returns_only_existing(self):
+        """test looking up which usernames are taken"""
+        user = EXAMPLE_USER.copy()
+        user['username'] = 'taken'
+        user['accountid'] = '30'
+        self.db.add_user(user)
+        self.assertEqual({'taken'},
+                         self.db.get_existing_usernames(['taken', 'free']))
+
+    # mock random.randint to produce 4,5,6 on each invocation
+    @patch('random.randint', side_effect=[4, 5, 6])
+    def test_generate_account_ids_skips_existing_ids(self, mock_rand):
+        """test generating a batch of account ids"""
+        user = EXAMPLE_USER.copy()
+        user['username'] = 'quux'
+        user['accountid'] = '4'
+        self.db.add_user(user)
+        # 4 exists, so a second round generates 6
+        self.assertEqual({'5', '6'}, set(self.db.generate_accountids(2)))
+        self.assertEqual(3, mock_rand.call_count)
@@ -0,0 +1,136 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for fastjson module
+"""
+
+import datetime
+import json
+import unittest
+from unittest.mock import patch, mock_open
+
+from flask import Flask, jsonify, request
+
+from userservice import fastjson
+from userservice.userservice import create_app
+
+PAYLOAD = {'username': 'testuser', 'firstname': 'Zoë', 'accountid': '1011226111',
+           'created': 1.5, 'users': [{'n': None}], 'when': datetime.date(2022, 6, 1)}
+
+
+def create_json_app(provider):
+    """Create an app whose JSON is handled by provider"""
+    app = Flask(__name__)
+    if provider is not None:
+        fastjson.init_app(app, provider)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():  # pylint: disable=unused-variable
+        return jsonify(request.get_json())
+
+    return app
+
+
+class TestLoadProvider(unittest.TestCase):
+    """
+    Test cases for load_provider
+    """
+
+    def test_auto_prefers_orjson(self):
+        """test that orjson is used when it is installed"""
+        if fastjson.orjson is None:
+            self.skipTest('orjson is not installed')
+        self.assertEqual(fastjson.load_provider('auto').name, 'orjson')
+
+    def test_auto_falls_back_to_json(self):
+        """test that the standard library is used without orjson"""
+        with patch.object(fastjson, 'orjson', None):
+            self.assertEqual(fastjson.load_provider('auto').name, 'json')
+            with self.assertRaises(ValueError):
+                fastjson.load_provider('orjson')
+
+    def test_unknown_library_raises(self):
+        """test that an unknown library is an error"""
+        with self.assertRaises(ValueError):
+            fastjson.load_provider('ujson')
+
+    def test_create_app_with_unknown_library_raises(self):
+        """test that JSON_LIBRARY is validated when the app is created"""
+        environ = {'VERSION': '1', 'TOKEN_EXPIRY_SECONDS': '1', 'PRIV_KEY_PATH': '1',
+                   'PUB_KEY_PATH': '1', 'ENABLE_TRACING': 'false', 'JSON_LIBRARY': 'ujson'}
+        with patch('userservice.userservice.open', mock_open(read_data='foo')), \
+                patch('os.environ', environ), \
+                patch('userservice.userservice.UserDb'):
+            with self.assertRaises(ValueError):
+                create_app()
+
+
+class TestProviders(unittest.TestCase):
+    """
+    Test cases for JSONProvider and OrjsonProvider
+    """
+
+    def providers(self):
+        """Return every provider that can be loaded"""
+        libraries = ['json'] if fastjson.orjson is None else ['json', 'orjson']
+        return [fastjson.load_provider(library) for library in libraries]
+
+    def test_round_trip(self):
+        """test that parsing the serialized payload returns it"""
+        payload = dict(PAYLOAD, when='2022-06-01')
+        for provider in self.providers():
+            with self.subTest(provider=provider.name):
+                self.assertEqual(provider.loads(provider.dumps(payload)), payload)
+                self.assertEqual(provider.loads(provider.dumps(payload).encode('utf-8')),
+                                 payload)
+
+    def test_unsupported_values_fall_back(self):
+        """test that values orjson cannot serialize are serialized anyway"""
+        payload = {1: 2 ** 70}
+        for provider in self.providers():
+            with self.subTest(provider=provider.name):
+                self.assertEqual(json.loads(provider.dumps(payload)), {'1': 2 ** 70})
+
+    def test_invalid_json_raises_value_error(self):
+        """test that parse errors are ValueErrors, as with the standard library"""
+        for provider in self.providers():
+            with self.subTest(provider=provider.name):
+                with self.assertRaises(ValueError):
+                    provider.loads(b'{"username": ')
+
+
+class TestInitApp(unittest.TestCase):
+    """
+    Test cases for init_app
+    """
+
+    def test_same_json_as_flask(self):
+        """test that responses parse to the same JSON as with Flask's encoder"""
+        expected = create_json_app(None).test_client().post('/echo', json=PAYLOAD)
+        for library in fastjson.LIBRARIES:
+            with self.subTest(library=library):
+                client = create_json_app(fastjson.load_provider(library)).test_client()
+                response = client.post('/echo', json=PAYLOAD)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get_json(), expected.get_json())
+                # keys are still sorted
+                self.assertLess(response.data.index(b'accountid'),
+                                response.data.index(b'username'))
+
+    def test_invalid_body_400(self):
+        """test that an invalid request body is still a bad request"""
+        client = create_json_app(fastjson.load_provider('auto')).test_client()
+        response = client.post('/echo', data='{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,128 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for jsonlog module
+"""
+
+import io
+import json
+import logging
+import sys
+import threading
+import unittest
+
+from userservice import jsonlog
+
+
+class BlockingStream(io.StringIO):
+    """Stream whose writes wait until it is released"""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def write(self, s):
+        self.released.wait()
+        return super().write(s)
+
+
+def create_logger(stream, maxsize=100):
+    """Return a logger writing JSON through a queued handler, and the handler"""
+    handler = jsonlog.QueuedStreamHandler(stream, maxsize)
+    handler.setFormatter(jsonlog.JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S'))
+    logger = logging.Logger('test')
+    logger.addHandler(handler)
+    return logger, handler
+
+
+class TestJsonFormatter(unittest.TestCase):
+    """
+    Test cases for JsonFormatter
+    """
+
+    def test_quotes_escaped(self):
+        """test that messages with quotes and newlines stay valid JSON"""
+        record = logging.makeLogRecord({'msg': 'user "a\\b"\n%s', 'args': ('{}',),
+                                        'levelname': 'ERROR', 'funcName': 'login'})
+        entry = json.loads(jsonlog.JsonFormatter().format(record))
+        self.assertEqual(entry['message'], 'login | user "a\\b"\n{}')
+        self.assertEqual(entry['severity'], 'ERROR')
+        self.assertNotIn('exception', entry)
+
+    def test_exception_included(self):
+        """test that the traceback of an exception is a field of the entry"""
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.makeLogRecord({'msg': 'failed', 'exc_info': sys.exc_info()})
+        entry = json.loads(jsonlog.JsonFormatter().format(record))
+        self.assertIn('ValueError: boom', entry['exception'])
+
+
+class TestQueuedStreamHandler(unittest.TestCase):
+    """
+    Test cases for QueuedStreamHandler
+    """
+
+    def test_records_written_as_json_lines(self):
+        """test that records are written by the writer thread"""
+        stream = io.StringIO()
+        logger, handler = create_logger(stream)
+        logger.warning('user %s', {'username': 'a"b'})
+        handler.flush()
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry['message'], 'test_records_written_as_json_lines'
+                                           ' | user {\'username\': \'a"b\'}')
+        handler.close()
+
+    def test_arguments_rendered_when_logged(self):
+        """test that arguments changed after the call are logged as they were"""
+        stream = io.StringIO()
+        logger, handler = create_logger(stream)
+        request = {'username': 'before'}
+        logger.warning('request %s', request)
+        request['username'] = 'after'
+        handler.flush()
+        self.assertIn('before', stream.getvalue())
+        handler.close()
+
+    def test_disabled_level_not_formatted(self):
+        """test that arguments of disabled levels are never rendered"""
+        logger, handler = create_logger(io.StringIO())
+        logger.setLevel(logging.INFO)
+
+        class Unrenderable:  # pylint: disable=too-few-public-methods
+            """fails the test if rendered"""
+
+            def __str__(self):
+                raise AssertionError('rendered')
+
+        logger.debug('request %s', Unrenderable())
+        handler.close()
+
+    def test_full_queue_drops_and_reports(self):
+        """test that records are dropped, not waited for, when the queue is full"""
+        stream = BlockingStream()
+        logger, handler = create_logger(stream, maxsize=1)
+        for i in range(5):
+            logger.warning('message %d', i)
+        self.assertGreaterEqual(handler.dropped, 3)
+        stream.released.set()
+        handler.flush()
+        lines = [json.loads(line)['message'] for line in stream.getvalue().splitlines()]
+        self.assertIn('emit | Dropped {} log messages, the log queue was full'.format(
+            handler.dropped), lines)
+        self.assertEqual(len(lines), 5 - handler.dropped + 1)
+        handler.close()
@@ -0,0 +1,201 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for querylog module
+"""
+
+import json
+import unittest
+from unittest.mock import MagicMock, call, patch, mock_open
+
+from sqlalchemy import create_engine, text
+
+from userservice import querylog
+from userservice.userservice import create_app
+
+
+class FakeDbapiError(Exception):
+    """Error raised by the fake DBAPI cursor"""
+
+
+def fake_postgres_connection(cursor):
+    """Return a connection to a fake PostgreSQL database using cursor"""
+    conn = MagicMock()
+    conn.dialect.name = 'postgresql'
+    conn.dialect.dbapi.Error = FakeDbapiError
+    conn.connection.cursor.return_value = cursor
+    return conn
+
+
+class TestNormalize(unittest.TestCase):
+    """
+    Test cases for normalize and parameter_shape
+    """
+
+    def test_in_list_collapsed(self):
+        """test that expanded IN lists of any length share one statement"""
+        self.assertEqual(
+            querylog.normalize('SELECT a FROM t WHERE a IN (%(a_1_1)s, %(a_1_2)s)'),
+            querylog.normalize('SELECT a FROM t WHERE a IN (?, ?, ?)'))
+
+    def test_multi_row_values_collapsed(self):
+        """test that multi-row VALUES are collapsed"""
+        self.assertEqual(
+            querylog.normalize('INSERT INTO t (a, b) VALUES (?, ?), (?, ?),\n (?, ?)'),
+            'INSERT INTO t (a, b) VALUES (...), ...')
+
+    def test_single_placeholder_kept(self):
+        """test that a single parameter is not collapsed"""
+        statement = 'SELECT a FROM t WHERE t.username = %(username_1)s'
+        self.assertEqual(querylog.normalize(statement), statement)
+
+    def test_shape_has_types_not_values(self):
+        """test that parameter shapes hold names and types only"""
+        self.assertEqual(querylog.parameter_shape({'username_1': 'secret', 'n': 1}),
+                         'username_1: str, n: int')
+        self.assertEqual(querylog.parameter_shape(('secret', None)), 'str, NoneType')
+
+    def test_shape_of_executemany(self):
+        """test that executemany parameters are summarized"""
+        self.assertEqual(querylog.parameter_shape([('a', 1), ('b', 2)], executemany=True),
+                         '2 x (str, int)')
+
+    def test_long_shape_counted_by_type(self):
+        """test that long parameter lists are counted by type"""
+        self.assertEqual(querylog.parameter_shape(['a'] * 100 + [1]), '100 x str, 1 x int')
+
+
+class TestQueryLog(unittest.TestCase):
+    """
+    Test cases for QueryLog
+    """
+
+    def setUp(self):
+        self.logger = MagicMock()
+        self.engine = create_engine('sqlite://')
+        with self.engine.connect() as conn:
+            conn.execute(text('CREATE TABLE t (a VARCHAR)'))
+
+    def test_statements_counted(self):
+        """test that calls of a statement are aggregated"""
+        query_log = querylog.QueryLog(logger=self.logger)
+        query_log.instrument(self.engine, 'test')
+        with self.engine.connect() as conn:
+            for values in (['x'], ['x', 'y']):
+                conn.execute(text('SELECT a FROM t WHERE a IN ({})'.format(
+                    ', '.join(':p{}'.format(i) for i in range(len(values))))),
+                             {'p{}'.format(i): value for i, value in enumerate(values)})
+        stats = query_log.stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['db'], 'test')
+        self.assertEqual(stats[0]['calls'], 2)
+        self.assertEqual(stats[0]['slow_calls'], 0)
+        self.assertGreaterEqual(stats[0]['max_ms'], stats[0]['mean_ms'])
+        self.logger.warning.assert_not_called()
+
+    def test_slow_statement_logged_without_values(self):
+        """test that a slow statement is logged with its parameter shape"""
+        query_log = querylog.QueryLog(slow_seconds=0, logger=self.logger)
+        query_log.instrument(self.engine, 'test')
+        with self.engine.connect() as conn:
+            conn.execute(text('SELECT a FROM t WHERE a = :a'), {'a': 'secret'})
+        message, payload = self.logger.warning.call_args[0]
+        self.assertEqual(message, 'Slow query: %s')
+        self.assertNotIn('secret', payload)
+        entry = json.loads(payload)
+        self.assertEqual(entry['statement'], 'SELECT a FROM t WHERE a = ?')
+        self.assertEqual(entry['parameters'], 'str')
+        self.assertIsNone(entry['plan'])
+        self.assertEqual(query_log.stats()[0]['slow_calls'], 1)
+
+    def test_explain_skipped_outside_postgres(self):
+        """test that slow statements are only explained on PostgreSQL"""
+        query_log = querylog.QueryLog(slow_seconds=0, explain_rate=1, logger=self.logger)
+        query_log.instrument(self.engine, 'test')
+        with patch.object(query_log, '_explain') as explain:
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT a FROM t'))
+        explain.assert_not_called()
+
+    def test_explain_in_savepoint(self):
+        """test that the plan is captured inside a savepoint"""
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [('Seq Scan on t',), ('Buffers: shared hit=1',)]
+        query_log = querylog.QueryLog(slow_seconds=0, explain_rate=1, logger=self.logger)
+        query_log._record(fake_postgres_connection(cursor), 'test',
+                          'SELECT a FROM t WHERE a = %(a)s', {'a': 'x'}, False, 0.5)
+        self.assertEqual(cursor.execute.call_args_list, [
+            call('SAVEPOINT querylog_explain'),
+            call('EXPLAIN (ANALYZE, BUFFERS) SELECT a FROM t WHERE a = %(a)s', {'a': 'x'}),
+            call('RELEASE SAVEPOINT querylog_explain')])
+        self.assertEqual(query_log.stats()[0]['plan'], 'Seq Scan on t\nBuffers: shared hit=1')
+        cursor.close.assert_called_once_with()
+
+    def test_failed_explain_rolled_back(self):
+        """test that a failed EXPLAIN is rolled back to the savepoint"""
+        cursor = MagicMock()
+        cursor.execute.side_effect = [None, FakeDbapiError('canceled'), None]
+        query_log = querylog.QueryLog(slow_seconds=0, explain_rate=1, logger=self.logger)
+        query_log._record(fake_postgres_connection(cursor), 'test',
+                          'SELECT a FROM t', {}, False, 0.5)
+        self.assertEqual(cursor.execute.call_args_list[-1],
+                         call('ROLLBACK TO SAVEPOINT querylog_explain'))
+        self.assertIsNone(query_log.stats()[0]['plan'])
+
+    def test_writes_not_explained(self):
+        """test that EXPLAIN ANALYZE never runs statements that write"""
+        cursor = MagicMock()
+        query_log = querylog.QueryLog(slow_seconds=0, explain_rate=1, logger=self.logger)
+        query_log._record(fake_postgres_connection(cursor), 'test',
+                          'INSERT INTO t (a) VALUES (%(a)s)', {'a': 'x'}, False, 0.5)
+        cursor.execute.assert_not_called()
+
+
+class TestQueryStatsEndpoint(unittest.TestCase):
+    """
+    Test cases for /admin/queries
+    """
+
+    def create_test_app(self, admin_token):
+        """Create the app with mocked files and database"""
+        environ = {'VERSION': '1', 'TOKEN_EXPIRY_SECONDS': '1', 'PRIV_KEY_PATH': '1',
+                   'PUB_KEY_PATH': '1', 'ENABLE_TRACING': 'false', 'ADMIN_TOKEN': admin_token}
+        with patch('userservice.userservice.open', mock_open(read_data='foo')), \
+                patch('os.environ', environ), \
+                patch('userservice.userservice.UserDb') as mock_db:
+            test_app = create_app().test_client()
+        query_log = mock_db.call_args[0][2]
+        query_log.instrument(create_engine('sqlite://'), 'users')
+        return test_app, query_log
+
+    def test_disabled_without_admin_token_404(self):
+        """test that /admin/queries is only served with an admin token"""
+        test_app, _ = self.create_test_app('')
+        self.assertEqual(test_app.get('/admin/queries').status_code, 404)
+
+    def test_invalid_admin_token_401(self):
+        """test that /admin/queries rejects a wrong token"""
+        test_app, _ = self.create_test_app('admin')
+        response = test_app.get('/admin/queries', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_stats_served(self):
+        """test that /admin/queries serves the stats of the query log"""
+        test_app, query_log = self.create_test_app('admin')
+        with patch.object(query_log, 'stats', return_value=[{'calls': 1}]):
+            response = test_app.get('/admin/queries',
+                                    headers={'Authorization': 'Bearer admin'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [{'calls': 1}])
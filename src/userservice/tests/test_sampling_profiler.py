@@ -0,0 +1,164 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for sampling_profiler module
+"""
+
+import atexit
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, mock_open
+
+from userservice.userservice import create_app, sampling_profiler
+
+SECRET = 'profiling-secret'
+
+
+def create_test_app(environ):
+    """Create the app with mocked files and database"""
+    environ = dict(environ, VERSION='1', TOKEN_EXPIRY_SECONDS='1', PRIV_KEY_PATH='1',
+                   PUB_KEY_PATH='1', ENABLE_TRACING='false')
+    with patch('userservice.userservice.open', mock_open(read_data='foo')), \
+            patch('os.environ', environ), \
+            patch('userservice.userservice.UserDb'):
+        return create_app().test_client()
+
+
+def busy(seconds):
+    """Keep the CPU busy for seconds"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestSignature(unittest.TestCase):
+    """
+    Test cases for the X-Profile header signature
+    """
+
+    def test_signed_header_valid(self):
+        """test that a header signed with the secret is accepted"""
+        self.assertTrue(sampling_profiler.verify(SECRET, sampling_profiler.sign(SECRET, time.time() + 60)))
+
+    def test_expired_header_invalid(self):
+        """test that an expired header is rejected"""
+        self.assertFalse(sampling_profiler.verify(SECRET, sampling_profiler.sign(SECRET, time.time() - 1)))
+
+    def test_header_signed_with_other_secret_invalid(self):
+        """test that a header signed with another secret is rejected"""
+        self.assertFalse(sampling_profiler.verify(SECRET, sampling_profiler.sign('other', time.time() + 60)))
+
+    def test_malformed_header_invalid(self):
+        """test that a header without a signature is rejected"""
+        self.assertFalse(sampling_profiler.verify(SECRET, '9999999999'))
+        self.assertFalse(sampling_profiler.verify(SECRET, 'soon:abc'))
+
+    def test_no_secret_invalid(self):
+        """test that no header is accepted without a secret"""
+        self.assertFalse(sampling_profiler.verify('', sampling_profiler.sign('', time.time() + 60)))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    """
+    Test cases for SamplingProfiler
+    """
+
+    def test_collapse_outermost_first(self):
+        """test that a frame is collapsed from the outermost caller"""
+        stack = sampling_profiler.collapse(sys._getframe())  # pylint: disable=protected-access
+        self.assertTrue(stack.endswith(
+            ';test_collapse_outermost_first (tests/test_sampling_profiler.py:{})'.format(
+                self.test_collapse_outermost_first.__code__.co_firstlineno)))
+
+    def test_samples_aggregated_by_route(self):
+        """test that samples of a profiled thread are counted under its route"""
+        profiler = sampling_profiler.SamplingProfiler(interval=0.001)
+        profiler.start('GET /login')
+        busy(0.05)
+        profiler.stop()
+        lines = profiler.collapsed().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('GET /login;'))
+            self.assertGreater(int(count), 0)
+        self.assertIn('busy (tests/test_sampling_profiler.py:', profiler.collapsed())
+        self.assertEqual(profiler.collapsed('GET /ready'), '')
+
+    def test_dump_writes_collapsed_stacks(self):
+        """test that dump writes the samples of this process to the directory"""
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = sampling_profiler.SamplingProfiler(interval=0.001, directory=directory)
+            profiler.start('GET /ready')
+            busy(0.02)
+            profiler.stop()
+            profiler.dump()
+            path = os.path.join(directory, 'profile.{}.collapsed'.format(os.getpid()))
+            with open(path) as file:
+                self.assertEqual(file.read(), profiler.collapsed())
+        atexit.unregister(profiler.dump)
+
+
+class TestProfilingApp(unittest.TestCase):
+    """
+    Test cases for the profiling hooks of the app
+    """
+
+    def test_debug_profile_disabled_by_default_404(self):
+        """test that /debug/profile is only served with a secret"""
+        response = create_test_app({}).get('/debug/profile')
+        self.assertEqual(response.status_code, 404)
+
+    def test_debug_profile_requires_secret_401(self):
+        """test that /debug/profile rejects a wrong token"""
+        response = create_test_app({'PROFILE_SECRET': SECRET}).get(
+            '/debug/profile', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_signed_request_profiled(self):
+        """test that only the request with a signed header is profiled"""
+        test_app = create_test_app({'PROFILE_SECRET': SECRET})
+        with patch.object(sampling_profiler.SamplingProfiler, 'start') as start, \
+                patch.object(sampling_profiler.SamplingProfiler, 'stop') as stop:
+            test_app.get('/ready')
+            test_app.get('/ready', headers={
+                'X-Profile': sampling_profiler.sign(SECRET, time.time() + 60)})
+            test_app.get('/ready', headers={
+                'X-Profile': sampling_profiler.sign('other', time.time() + 60)})
+        start.assert_called_once_with('GET /ready')
+        stop.assert_called_once_with()
+
+    def test_sample_rate_profiles_all_requests(self):
+        """test that every request is profiled at a sample rate of 1"""
+        test_app = create_test_app({'PROFILE_SAMPLE_RATE': '1'})
+        with patch.object(sampling_profiler.SamplingProfiler, 'start') as start:
+            test_app.get('/ready')
+            test_app.get('/version')
+        self.assertEqual(start.call_count, 2)
+
+    def test_debug_profile_serves_collapsed_stacks(self):
+        """test that /debug/profile serves the samples of this worker"""
+        test_app = create_test_app({'PROFILE_SECRET': SECRET})
+        with patch.object(sampling_profiler.SamplingProfiler, 'collapsed',
+                          return_value='GET /ready;main (a.py:1) 3\n') as collapsed:
+            response = test_app.get('/debug/profile?route=GET /ready',
+                                    headers={'Authorization': 'Bearer ' + SECRET})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(as_text=True), 'GET /ready;main (a.py:1) 3\n')
+        self.assertEqual(response.headers['X-Profile-Pid'], str(os.getpid()))
+        collapsed.assert_called_once_with('GET /ready')
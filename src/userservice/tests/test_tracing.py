@@ -0,0 +1,206 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for tracing module
+"""
+
+import threading
+import unittest
+from unittest.mock import patch
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import Status, StatusCode, set_span_in_context
+from prometheus_client import REGISTRY
+
+# the app imports tracing as a top level module, use the same instance
+from userservice.userservice import tracing
+
+
+def create_tracer(ratio, max_traces=tracing.MAX_PENDING_TRACES, **kwargs):
+    """Return a tracer whose kept spans end up in the returned exporter"""
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(tracing.TailSamplingProcessor(
+        SimpleSpanProcessor(exporter), ratio, max_traces=max_traces, **kwargs))
+    return provider.get_tracer(__name__), exporter
+
+
+def span_count(outcome):
+    """Return the trace_spans_total sample of outcome"""
+    return REGISTRY.get_sample_value('trace_spans_total', {'outcome': outcome}) or 0
+
+
+class TestTailSamplingProcessor(unittest.TestCase):
+    """
+    Test cases for TailSamplingProcessor
+    """
+
+    def test_trace_held_back_until_root_ends(self):
+        """test that child spans are passed on together with their root"""
+        tracer, exporter = create_tracer(1)
+        with tracer.start_as_current_span('root'):
+            with tracer.start_as_current_span('child'):
+                pass
+            self.assertEqual(exporter.get_finished_spans(), ())
+        self.assertEqual([span.name for span in exporter.get_finished_spans()],
+                         ['child', 'root'])
+
+    def test_ratio_zero_drops_ok_trace(self):
+        """test that a fast trace without errors is not kept at ratio 0"""
+        tracer, exporter = create_tracer(0)
+        before = span_count('not_kept')
+        with tracer.start_as_current_span('root'):
+            with tracer.start_as_current_span('child'):
+                pass
+        self.assertEqual(exporter.get_finished_spans(), ())
+        self.assertEqual(span_count('not_kept'), before + 2)
+
+    def test_error_trace_kept(self):
+        """test that a trace with a failed span is kept at ratio 0"""
+        tracer, exporter = create_tracer(0)
+        with tracer.start_as_current_span('root'):
+            with tracer.start_as_current_span('child') as child:
+                child.set_status(Status(StatusCode.ERROR))
+        self.assertEqual(len(exporter.get_finished_spans()), 2)
+
+    def test_error_trace_dropped_when_keep_errors_false(self):
+        """test that errors are not kept when keep_errors is false"""
+        tracer, exporter = create_tracer(0, keep_errors=False)
+        with tracer.start_as_current_span('root') as root:
+            root.set_status(Status(StatusCode.ERROR))
+        self.assertEqual(exporter.get_finished_spans(), ())
+
+    def test_slow_trace_kept(self):
+        """test that a root span of at least slow_seconds is kept"""
+        tracer, exporter = create_tracer(0, slow_seconds=0.5)
+        tracer.start_span('fast', start_time=0).end(end_time=499 * 10**6)
+        tracer.start_span('slow', start_time=0).end(end_time=500 * 10**6)
+        self.assertEqual([span.name for span in exporter.get_finished_spans()],
+                         ['slow'])
+
+    def test_span_after_root_follows_decision(self):
+        """test that a span ending after its root is kept with its trace"""
+        tracer, exporter = create_tracer(0)
+        root = tracer.start_span('root')
+        late = tracer.start_span('late', context=set_span_in_context(root))
+        root.set_status(Status(StatusCode.ERROR))
+        root.end()
+        late.end()
+        self.assertIn('late', [span.name for span in exporter.get_finished_spans()])
+
+    def test_oldest_pending_trace_evicted(self):
+        """test that traces whose root does not end are evicted"""
+        tracer, exporter = create_tracer(1, max_traces=1)
+        before = span_count('evicted')
+        for _ in range(2):
+            root = tracer.start_span('root')
+            tracer.start_span('child', context=set_span_in_context(root)).end()
+        self.assertEqual(span_count('evicted'), before + 1)
+        self.assertEqual(exporter.get_finished_spans(), ())
+
+
+class TestInitTracerProvider(unittest.TestCase):
+    """
+    Test cases for init_tracer_provider
+    """
+
+    def test_invalid_ratio_raises(self):
+        """test that a ratio outside of [0, 1] is rejected"""
+        with patch('os.environ', {'TRACE_SAMPLE_RATIO': '1.5'}):
+            with self.assertRaises(ValueError):
+                tracing.init_tracer_provider('test')
+
+    def test_unknown_exporter_raises(self):
+        """test that an unknown TRACE_EXPORTER is rejected"""
+        with patch('os.environ', {'TRACE_EXPORTER': 'jaeger'}):
+            with self.assertRaises(ValueError):
+                tracing.init_tracer_provider('test')
+
+    def test_ratio_samples_at_the_head_by_default(self):
+        """test that traces left out by the ratio are not recorded"""
+        with patch('os.environ', {'TRACE_SAMPLE_RATIO': '0.5', 'TRACE_EXPORTER': 'none'}):
+            provider = tracing.init_tracer_provider('test')
+        self.assertIn('TraceIdRatioBased', provider.sampler.get_description())
+        provider.shutdown()
+
+    def test_keep_errors_records_every_trace(self):
+        """test that keeping errors records every trace"""
+        with patch('os.environ', {'TRACE_SAMPLE_RATIO': '0.5', 'TRACE_EXPORTER': 'none',
+                                  'TRACE_KEEP_ERRORS': 'true'}):
+            provider = tracing.init_tracer_provider('test')
+        self.assertIn('AlwaysOnSampler', provider.sampler.get_description())
+        provider.shutdown()
+
+
+class TestCountingSpanExporter(unittest.TestCase):
+    """
+    Test cases for CountingSpanExporter
+    """
+
+    def test_outcomes_counted(self):
+        """test that exported and failed spans are counted apart"""
+        exporter = InMemorySpanExporter()
+        counting = tracing.CountingSpanExporter(exporter)
+        before = span_count('exported'), span_count('export_failed')
+        tracer, _ = create_tracer(1)
+        span = tracer.start_span('span')
+        span.end()
+        self.assertEqual(counting.export([span, span]), SpanExportResult.SUCCESS)
+        exporter.shutdown()
+        self.assertEqual(counting.export([span]), SpanExportResult.FAILURE)
+        self.assertEqual((span_count('exported'), span_count('export_failed')),
+                         (before[0] + 2, before[1] + 1))
+
+
+class BlockingSpanExporter(InMemorySpanExporter):
+    """An exporter whose exports wait until release is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.exporting = threading.Event()
+        self.release = threading.Event()
+
+    def export(self, spans):
+        self.exporting.set()
+        self.release.wait(5)
+        return super().export(spans)
+
+
+class TestCountingBatchSpanProcessor(unittest.TestCase):
+    """
+    Test cases for CountingBatchSpanProcessor
+    """
+
+    def test_full_queue_drops_counted(self):
+        """test that spans dropped from a full queue are counted"""
+        exporter = BlockingSpanExporter()
+        processor = tracing.CountingBatchSpanProcessor(
+            exporter, max_queue_size=2, max_export_batch_size=1)
+        provider = TracerProvider()
+        provider.add_span_processor(processor)
+        tracer = provider.get_tracer(__name__)
+        before = span_count('queue_full')
+        tracer.start_span('first').end()
+        # the first span has left the queue for the exporter
+        self.assertTrue(exporter.exporting.wait(5))
+        for name in ('second', 'third', 'fourth'):
+            tracer.start_span(name).end()
+        self.assertEqual(span_count('queue_full'), before + 1)
+        exporter.release.set()
+        processor.shutdown()
+        self.assertEqual([span.name for span in exporter.get_finished_spans()],
+                         ['first', 'third', 'fourth'])
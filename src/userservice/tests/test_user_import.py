@@ -0,0 +1,113 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for user_import module
+"""
+
+import io
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from userservice.user_import import import_users, parse_records
+from userservice.tests.constants import EXAMPLE_USER_REQUEST
+
+
+def create_record(**kwargs):
+    """Helper method for creating import records from template"""
+    record = EXAMPLE_USER_REQUEST.copy()
+    record.pop('password-repeat')
+    record.update(kwargs)
+    return record
+
+
+# skip the cost of bcrypt in tests
+@patch('bcrypt.gensalt', return_value=b'salt')
+@patch('bcrypt.hashpw', return_value=b'hash')
+class TestUserImport(unittest.TestCase):
+    """
+    Test cases for user_import module
+    """
+
+    def setUp(self):
+        """Mock the user database"""
+        self.db = MagicMock()
+        self.db.get_existing_usernames.return_value = set()
+        self.db.generate_accountids.side_effect = lambda n: [
+            str(i) for i in range(n)]
+
+    def test_import_users_creates_all_valid_users(self, *_):
+        """test importing valid records in a single load"""
+        records = [create_record(username='foo'), create_record(username='bar')]
+        results = import_users(self.db, records, workers=2)
+        self.assertEqual(['created', 'created'], [r['status'] for r in results])
+        # all users are added with one call
+        self.assertEqual(1, self.db.add_users.call_count)
+        users = self.db.add_users.call_args[0][0]
+        self.assertEqual(['foo', 'bar'], [u['username'] for u in users])
+        self.assertEqual(b'hash', users[0]['passhash'])
+
+    def test_import_users_reports_invalid_rows(self, *_):
+        """test that invalid records fail without blocking valid ones"""
+        records = [create_record(username='a'),
+                   'not a record',
+                   create_record(username='ok'),
+                   create_record(username='ok')]
+        results = import_users(self.db, records, workers=2)
+        self.assertEqual(['failed', 'failed', 'created', 'failed'],
+                         [r['status'] for r in results])
+        self.assertEqual('invalid record', results[1]['message'])
+        self.assertEqual('duplicate username ok', results[3]['message'])
+
+    def test_import_users_reports_non_string_values(self, *_):
+        """test that records with values of other JSON types fail alone"""
+        records = [create_record(username='foo', zip=0),
+                   create_record(username=123),
+                   create_record(username='bar', firstname=None),
+                   create_record(username='baz', ssn=['123']),
+                   create_record(username='ok')]
+        results = import_users(self.db, records, workers=2)
+        self.assertEqual(['failed', 'failed', 'failed', 'failed', 'created'],
+                         [r['status'] for r in results])
+        for result in results[:4]:
+            self.assertEqual('invalid value for input field(s)', result['message'])
+        users = self.db.add_users.call_args[0][0]
+        self.assertEqual(['ok'], [u['username'] for u in users])
+
+    def test_import_users_skips_existing_users(self, *_):
+        """test that records for existing usernames fail"""
+        self.db.get_existing_usernames.return_value = {'foo'}
+        results = import_users(
+            self.db, [create_record(username='foo'), create_record(username='bar')])
+        self.assertEqual('user foo already exists', results[0]['message'])
+        self.assertEqual('created', results[1]['status'])
+
+    def test_import_users_fails_all_rows_on_db_error(self, *_):
+        """test that a failed load fails every pending record"""
+        self.db.add_users.side_effect = SQLAlchemyError()
+        results = import_users(
+            self.db, [create_record(username='foo'), create_record(username='bar')])
+        self.assertEqual(['failed', 'failed'], [r['status'] for r in results])
+
+    def test_parse_records_ndjson_and_csv(self, *_):
+        """test parsing both supported formats"""
+        ndjson = io.StringIO(json.dumps({'username': 'foo'}) + '\n\n{bad\n')
+        self.assertEqual([{'username': 'foo'}, '{bad'],
+                         list(parse_records(ndjson)))
+        csv_stream = io.StringIO('username,zip\nfoo,94043\n')
+        self.assertEqual([{'username': 'foo', 'zip': '94043'}],
+                         list(parse_records(csv_stream, 'csv')))
@@ -17,6 +17,7 @@
 Tests for userservice
 """
 
+import json
 import random
 import unittest
 from unittest.mock import patch, mock_open
@@ -269,3 +270,39 @@ class TestUserservice(unittest.TestCase):
                     'username must contain 2-15 alphanumeric characters or underscores'.encode(),
                     'username {} returned unexpected error message'.format(invalid_username)
                 )
+
+    def test_import_users_404_status_code_without_admin_token(self):
+        """test that bulk import is disabled unless an admin token is set"""
+        response = self.test_app.post('/admin/users/import', data='')
+        self.assertEqual(response.status_code, 404)
+
+    def test_import_users_401_status_code_invalid_admin_token(self):
+        """test bulk import with the wrong admin token"""
+        self.flask_app.config['ADMIN_TOKEN'] = 'secret'
+        response = self.test_app.post('/admin/users/import', data='',
+                                      headers={'Authorization': 'Bearer foo'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_import_users_413_status_code_too_many_records(self):
+        """test that bulk imports over the row limit are refused"""
+        self.flask_app.config['ADMIN_TOKEN'] = 'secret'
+        self.flask_app.config['IMPORT_MAX_ROWS'] = 2
+        body = '{}\n'.format(json.dumps(EXAMPLE_USER_REQUEST)) * 3
+        response = self.test_app.post('/admin/users/import', data=body,
+                                      headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 413)
+        self.mocked_db.return_value.add_users.assert_not_called()
+
+    @patch('bcrypt.hashpw', return_value=b'hash')
+    def test_import_users_200_status_code_reports_results(self, _mock_hashpw):
+        """test bulk import of newline-delimited JSON records"""
+        self.flask_app.config['ADMIN_TOKEN'] = 'secret'
+        self.mocked_db.return_value.get_existing_usernames.return_value = set()
+        self.mocked_db.return_value.generate_accountids.return_value = ['123']
+        body = '{}\n{}\n'.format(json.dumps(EXAMPLE_USER_REQUEST), json.dumps({}))
+        response = self.test_app.post('/admin/users/import', data=body,
+                                      headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(1, response.json['created'])
+        self.assertEqual(1, response.json['failed'])
+        self.mocked_db.return_value.add_users.assert_called_once()
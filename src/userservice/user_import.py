@@ -0,0 +1,158 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+user_import creates user accounts in bulk
+
+Usage: python user_import.py [--csv] [FILE]
+
+Reads newline-delimited JSON (or CSV with --csv) user records from FILE or
+stdin, creates them in the database at $ACCOUNTS_DB_URI and writes one JSON
+result line per record to stdout.
+"""
+
+import csv
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import UserDb
+from metrics import BCRYPT_SECONDS
+from validation import sanitize, validate_new_user
+
+
+def parse_records(stream, fmt='ndjson'):
+    """Lazily parse user records from a text stream.
+
+    Params: stream - an iterable of text lines
+            fmt - 'csv' for CSV with a header row, or 'ndjson' for one
+                  JSON object per line
+    Return: an iterator of records. Lines that are not valid JSON are
+            returned as-is, to be reported as invalid by import_users.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+def hash_password(password):
+    """Create a salted bcrypt hash of password."""
+    with BCRYPT_SECONDS.labels('hashpw').time():
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+
+
+def import_users(users_db, records, workers=None, logger=logging):
+    """Validate, hash and load many user records in a single transaction.
+
+    Passwords are hashed in parallel; bcrypt releases the GIL while
+    hashing, so a thread pool spreads the work across cores.
+
+    Params: users_db - a UserDb instance
+            records - an iterable of user records with the same fields as
+                      a create user request. 'password-repeat' is optional.
+            workers - the number of hashing threads, defaults to the CPU count
+    Return: a list of per-record results in input order, of the form
+            {'row': row, 'username': username, 'status': status, 'message': msg}
+    """
+    results = []
+    pending = []
+    seen = set()
+    for row, record in enumerate(records):
+        result = {'row': row,
+                  'username': record.get('username') if isinstance(record, dict) else None}
+        results.append(result)
+        try:
+            if not isinstance(record, dict):
+                raise UserWarning('invalid record')
+            req = sanitize(record)
+            req.setdefault('password-repeat', req.get('password'))
+            validate_new_user(req)
+            if req['username'] in seen:
+                raise NameError('duplicate username {}'.format(req['username']))
+            seen.add(req['username'])
+            pending.append((result, req))
+        except (UserWarning, NameError) as err:
+            result.update(status='failed', message=str(err))
+
+    try:
+        existing = users_db.get_existing_usernames(seen)
+        for result, req in pending:
+            if req['username'] in existing:
+                result.update(status='failed',
+                              message='user {} already exists'.format(req['username']))
+        pending = [(result, req) for result, req in pending
+                   if req['username'] not in existing]
+
+        logger.debug('Hashing %d passwords.', len(pending))
+        with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+            passhashes = list(executor.map(
+                hash_password, [req['password'] for _, req in pending]))
+        accountids = users_db.generate_accountids(len(pending))
+
+        users = []
+        for (_, req), passhash, accountid in zip(pending, passhashes, accountids):
+            users.append({
+                'accountid': accountid,
+                'username': req['username'],
+                'passhash': passhash,
+                'firstname': req['firstname'],
+                'lastname': req['lastname'],
+                'birthday': req['birthday'],
+                'timezone': req['timezone'],
+                'address': req['address'],
+                'state': req['state'],
+                'zip': req['zip'],
+                'ssn': req['ssn'],
+            })
+        users_db.add_users(users)
+    except SQLAlchemyError as err:
+        logger.error('Error importing users: %s', str(err))
+        for result, _ in pending:
+            result.update(status='failed', message='failed to create user')
+        return results
+
+    for result, _ in pending:
+        result['status'] = 'created'
+    logger.info('Imported %d of %d users.', len(pending), len(results))
+    return results
+
+
+def main(argv):
+    """Import users from the file named in argv, or stdin."""
+    fmt = 'csv' if '--csv' in argv else 'ndjson'
+    paths = [arg for arg in argv if arg != '--csv']
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+    users_db = UserDb(os.environ['ACCOUNTS_DB_URI'])
+    with (open(paths[0], newline='') if paths else sys.stdin) as stream:
+        results = import_users(users_db, parse_records(stream, fmt))
+    for result in results:
+        sys.stdout.write(json.dumps(result) + '\n')
+    return 0 if all(r['status'] == 'created' for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -18,34 +18,30 @@ Userservice manages user account creation, user login, and related tasks
 
 import atexit
 from datetime import datetime, timedelta
+import hmac
+import io
+import itertools
 import logging
 import os
 import sys
-import re
 
 import bcrypt
 import jwt
 from flask import Flask, jsonify, request
 import bleach
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
-from db import UserDb
-
-
 from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.baggage.propagation import W3CBaggagePropagator
-from opentelemetry.propagators.composite import CompositePropagator
-from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
-from opentelemetry.propagators.b3 import B3MultiFormat
-
-
-from opentelemetry.propagate import set_global_textmap
-
-from opentelemetry.sdk.resources import SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 
+from db import UserDb
+import fastjson
+import metrics
+import sampling_profiler
+from querylog import QueryLog
+import tracing
+from user_import import import_users, parse_records
+from validation import validate_new_user
+
 
 def create_app():
     """Flask application factory to create instances
@@ -105,7 +101,8 @@ def create_app():
             app.logger.debug("Creating password hash.")
             password = req['password']
             salt = bcrypt.gensalt()
-            passhash = bcrypt.hashpw(password.encode('utf-8'), salt)
+            with metrics.BCRYPT_SECONDS.labels('hashpw').time():
+                passhash = bcrypt.hashpw(password.encode('utf-8'), salt)
 
             accountid = users_db.generate_accountid()
 
@@ -141,33 +138,63 @@ def create_app():
         return jsonify({}), 201
 
     def __validate_new_user(req):
-        app.logger.debug('validating create user request: %s', str(req))
-        # Check if required fields are filled
-        fields = (
-            'username',
-            'password',
-            'password-repeat',
-            'firstname',
-            'lastname',
-            'birthday',
-            'timezone',
-            'address',
-            'state',
-            'zip',
-            'ssn',
-        )
-        if any(f not in req for f in fields):
-            raise UserWarning('missing required field(s)')
-        if any(not bool(req[f] or req[f].strip()) for f in fields):
-            raise UserWarning('missing value for input field(s)')
-
-        # Verify username contains only 2-15 alphanumeric or underscore characters
-        if not re.match(r"\A[a-zA-Z0-9_]{2,15}\Z", req['username']):
-            raise UserWarning(
-                'username must contain 2-15 alphanumeric characters or underscores')
-        # Check if passwords match
-        if not req['password'] == req['password-repeat']:
-            raise UserWarning('passwords do not match')
+        app.logger.debug('validating create user request: %s', req)
+        validate_new_user(req)
+
+    @app.route('/admin/users/import', methods=['POST'])
+    def import_users_endpoint():
+        """Create user records in bulk.
+
+        Disabled unless ADMIN_TOKEN is set. Requires the header
+        'Authorization: Bearer <ADMIN_TOKEN>'.
+
+        Accepts newline-delimited JSON records with the same fields as
+        POST /users ('password-repeat' optional), or CSV with a header row
+        when sent as text/csv. All valid records are created in a single
+        transaction. Imports of more than IMPORT_MAX_ROWS records are
+        refused; they belong to the user_import.py command line tool.
+
+        Return: a summary with one result per record
+        """
+        if not app.config['ADMIN_TOKEN']:
+            return 'not found', 404
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header.split(' ')[-1].encode('utf-8'),
+                                   app.config['ADMIN_TOKEN'].encode('utf-8')):
+            app.logger.error('Error importing users: invalid admin token')
+            return 'authentication denied', 401
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        # hashing is slow, keep the request within the worker timeout
+        records = list(itertools.islice(parse_records(stream, fmt),
+                                        app.config['IMPORT_MAX_ROWS'] + 1))
+        if len(records) > app.config['IMPORT_MAX_ROWS']:
+            app.logger.error('Error importing users: more than %d records',
+                             app.config['IMPORT_MAX_ROWS'])
+            return ('import exceeds {} records, use user_import.py for larger imports'
+                    .format(app.config['IMPORT_MAX_ROWS'])), 413
+        results = import_users(users_db, records, logger=app.logger)
+        created = sum(1 for r in results if r['status'] == 'created')
+        return jsonify({'created': created,
+                        'failed': len(results) - created,
+                        'results': results}), 200
+
+    @app.route('/admin/queries', methods=['GET'])
+    def query_stats():
+        """Per-statement database stats of this worker, the most time
+        consuming statement first.
+
+        Disabled unless ADMIN_TOKEN is set. Requires the header
+        'Authorization: Bearer <ADMIN_TOKEN>'.
+        """
+        if not app.config['ADMIN_TOKEN']:
+            return 'not found', 404
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header.split(' ')[-1].encode('utf-8'),
+                                   app.config['ADMIN_TOKEN'].encode('utf-8')):
+            app.logger.error('Error getting query stats: invalid admin token')
+            return 'authentication denied', 401
+        return jsonify(query_log.stats()), 200
 
     @app.route('/login', methods=['GET'])
     def login():
@@ -194,7 +221,9 @@ def create_app():
 
             # Validate the password
             app.logger.debug('Validating the password.')
-            if not bcrypt.checkpw(password.encode('utf-8'), user['passhash']):
+            with metrics.BCRYPT_SECONDS.labels('checkpw').time():
+                password_ok = bcrypt.checkpw(password.encode('utf-8'), user['passhash'])
+            if not password_ok:
                 raise PermissionError('invalid login')
 
             full_name = '{} {}'.format(user['firstname'], user['lastname'])
@@ -236,21 +265,8 @@ def create_app():
     # Set up tracing and export spans to Cloud Trace.
     if os.environ['ENABLE_TRACING'] == "true":
         app.logger.info("✅ Tracing enabled.")
-        trace.set_tracer_provider(
-            TracerProvider(
-                resource=Resource.create(
-                    {SERVICE_NAME:
-                     f"{os.environ['POD_NAMESPACE']}-userservice"}
-                )
-            )
-        )
+        tracing.init_tracer_provider(f"{os.environ['POD_NAMESPACE']}-userservice")
         tracer = trace.get_tracer(__name__)
-        # create a JaegerExporter
-        trace.get_tracer_provider().add_span_processor(
-            BatchSpanProcessor(OTLPSpanExporter())
-        )
-        set_global_textmap(CompositePropagator(
-            [B3MultiFormat(), TraceContextTextMapPropagator(), W3CBaggagePropagator()]))
 
         FlaskInstrumentor().instrument_app(app)
     else:
@@ -261,13 +277,38 @@ def create_app():
     app.config['PRIVATE_KEY'] = open(
         os.environ.get('PRIV_KEY_PATH'), 'r').read()
     app.config['PUBLIC_KEY'] = open(os.environ.get('PUB_KEY_PATH'), 'r').read()
+    # admin endpoints are disabled unless an admin token is configured
+    app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN', '')
+    app.config['IMPORT_MAX_ROWS'] = int(os.environ.get('IMPORT_MAX_ROWS', '100'))
+
+    # Serialize and parse JSON with orjson when it is installed
+    fastjson.init_app(app, fastjson.load_provider(os.environ.get('JSON_LIBRARY', 'auto')))
 
     # Configure database connection
+    # Time every statement, log slow ones and keep stats for /admin/queries
+    query_log = QueryLog(
+        slow_seconds=float(os.environ.get('SLOW_QUERY_MS', '100')) / 1000,
+        explain_rate=float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0')),
+        logger=app.logger)
     try:
-        users_db = UserDb(os.environ.get("ACCOUNTS_DB_URI"), app.logger)
+        users_db = UserDb(os.environ.get("ACCOUNTS_DB_URI"), app.logger, query_log)
     except OperationalError:
         app.logger.critical("users_db database connection failed")
         sys.exit(1)
+
+    # Export Prometheus metrics at /metrics
+    if os.environ.get('ENABLE_METRICS') == 'true':
+        metrics.init_app(app)
+        metrics.instrument_engine(users_db.engine, 'users')
+
+    # Profile a share of the requests, and requests with a signed X-Profile header
+    profile_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    if profile_rate > 0 or os.environ.get('PROFILE_SECRET'):
+        sampling_profiler.init_app(
+            app, sample_rate=profile_rate,
+            secret=os.environ.get('PROFILE_SECRET', ''),
+            interval=float(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000,
+            directory=os.environ.get('PROFILE_DIR'))
     return app
 
 
@@ -0,0 +1,64 @@
+# Copyright 2022 CircleCI
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+validation checks new user records
+"""
+
+import re
+
+import bleach
+
+NEW_USER_FIELDS = (
+    'username',
+    'password',
+    'password-repeat',
+    'firstname',
+    'lastname',
+    'birthday',
+    'timezone',
+    'address',
+    'state',
+    'zip',
+    'ssn',
+)
+
+
+def sanitize(req):
+    """Return a copy of req with every string value sanitized by bleach."""
+    return {k: (bleach.clean(v) if isinstance(v, str) else v)
+            for k, v in req.items()}
+
+
+def validate_new_user(req):
+    """Check that a new user request has valid fields.
+
+    Raises: UserWarning if the request is invalid
+    """
+    # Check if required fields are filled
+    if any(f not in req for f in NEW_USER_FIELDS):
+        raise UserWarning('missing required field(s)')
+    # Imported records may hold any JSON value
+    if any(not isinstance(req[f], str) for f in NEW_USER_FIELDS):
+        raise UserWarning('invalid value for input field(s)')
+    if any(not bool(req[f] or req[f].strip()) for f in NEW_USER_FIELDS):
+        raise UserWarning('missing value for input field(s)')
+
+    # Verify username contains only 2-15 alphanumeric or underscore characters
+    if not re.match(r"\A[a-zA-Z0-9_]{2,15}\Z", req['username']):
+        raise UserWarning(
+            'username must contain 2-15 alphanumeric characters or underscores')
+    # Check if passwords match
+    if not req['password'] == req['password-repeat']:
+        raise UserWarning('passwords do not match')